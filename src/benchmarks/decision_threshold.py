@@ -0,0 +1,116 @@
+"""
+Benchmark the vectorized decision-threshold path against the previous row-wise
+`DataFrame.apply` implementation.
+
+The benchmark uses the largest test keys in datasets.zip and attaches synthetic
+positive-class probabilities and per-row decision thresholds to them, so it does not
+need predictions.zip.
+
+Usage:
+    python -m benchmarks.decision_threshold [--num-datasets 5] [--repeats 5]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import config.paths as paths
+from metrics import apply_decision_threshold
+from utils import get_archive_index, get_dataset_files
+
+
+def rowwise_decision_threshold(predictions: pd.DataFrame, target_classes) -> pd.Series:
+    """The previous implementation: a Python-level loop over the rows."""
+    return predictions.apply(
+        lambda row: (
+            target_classes[1]
+            if row[target_classes[1]] >= row["decision_threshold"]
+            else target_classes[0]
+        ),
+        axis=1,
+    )
+
+
+def get_largest_dataset_folds(num_datasets: int) -> list:
+    """Return the dataset folds with the largest (compressed) test keys in datasets.zip."""
+    _, members = get_archive_index(paths.ZIPPED_DATASETS_FILE)
+    test_keys = [
+        info for name, info in members.items() if name.endswith("_test_key.csv.gz")
+    ]
+    test_keys.sort(key=lambda info: info.file_size, reverse=True)
+    return [info.filename.split("/")[-2] for info in test_keys[:num_datasets]]
+
+
+def make_predictions(data_schema: dict, test_key: pd.DataFrame, seed: int = 0):
+    """Build a synthetic predictions frame with per-row decision thresholds."""
+    rng = np.random.default_rng(seed)
+    target_classes = [str(c) for c in data_schema["target"]["classes"]]
+    positive_proba = rng.random(len(test_key))
+    return pd.DataFrame(
+        {
+            data_schema["id"]["name"]: test_key[data_schema["id"]["name"]].values,
+            target_classes[0]: 1 - positive_proba,
+            target_classes[1]: positive_proba,
+            "decision_threshold": rng.uniform(0.2, 0.8, len(test_key)),
+        }
+    )
+
+
+def time_call(func, repeats: int) -> float:
+    """Best wall time of `repeats` calls, in milliseconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def run_benchmark(num_datasets: int = 5, repeats: int = 5) -> pd.DataFrame:
+    """
+    Time both implementations on the largest test keys and check that they agree.
+
+    Args:
+        num_datasets (int): Number of dataset folds (largest first) to benchmark.
+        repeats (int): Number of timed repetitions per implementation.
+
+    Returns:
+        pd.DataFrame: Timings and speedup per dataset fold.
+    """
+    results = []
+    for dataset_fold in get_largest_dataset_folds(num_datasets):
+        data_schema, test_key = get_dataset_files(dataset_fold)
+        target_classes = [str(c) for c in data_schema["target"]["classes"]]
+        predictions = make_predictions(data_schema, test_key)
+
+        rowwise = rowwise_decision_threshold(predictions, target_classes)
+        vectorized = apply_decision_threshold(predictions, target_classes)
+        if not np.array_equal(rowwise.astype(str).values, vectorized):
+            raise AssertionError(f"Implementations disagree on {dataset_fold}.")
+
+        rowwise_ms = time_call(
+            lambda: rowwise_decision_threshold(predictions, target_classes), repeats
+        )
+        vectorized_ms = time_call(
+            lambda: apply_decision_threshold(predictions, target_classes), repeats
+        )
+        results.append(
+            {
+                "Dataset_Fold": dataset_fold,
+                "Rows": len(predictions),
+                "Row-wise (ms)": round(rowwise_ms, 3),
+                "Vectorized (ms)": round(vectorized_ms, 3),
+                "Speedup": round(rowwise_ms / vectorized_ms, 1),
+            }
+        )
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--num-datasets", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    print(run_benchmark(args.num_datasets, args.repeats).to_string(index=False))
@@ -0,0 +1,391 @@
+"""
+Benchmark how the whole pipeline (f1-f5) scales with the size of the experiment grid.
+
+For every requested configuration, synthetic inputs (dataset schemas, test keys and
+predictions, in the layout of datasets.zip and predictions.zip) are generated with the
+given numbers of datasets, folds, models, scenarios and test key rows. The pipeline is
+then pointed at them and `calculate_metrics`, `summarize_metrics`,
+`generate_table_svgs`, `create_charts` and `run_statistical_tests` are timed
+separately (wall time, CPU time, peak RSS and bytes read). A stage that fails is
+recorded with its error and the remaining stages still run.
+
+Every configuration's results are appended as one JSON line (together with the git
+commit and package versions) to the results file, so runs of different versions of
+the code can be compared.
+
+Values given as lists are swept: every combination is benchmarked. The scenarios are
+the first N of `scenarios_mapping` (the charts and tables assume all 4), and at most 10
+folds are supported (the summary takes the fold from the last character of the name).
+
+Usage:
+    python -m benchmarks.pipeline_scale [--datasets 30] [--folds 5] [--models 15]
+        [--scenarios 4] [--rows 1000 10000] [--workers 1] [--output PATH]
+"""
+
+import argparse
+import datetime
+import gzip
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import zipfile
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import config.paths as paths
+import config.variables as variables
+from profiling import ResourceMonitor
+
+STAGES = [
+    "calculate_metrics",
+    "summarize_metrics",
+    "generate_table_svgs",
+    "create_charts",
+    "run_statistical_tests",
+]
+
+
+def get_synthetic_models(num_models: int) -> Dict[str, str]:
+    """
+    Model names and display names of the synthetic experiments: the real models first,
+    then numbered synthetic ones.
+    """
+    models = dict(itertools.islice(variables.models_mapping.items(), num_models))
+    for i in range(len(models), num_models):
+        models[f"rt_bin_class_synthetic_{i}"] = f"Synthetic {i}"
+    return models
+
+
+def get_synthetic_scenarios(num_scenarios: int) -> Dict[str, str]:
+    """Scenario names and display names of the synthetic experiments."""
+    if not 1 <= num_scenarios <= len(variables.scenarios_mapping):
+        raise ValueError(
+            f"Number of scenarios must be between 1 and "
+            f"{len(variables.scenarios_mapping)}."
+        )
+    return dict(itertools.islice(variables.scenarios_mapping.items(), num_scenarios))
+
+
+def get_synthetic_dataset_folds(num_datasets: int, num_folds: int) -> List[str]:
+    """Dataset fold names of the synthetic experiments."""
+    if not 1 <= num_folds <= 10:
+        raise ValueError("Number of folds must be between 1 and 10.")
+    return [
+        f"synthetic_{i}_fold_{fold}"
+        for i in range(num_datasets)
+        for fold in range(num_folds)
+    ]
+
+
+def make_schema(dataset_fold: str) -> dict:
+    """Schema of a synthetic dataset fold, with the fields the pipeline reads."""
+    return {
+        "title": dataset_fold,
+        "modelCategory": "binary_classification",
+        "schemaVersion": 1.0,
+        "inputDataFormat": "CSV",
+        "encoding": "utf-8",
+        "id": {"name": "id", "description": "unique identifier"},
+        "target": {"name": "target", "classes": ["0", "1"]},
+        "features": [],
+    }
+
+
+def make_test_key(rows: int, rng: np.random.Generator) -> pd.DataFrame:
+    """An imbalanced test key: sorted unique ids and 0/1 labels."""
+    ids = np.sort(rng.choice(rows * 4, size=rows, replace=False))
+    # positive class rate between 2% and 30%, at least one row of each class
+    target = (rng.random(rows) < rng.uniform(0.02, 0.3)).astype(np.int64)
+    target[:2] = [0, 1]
+    return pd.DataFrame({"id": ids, "target": target})
+
+
+def make_predictions(
+    test_key: pd.DataFrame, rng: np.random.Generator, with_threshold: bool
+) -> pd.DataFrame:
+    """
+    Predictions that are informative about the test key's labels, rounded to 3 decimals
+    like real model outputs (so there are tied scores).
+    """
+    separation = rng.uniform(0.5, 3.0)
+    logits = (2 * test_key["target"].to_numpy() - 1) * separation / 2
+    logits += rng.normal(-1.0, 1.0, len(test_key))
+    positive_proba = np.round(1 / (1 + np.exp(-logits)), 3)
+    predictions = pd.DataFrame(
+        {"id": test_key["id"].to_numpy(), "0": 1 - positive_proba, "1": positive_proba}
+    )
+    if with_threshold:
+        predictions["decision_threshold"] = round(rng.uniform(0.1, 0.9), 2)
+    return predictions
+
+
+def to_gzipped_csv(df: pd.DataFrame) -> bytes:
+    """The gzipped CSV bytes of a dataframe."""
+    return gzip.compress(
+        df.to_csv(index=False, float_format="%.6g").encode(), compresslevel=1
+    )
+
+
+def generate_synthetic_inputs(
+    data_dir: str,
+    dataset_folds: List[str],
+    scenarios: List[str],
+    models: List[str],
+    rows: int,
+    seed: int = 0,
+) -> None:
+    """
+    Write datasets.zip and predictions.zip with synthetic inputs to `data_dir`, in the
+    same layout as the real archives.
+
+    Args:
+        data_dir (str): The directory to write the archives to.
+        dataset_folds (List[str]): The dataset fold names.
+        scenarios (List[str]): The scenario names.
+        models (List[str]): The model names.
+        rows (int): Number of rows of every test key.
+        seed (int): Seed of the random generator.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    # the members are gzipped already, so they are stored without compression
+    with zipfile.ZipFile(
+        os.path.join(data_dir, "datasets.zip"), "w", zipfile.ZIP_STORED
+    ) as datasets_zip, zipfile.ZipFile(
+        os.path.join(data_dir, "predictions.zip"), "w", zipfile.ZIP_STORED
+    ) as predictions_zip:
+        for dataset_fold in dataset_folds:
+            test_key = make_test_key(rows, rng)
+            dataset_dir = f"datasets/{dataset_fold}/{dataset_fold}"
+            datasets_zip.writestr(
+                f"{dataset_dir}_schema.json", json.dumps(make_schema(dataset_fold))
+            )
+            datasets_zip.writestr(
+                f"{dataset_dir}_test_key.csv.gz", to_gzipped_csv(test_key)
+            )
+            for scenario, model in itertools.product(scenarios, models):
+                predictions = make_predictions(
+                    test_key, rng, with_threshold=scenario == "decision_threshold"
+                )
+                predictions_zip.writestr(
+                    f"predictions/{scenario}/{model}/{dataset_fold}/predictions.csv.gz",
+                    to_gzipped_csv(predictions),
+                )
+
+
+def use_synthetic_inputs(
+    data_dir: str,
+    results_dir: str,
+    dataset_folds: List[str],
+    scenarios: Dict[str, str],
+    models: Dict[str, str],
+) -> None:
+    """
+    Point the pipeline at the synthetic inputs and a separate results directory.
+
+    The paths are replaced on `config.paths`, so this must be called before the
+    pipeline modules are imported (they bind some paths at import). The experiment
+    grid is replaced in place on `config.variables`, so every module sees it.
+
+    Args:
+        data_dir (str): The directory of the synthetic archives.
+        results_dir (str): The directory the pipeline writes its outputs to.
+        dataset_folds (List[str]): The dataset fold names.
+        scenarios (Dict[str, str]): The scenario names and display names.
+        models (Dict[str, str]): The model names and display names.
+    """
+    data_prefix, results_prefix = paths.DATA_DIR, paths.RESULTS_DIR
+    for name, value in list(vars(paths).items()):
+        if not name.isupper() or not isinstance(value, str):
+            continue
+        if value.startswith(data_prefix):
+            setattr(paths, name, data_dir + value[len(data_prefix) :])
+        elif value.startswith(results_prefix):
+            setattr(paths, name, results_dir + value[len(results_prefix) :])
+    for directory in [
+        paths.CHARTS_DIR,
+        paths.METRICS_DIR,
+        paths.STATISTICAL_TESTS_DIR,
+        paths.LOGS_DIR,
+    ]:
+        os.makedirs(directory, exist_ok=True)
+
+    variables.dataset_folds[:] = dataset_folds
+    variables.scenarios_mapping.clear()
+    variables.scenarios_mapping.update(scenarios)
+    variables.ordered_scenarios[:] = list(scenarios.values())
+    variables.models_mapping.clear()
+    variables.models_mapping.update(models)
+    variables.ordered_models[:] = list(models.values())
+
+
+def get_environment() -> dict:
+    """The code version and the versions of the main packages."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_stages(workers: int) -> List[dict]:
+    """Run and time every pipeline stage on the current inputs."""
+    # imported here so that they see the synthetic paths (see use_synthetic_inputs)
+    from f1_calculate_metrics import calculate_metrics
+    from f2_summarize_metrics import summarize_metrics
+    from f3_create_table_svgs import generate_table_svgs
+    from f4_create_charts import create_charts
+    from f5_run_statistical_tests import run_statistical_tests
+
+    stage_functions = {
+        "calculate_metrics": lambda: calculate_metrics(
+            workers=workers, incremental=False
+        ),
+        "summarize_metrics": summarize_metrics,
+        "generate_table_svgs": generate_table_svgs,
+        "create_charts": create_charts,
+        "run_statistical_tests": run_statistical_tests,
+    }
+    records = []
+    for stage in STAGES:
+        monitor = ResourceMonitor().start()
+        error = None
+        try:
+            stage_functions[stage]()
+        except Exception as exc:  # a failing stage must not end the benchmark
+            error = f"{type(exc).__name__}: {exc}"
+        records.append({"stage": stage, **monitor.stop(), "error": error})
+    return records
+
+
+def run_benchmark(
+    configurations: List[dict],
+    workers: int = 1,
+    output_fpath: Optional[str] = None,
+    work_dir: Optional[str] = None,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Generate the synthetic inputs of every configuration, time the pipeline stages on
+    them and append the results to the results file.
+
+    Args:
+        configurations (List[dict]): Configurations with the keys datasets, folds,
+            models, scenarios and rows.
+        workers (int): Number of worker processes of the metrics calculation.
+        output_fpath (Optional[str]): JSON lines file the results are appended to.
+        work_dir (Optional[str]): Directory for the synthetic inputs and the pipeline
+            outputs, kept after the run. A temporary directory is used (and removed)
+            by default.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        pd.DataFrame: One row per configuration and stage.
+    """
+    keep_work_dir = work_dir is not None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="pipeline_scale_")
+    data_dir = os.path.join(work_dir, "data")
+    results_dir = os.path.join(work_dir, "results")
+    environment = get_environment()
+
+    rows = []
+    try:
+        for configuration in configurations:
+            dataset_folds = get_synthetic_dataset_folds(
+                configuration["datasets"], configuration["folds"]
+            )
+            scenarios = get_synthetic_scenarios(configuration["scenarios"])
+            models = get_synthetic_models(configuration["models"])
+
+            shutil.rmtree(results_dir, ignore_errors=True)
+            generation = ResourceMonitor(sample_rss=False).start()
+            generate_synthetic_inputs(
+                data_dir,
+                dataset_folds,
+                list(scenarios),
+                list(models),
+                configuration["rows"],
+                seed,
+            )
+            generation_time = generation.stop()["wall_time_s"]
+            use_synthetic_inputs(
+                data_dir, results_dir, dataset_folds, scenarios, models
+            )
+
+            stages = run_stages(workers)
+            record = {
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "benchmark": "pipeline_scale",
+                **environment,
+                "workers": workers,
+                "configuration": configuration,
+                "experiments": len(dataset_folds) * len(scenarios) * len(models),
+                "generation_time_s": generation_time,
+                "stages": stages,
+            }
+            if output_fpath is not None:
+                os.makedirs(os.path.dirname(output_fpath), exist_ok=True)
+                with open(output_fpath, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+            rows.extend({**configuration, **stage} for stage in stages)
+    finally:
+        if not keep_work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--datasets", type=int, nargs="+", default=[30])
+    parser.add_argument("--folds", type=int, nargs="+", default=[5])
+    parser.add_argument("--models", type=int, nargs="+", default=[15])
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[4])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        default=paths.PIPELINE_BENCHMARK_FPATH,
+        help="JSON lines file the results are appended to.",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default=None,
+        help="Keep the synthetic inputs and pipeline outputs in this directory.",
+    )
+    args = parser.parse_args()
+    configurations = [
+        dict(zip(["datasets", "folds", "models", "scenarios", "rows"], values))
+        for values in itertools.product(
+            args.datasets, args.folds, args.models, args.scenarios, args.rows
+        )
+    ]
+    results = run_benchmark(
+        configurations, args.workers, args.output, args.work_dir, args.seed
+    )
+    print(
+        results[
+            ["datasets", "folds", "models", "scenarios", "rows", "stage"]
+            + ["wall_time_s", "cpu_time_s", "peak_rss_mb", "error"]
+        ].to_string(index=False, float_format="%.2f")
+    )
+    print(f"\nResults appended to {args.output}.")
@@ -0,0 +1,286 @@
+"""
+Bootstrap confidence intervals for every experiment's metrics.
+
+For each dataset fold, B resamples of the test rows are drawn as a (B x rows) index
+matrix and turned into per-row resample counts. Every metric is then a weighted
+version of the metric on the original rows: its sufficient statistic is built from
+the count matrix (the confusion counts, calibration bins and mean losses become matrix
+products with it, and the ROC and precision-recall curves are weighted cumulative
+sums over each experiment's scores, sorted only once) and fed to the registered
+metric functions.
+All scenario/model experiments of a fold share the same resamples, so their intervals
+are paired.
+
+The output has one row per (scenario, dataset_fold, model) and metric with the
+percentile confidence interval of the metric.
+
+Usage:
+    python bootstrap_metrics.py [--resamples 1000] [--confidence 0.95] [--workers N]
+"""
+
+import argparse
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from logging_config import ContextFilter, setup_logging
+import config.paths as paths
+from config.variables import (
+    bootstrap_confidence_level,
+    bootstrap_resamples,
+    bootstrap_seed,
+    dataset_folds,
+    models_mapping,
+    scenarios_mapping,
+)
+from metrics import (
+    CALIBRATION,
+    CONFUSION,
+    PROBABILITIES,
+    RANKING,
+    ConfusionCounts,
+    ProbabilityRows,
+    ScoreCurves,
+    TestKeyIndex,
+    calibration_bins,
+    evaluate_metrics,
+    get_metric_names,
+    stack_fold_predictions,
+)
+from predictions_store import read_predictions
+from utils import get_dataset_files, run_tasks, save_dataframe_as_csv
+
+logger = logging.getLogger(__name__)
+setup_logging(paths.METRICS_CALCULATION_LOG_FPATH)
+
+
+def draw_resample_counts(
+    num_rows: int, num_resamples: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Draw bootstrap resamples of the rows and count how often each row is drawn.
+
+    Args:
+        num_rows (int): Number of rows to resample.
+        num_resamples (int): Number of resamples (B).
+        rng (np.random.Generator): The random generator.
+
+    Returns:
+        np.ndarray: (B x rows) matrix with the number of draws of every row.
+    """
+    indices = rng.integers(0, num_rows, size=(num_resamples, num_rows))
+    # offset every resample's indices so one bincount counts them all
+    indices += np.arange(num_resamples)[:, np.newaxis] * num_rows
+    counts = np.bincount(indices.ravel(), minlength=num_resamples * num_rows)
+    return counts.reshape(num_resamples, num_rows).astype(np.float64)
+
+
+def compute_resampled_metrics(
+    y_true: np.ndarray,
+    y_pred: np.ndarray,
+    y_pred_proba: np.ndarray,
+    resample_counts: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Compute every registered metric for every experiment on every bootstrap resample.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred (np.ndarray): Binary (0/1) predicted labels, shape (experiments, rows).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+        resample_counts (np.ndarray): Draws of every row per resample, shape
+            (resamples, rows).
+
+    Returns:
+        Dict[str, np.ndarray]: Metric names as keys and (experiments x resamples)
+            metric values as values. AUC is NaN on resamples without both classes.
+    """
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred = np.asarray(y_pred) == 1
+    y_pred_proba = np.asarray(y_pred_proba, dtype=np.float64)
+    num_rows = y_true.size
+    weights = resample_counts.T
+
+    # confusion counts: matrix products with the resample counts
+    positives = y_true @ weights
+    tp = (y_pred & (y_true == 1)).astype(np.float64) @ weights
+    fp = y_pred.astype(np.float64) @ weights - tp
+    fn = positives - tp
+    tn = num_rows - tp - fp - fn
+
+    # the other statistics are weighted by the resample counts as well
+    resampled = evaluate_metrics(
+        {
+            CONFUSION: ConfusionCounts(tp, fp, fn, tn),
+            CALIBRATION: calibration_bins(y_true, y_pred_proba, resample_counts),
+            PROBABILITIES: ProbabilityRows(y_true, y_pred_proba, resample_counts),
+        },
+        [name for name in get_metric_names() if name not in get_metric_names(RANKING)],
+    )
+
+    # ranking metrics: sort each experiment once, then take weighted cumulative sums
+    # of the resample counts at its distinct score thresholds
+    ranking_values = []
+    for scores in y_pred_proba:
+        order = np.argsort(scores, kind="stable")[::-1]
+        sorted_score = scores[order]
+        threshold_idxs = np.r_[np.flatnonzero(np.diff(sorted_score)), num_rows - 1]
+
+        sorted_counts = resample_counts[:, order]
+        drawn = np.cumsum(sorted_counts, axis=-1)[:, threshold_idxs]
+        sorted_counts *= y_true[order]
+        tps = np.cumsum(sorted_counts, axis=-1)[:, threshold_idxs]
+        ranking_values.append(
+            evaluate_metrics(
+                {RANKING: ScoreCurves(drawn - tps, tps)}, get_metric_names(RANKING)
+            )
+        )
+    for name in get_metric_names(RANKING):
+        resampled[name] = np.stack([values[name] for values in ranking_values])
+
+    return {name: resampled[name] for name in get_metric_names()}
+
+
+def calculate_fold_bootstrap_cis(
+    dataset_fold: str,
+    experiments: List[Tuple[str, str]],
+    num_resamples: int = bootstrap_resamples,
+    confidence_level: float = bootstrap_confidence_level,
+    seed: int = bootstrap_seed,
+) -> List[Dict]:
+    """
+    Calculate bootstrap confidence intervals for the given experiments of a single
+    dataset fold.
+
+    The resamples are seeded by the seed and the fold's position in
+    `config.variables.dataset_folds`, so they don't depend on which experiments or
+    workers are involved.
+
+    Args:
+        dataset_fold (str): The name of the dataset fold.
+        experiments (List[Tuple[str, str]]): (scenario, model) pairs, in output order.
+        num_resamples (int): Number of bootstrap resamples.
+        confidence_level (float): Coverage of the percentile intervals.
+        seed (int): Base random seed.
+
+    Returns:
+        List[Dict]: One row per experiment and metric, in the given order.
+    """
+    data_schema, test_key = get_dataset_files(dataset_fold)
+    test_key_index = TestKeyIndex(data_schema, test_key)
+    y_pred, y_pred_proba = stack_fold_predictions(
+        data_schema,
+        test_key_index,
+        [
+            read_predictions(scenario, dataset_fold, model)
+            for scenario, model in experiments
+        ],
+        [
+            ContextFilter(dataset=dataset_fold, scenario=scenario, model=model)
+            for scenario, model in experiments
+        ],
+    )
+
+    rng = np.random.default_rng([seed, dataset_folds.index(dataset_fold)])
+    resample_counts = draw_resample_counts(len(test_key_index.ids), num_resamples, rng)
+    resampled = compute_resampled_metrics(
+        test_key_index.labels, y_pred, y_pred_proba, resample_counts
+    )
+
+    tail = (1 - confidence_level) / 2 * 100
+    rows = []
+    for i, (scenario, model) in enumerate(experiments):
+        for name, metric_values in resampled.items():
+            values = metric_values[i]
+            if np.isnan(values).all():
+                lower, upper = np.nan, np.nan
+            else:
+                lower, upper = np.nanpercentile(values, [tail, 100 - tail])
+            rows.append(
+                {
+                    "Scenario": scenario,
+                    "Dataset_Fold": dataset_fold,
+                    "Model": model,
+                    "Metric": name,
+                    "CI_Lower": round(lower, 4),
+                    "CI_Upper": round(upper, 4),
+                }
+            )
+    return rows
+
+
+def calculate_bootstrap_cis(
+    num_resamples: int = bootstrap_resamples,
+    confidence_level: float = bootstrap_confidence_level,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Calculate bootstrap confidence intervals for the metrics of every experiment and
+    save them next to the metrics table.
+
+    Args:
+        num_resamples (int): Number of bootstrap resamples per dataset fold.
+        confidence_level (float): Coverage of the percentile intervals.
+        workers (int): Number of worker processes. With more than one worker, the
+                       dataset folds are fanned out to a process pool. The results
+                       are always returned in the same order as a serial run.
+
+    Returns:
+        pd.DataFrame: The confidence intervals.
+    """
+    print(
+        f"Calculating {confidence_level:.0%} bootstrap confidence intervals "
+        f"({num_resamples} resamples)..."
+    )
+    experiments = [
+        (scenario, model) for scenario in scenarios_mapping for model in models_mapping
+    ]
+
+    with tqdm(total=len(dataset_folds), desc="Bootstrapping", unit="fold") as pbar:
+        rows_by_fold = run_tasks(
+            calculate_fold_bootstrap_cis,
+            [
+                (dataset_fold, experiments, num_resamples, confidence_level)
+                for dataset_fold in dataset_folds
+            ],
+            workers,
+            on_result=lambda _: pbar.update(1),
+        )
+
+    results_df = pd.DataFrame([row for rows in rows_by_fold for row in rows])
+    # map scenario names to scenario display names
+    results_df["Scenario"] = results_df["Scenario"].map(scenarios_mapping)
+    results_df["Model"] = results_df["Model"].map(models_mapping)
+    save_dataframe_as_csv(results_df, paths.BOOTSTRAP_CI_FPATH, decimals=4)
+    logger.info("Bootstrap confidence intervals calculated and saved.")
+    return results_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Calculate bootstrap confidence intervals of experiment metrics."
+    )
+    parser.add_argument(
+        "--resamples",
+        type=int,
+        default=bootstrap_resamples,
+        help=f"Number of bootstrap resamples (default: {bootstrap_resamples}).",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=bootstrap_confidence_level,
+        help=f"Confidence level of the intervals (default: {bootstrap_confidence_level}).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (default: 1, i.e. run serially).",
+    )
+    args = parser.parse_args()
+    calculate_bootstrap_cis(args.resamples, args.confidence, args.workers)
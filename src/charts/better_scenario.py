@@ -50,7 +50,10 @@ def create_which_is_better_chart(metrics_df: pd.DataFrame, save_fig_path: str) -
         .loc[ordered_metrics]
     )
 
-    comparison_counts = comparison_counts[comparison_columns]
+    # a comparison that never occurs (e.g. no ties) is a column of zeros
+    comparison_counts = comparison_counts.reindex(
+        columns=comparison_columns, fill_value=0
+    )
 
     # Create sub-plots with 5 columns (one for each metric) and 1 row
     fig, axes = plt.subplots(1, 5, figsize=(16, 3), sharey=True)
@@ -154,6 +157,9 @@ def create_scenario_impact_chart(
         "smote_is_better",
         "tie",
     ]
+    comparison_counts_model = comparison_counts_model.reindex(
+        columns=comparison_columns, fill_value=0
+    )
 
     # Create sub-plots with 5 columns (one for each metric) and 1 row
     ordered_metrics = [metric["name"] for metric in metrics_dict]
@@ -1,6 +1,6 @@
+import numpy as np
 import pandas as pd
 import svgwrite
-import re
 
 from config import chart_cfg
 from config.chart_cfg import *
@@ -37,10 +37,33 @@ def apply_chart_cfg(ax):
         ax.patch.set_alpha(0)
 
 
+def get_x_values(df):
+    """
+    Get the numeric values of the cells of a DataFrame: numeric cells as they are, the
+    mean (X) of "X ± Y" cells, and NaN for any other cell.
+
+    Args:
+        df (pd.DataFrame): The DataFrame containing the data.
+
+    Returns:
+        pd.DataFrame: The numeric values, with the same rows and columns.
+    """
+    x_values = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            x_values[col] = df[col].astype(float)
+        else:
+            x_values[col] = pd.to_numeric(
+                df[col].astype(str).str.extract(r"^\s*(-?[\d.]+)\s*±", expand=False),
+                errors="coerce",
+            )
+    return pd.DataFrame(x_values, index=df.index)
+
+
 def find_extreme_cells(df, columns, by="row", extreme="max"):
     """
     Identify the cells to be bolded based on the extreme (max or min) values in specific columns.
-    Handles both numeric values and "X +/- Y" format.
+    Handles both numeric values and "X +/- Y" format; other cells are ignored.
 
     Args:
         df (pd.DataFrame): The DataFrame containing the data.
@@ -52,76 +75,24 @@ def find_extreme_cells(df, columns, by="row", extreme="max"):
         dict: A dictionary where the keys are row indices and the values are the column indices
               of the cells to be bolded.
     """
-    bold_cells = {}
-
-    def get_x_value(cell_value):
-        """Extract the mean (X) value from "X ± Y" format or return the numeric value."""
-        if isinstance(cell_value, str) and "±" in cell_value:
-            match = re.match(r"([\d.]+)\s*\±\s*([\d.]+)", cell_value)
-            if match:
-                return float(match.group(1))  # X value (mean)
-            else:
-                return float("-inf")  # If parsing fails, treat as very low value
-        else:
-            return (
-                float(cell_value)
-                if isinstance(cell_value, (int, float))
-                else float("-inf")
-            )
+    x_values = get_x_values(df[columns])
+    axis = 1 if by == "row" else 0
+    extreme_values = (
+        x_values.max(axis=axis) if extreme == "max" else x_values.min(axis=axis)
+    )
+    # all the cells with the extreme value are bolded (ties included)
+    is_extreme = x_values.eq(extreme_values, axis=1 - axis).to_numpy()
 
+    bold_cells = {}
     if by == "row":
-        # Iterate through rows
-        for row_idx, row in df.iterrows():
-            extreme_value = None
-            extreme_cols = []
-
-            for col in columns:
-                x_value = get_x_value(row[col])
-
-                # Determine if this is the extreme (max or min) value in the row (for the specified columns)
-                if (
-                    extreme_value is None
-                    or (extreme == "max" and x_value > extreme_value)
-                    or (extreme == "min" and x_value < extreme_value)
-                ):
-                    extreme_value = x_value
-                    extreme_cols = [col]  # Reset list with the new extreme value column
-                elif x_value == extreme_value:
-                    extreme_cols.append(col)  # Handle ties
-
-            # Mark the cells to be bolded in the current row, but only if there is a valid extreme value
-            if extreme_cols and extreme_value != float("-inf"):
-                bold_cells[row_idx] = extreme_cols
-
+        for row_pos in np.flatnonzero(is_extreme.any(axis=1)):
+            bold_cells[df.index[row_pos]] = [
+                columns[col_pos] for col_pos in np.flatnonzero(is_extreme[row_pos])
+            ]
     elif by == "column":
-        # Iterate through columns
-        for col in columns:
-            extreme_value = None
-            extreme_rows = []
-
-            for row_idx, cell_value in df[col].iteritems():
-                x_value = get_x_value(cell_value)
-
-                # Determine if this is the extreme (max or min) value in the column
-                if (
-                    extreme_value is None
-                    or (extreme == "max" and x_value > extreme_value)
-                    or (extreme == "min" and x_value < extreme_value)
-                ):
-                    extreme_value = x_value
-                    extreme_rows = [
-                        row_idx
-                    ]  # Reset list with the new extreme value row
-                elif x_value == extreme_value:
-                    extreme_rows.append(row_idx)  # Handle ties
-
-            # Mark the cells to be bolded in the current column, but only if there is a
-            # valid extreme value
-            if extreme_rows and extreme_value != float("-inf"):
-                for row_idx in extreme_rows:
-                    if row_idx not in bold_cells:
-                        bold_cells[row_idx] = []
-                    bold_cells[row_idx].append(col)
+        for col_pos, col in enumerate(columns):
+            for row_pos in np.flatnonzero(is_extreme[:, col_pos]):
+                bold_cells.setdefault(df.index[row_pos], []).append(col)
 
     return bold_cells
 
@@ -10,6 +10,8 @@ DATASETS_DIR = os.path.join(DATA_DIR, "datasets")
 PREDICTIONS_DIR = os.path.join(DATA_DIR, "predictions")
 ZIPPED_DATASETS_FILE = os.path.join(DATA_DIR, "datasets.zip")
 ZIPPED_PREDICTIONS_FILE = os.path.join(DATA_DIR, "predictions.zip")
+# columnar predictions store compiled from predictions.zip
+PREDICTIONS_STORE_DIR = os.path.join(DATA_DIR, "predictions_store")
 
 
 # config
@@ -26,10 +28,31 @@ STATISTICAL_TESTS_DIR = os.path.join(RESULTS_DIR, "statistical_tests")
 
 # output files
 
-# raw metrics
+# raw metrics: the typed table read by the pipeline, and its CSV export
+METRICS_TABLE_FPATH = os.path.join(METRICS_DIR, "all_metrics.feather")
 METRICS_FPATH = os.path.join(METRICS_DIR, "all_metrics.csv")
+# input hashes of the experiments in all_metrics.csv, for incremental runs
+METRICS_MANIFEST_FPATH = os.path.join(METRICS_DIR, "all_metrics_manifest.json")
+# bootstrap confidence intervals of the raw metrics
+BOOTSTRAP_CI_FPATH = os.path.join(METRICS_DIR, "all_metrics_bootstrap_ci.csv")
+# optimal decision thresholds and metric-vs-threshold curves of the experiments
+OPTIMAL_THRESHOLDS_FPATH = os.path.join(
+    METRICS_DIR, "all_metrics_optimal_thresholds.csv"
+)
+THRESHOLD_CURVES_FPATH = os.path.join(METRICS_DIR, "all_metrics_threshold_curves.csv")
+# partial metrics files of the shards of a sharded run, merged into all_metrics.csv
+METRIC_SHARDS_DIR = os.path.join(METRICS_DIR, "shards")
+# sufficient statistics of the experiments, and the metrics derived from them
+STATISTICS_STORE_FPATH = os.path.join(METRICS_DIR, "all_metrics_statistics.npz")
+DERIVED_METRICS_FPATH = os.path.join(METRICS_DIR, "all_metrics_derived.csv")
+
+# characteristics of every dataset fold (features, test rows, class imbalance)
+DATASET_CHARACTERISTICS_FPATH = os.path.join(
+    METRICS_DIR, "dataset_characteristics.feather"
+)
 
-# summarized metrics
+# summarized metrics: the numeric summary of all levels, and its CSV export per level
+METRICS_SUMMARY_FPATH = os.path.join(METRICS_DIR, "metrics_summary.feather")
 OVERALL_METRICS_FPATH = os.path.join(METRICS_DIR, "overall_metrics_summary.csv")
 BY_MODEL_METRICS_FPATH = os.path.join(METRICS_DIR, "by_model_metrics_summary.csv")
 BY_DATASET_METRICS_FPATH = os.path.join(METRICS_DIR, "by_dataset_metrics_summary.csv")
@@ -70,3 +93,15 @@ TTEST_RESULTS_FPATH = os.path.join(STATISTICAL_TESTS_DIR, "ttest_results.csv")
 # logs
 LOGS_DIR = os.path.join(RESULTS_DIR, "logs")
 METRICS_CALCULATION_LOG_FPATH = os.path.join(LOGS_DIR, "metrics_calculation.log")
+# content signatures of the stages run by run_all.py, for skipping up-to-date stages
+PIPELINE_STATE_FPATH = os.path.join(LOGS_DIR, "pipeline_state.json")
+# profiling report of run_all.py --profile
+PROFILE_REPORT_FPATH = os.path.join(LOGS_DIR, "profile_report.json")
+PROFILE_SLOWEST_EXPERIMENTS_FPATH = os.path.join(
+    LOGS_DIR, "profile_slowest_experiments.csv"
+)
+
+# benchmarks
+BENCHMARKS_DIR = os.path.join(RESULTS_DIR, "benchmarks")
+# results of benchmarks/pipeline_scale.py, one JSON line per configuration and run
+PIPELINE_BENCHMARK_FPATH = os.path.join(BENCHMARKS_DIR, "pipeline_scale.jsonl")
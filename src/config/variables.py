@@ -5,6 +5,25 @@ of summary tables and charges.
 
 rounding = 3
 
+# bootstrap confidence intervals of the metrics (bootstrap_metrics.py)
+bootstrap_resamples = 1000
+bootstrap_confidence_level = 0.95
+bootstrap_seed = 42
+
+# number of evenly spaced thresholds in [0, 1] of the saved threshold curves
+threshold_curve_points = 21
+
+# number of equal-width score bins per class in the sufficient-statistics store
+score_histogram_bins = 1000
+
+# rows read per chunk by the streaming evaluation (f1_calculate_metrics.py --streaming)
+streaming_chunk_rows = 1_000_000
+
+# imbalance levels of the datasets (dataset_characteristics.py): buckets of the mean
+# imbalance ratio (majority count / minority count) of their folds
+imbalance_ratio_bins = [1, 10, 20, float("inf")]
+imbalance_level_labels = ["Low (1-10)", "Medium (10-20)", "High (20+)"]
+
 scenarios_mapping = {
     "baseline": "Baseline",
     "smote": "SMOTE",
@@ -18,6 +37,8 @@ ordered_scenarios = [
     "Decision Threshold",
 ]
 
+# the metrics that are summarized, charted and tested, in order (metrics.py checks
+# them against its metric registry)
 metrics = [
     {"name": "F1-score", "min_max": "max"},
     {"name": "F2-score", "min_max": "max"},
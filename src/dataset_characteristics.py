@@ -0,0 +1,187 @@
+"""
+Index of the characteristics of every dataset fold, derived from its schema and test
+key: number of features (numeric and categorical), test rows, minority class count and
+imbalance ratio (majority count / minority count).
+
+The index is stored as a Feather file with the content signature of every fold's
+schema and test key (see 'utils.get_dataset_signature'). Updating it only reads the
+files of the folds that are new or changed, so the schemas and test keys are read once,
+not by every analysis that needs them.
+
+The index joins to the metrics table on 'Dataset_Fold' (`join_dataset_characteristics`),
+and `get_imbalance_levels` buckets the datasets by imbalance, e.g. to stratify the
+results cube:
+
+    cube.add_dimension(
+        "Imbalance Level", "Dataset", get_imbalance_levels(load_dataset_characteristics())
+    )
+"""
+
+import logging
+import os
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+import config.paths as paths
+from config.variables import imbalance_level_labels, imbalance_ratio_bins
+from utils import get_dataset_files, get_dataset_signature
+
+logger = logging.getLogger(__name__)
+
+CHARACTERISTICS_COLUMNS = [
+    "Features",
+    "Numeric Features",
+    "Categorical Features",
+    "Test Rows",
+    "Minority Count",
+    "Imbalance Ratio",
+]
+
+
+def get_dataset_fold_characteristics(data_schema: Dict, test_key: pd.DataFrame) -> Dict:
+    """
+    Characteristics of a dataset fold.
+
+    Args:
+        data_schema (Dict): The dataset's schema.
+        test_key (pd.DataFrame): The fold's test key.
+
+    Returns:
+        Dict: The value of every characteristics column.
+    """
+    data_types = [feature["dataType"].upper() for feature in data_schema["features"]]
+    class_counts = (
+        test_key[data_schema["target"]["name"]]
+        .astype(str)
+        .value_counts()
+        .reindex([str(c) for c in data_schema["target"]["classes"]], fill_value=0)
+    )
+    minority_count = int(class_counts.min())
+    return {
+        "Features": len(data_types),
+        "Numeric Features": data_types.count("NUMERIC"),
+        "Categorical Features": data_types.count("CATEGORICAL"),
+        "Test Rows": len(test_key),
+        "Minority Count": minority_count,
+        "Imbalance Ratio": (
+            class_counts.max() / minority_count if minority_count else float("inf")
+        ),
+    }
+
+
+def load_dataset_characteristics() -> pd.DataFrame:
+    """
+    Load the dataset characteristics index.
+
+    Returns:
+        pd.DataFrame: One row per dataset fold, with the 'Dataset_Fold', 'Dataset' and
+            'Signature' columns and the characteristics.
+    """
+    return pd.read_feather(paths.DATASET_CHARACTERISTICS_FPATH)
+
+
+def update_dataset_characteristics(dataset_folds: List[str]) -> pd.DataFrame:
+    """
+    Update the dataset characteristics index for the given dataset folds: the folds
+    whose schema and test key are unchanged are kept, the others are read.
+
+    Args:
+        dataset_folds (List[str]): The dataset folds to index.
+
+    Returns:
+        pd.DataFrame: The index of the given dataset folds.
+    """
+    existing = {}
+    if os.path.exists(paths.DATASET_CHARACTERISTICS_FPATH):
+        existing = {
+            row["Dataset_Fold"]: row
+            for row in load_dataset_characteristics().to_dict("records")
+        }
+
+    rows, num_read = [], 0
+    for dataset_fold in dataset_folds:
+        signature = get_dataset_signature(dataset_fold)
+        row = existing.get(dataset_fold)
+        if row is None or row["Signature"] != signature:
+            data_schema, test_key = get_dataset_files(dataset_fold)
+            row = {
+                "Dataset_Fold": dataset_fold,
+                "Dataset": dataset_fold.split("_fold")[0],
+                "Signature": signature,
+                **get_dataset_fold_characteristics(data_schema, test_key),
+            }
+            num_read += 1
+        rows.append(row)
+
+    characteristics = pd.DataFrame(
+        rows, columns=["Dataset_Fold", "Dataset", "Signature"] + CHARACTERISTICS_COLUMNS
+    ).astype(
+        {
+            "Dataset_Fold": "category",
+            "Dataset": "category",
+            "Imbalance Ratio": "float64",
+            **{column: "int64" for column in CHARACTERISTICS_COLUMNS[:-1]},
+        }
+    )
+    if num_read or len(existing) != len(rows):
+        os.makedirs(os.path.dirname(paths.DATASET_CHARACTERISTICS_FPATH), exist_ok=True)
+        tmp_path = f"{paths.DATASET_CHARACTERISTICS_FPATH}.tmp"
+        characteristics.to_feather(tmp_path)
+        os.replace(tmp_path, paths.DATASET_CHARACTERISTICS_FPATH)
+    logger.info(
+        "Dataset characteristics: %d folds indexed, %d read.", len(rows), num_read
+    )
+    return characteristics
+
+
+def join_dataset_characteristics(
+    metrics_df: pd.DataFrame,
+    characteristics: Optional[pd.DataFrame] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """
+    Join the characteristics of the dataset folds to the metrics table.
+
+    Args:
+        metrics_df (pd.DataFrame): The metrics table.
+        characteristics (Optional[pd.DataFrame]): The dataset characteristics index
+            (default: loaded from disk).
+        columns (Optional[List[str]]): The characteristics to join (default: all).
+
+    Returns:
+        pd.DataFrame: The metrics table with the characteristics columns (missing for
+            the folds that are not indexed).
+    """
+    if characteristics is None:
+        characteristics = load_dataset_characteristics()
+    by_fold = characteristics.set_index(characteristics["Dataset_Fold"].astype(str))[
+        columns or CHARACTERISTICS_COLUMNS
+    ]
+    return metrics_df.join(by_fold, on=metrics_df["Dataset_Fold"].astype(str))
+
+
+def get_imbalance_levels(characteristics: pd.DataFrame) -> Dict[str, str]:
+    """
+    Imbalance level of every dataset: its mean imbalance ratio over the folds, bucketed
+    by the configured 'imbalance_ratio_bins' and 'imbalance_level_labels' (the lowest
+    edge is included, so a perfectly balanced dataset is in the first bucket).
+
+    Args:
+        characteristics (pd.DataFrame): The dataset characteristics index.
+
+    Returns:
+        Dict[str, str]: The imbalance level of every dataset whose ratio is in one of
+            the buckets (the others are left out, so they are not mapped by
+            `ResultsCube.add_dimension`).
+    """
+    mean_ratios = characteristics.groupby("Dataset", observed=True)[
+        "Imbalance Ratio"
+    ].mean()
+    levels = pd.cut(
+        mean_ratios,
+        bins=imbalance_ratio_bins,
+        labels=imbalance_level_labels,
+        include_lowest=True,
+    )
+    return {str(dataset): level for dataset, level in levels.dropna().items()}
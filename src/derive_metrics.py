@@ -0,0 +1,202 @@
+"""
+Derive metrics from the sufficient-statistics store, without reading predictions.
+
+'f1_calculate_metrics.py' saves the confusion counts at the applied threshold, the
+class counts and a per-class histogram of the scores of every experiment (see
+'statistics_store.py'). From these, this script computes:
+
+    - every registered confusion-count metric, exactly
+    - every registered ranking metric (AUC, PR-AUC, ...), approximately: the metric
+      of the binned scores, where the rows in a bin are tied, together with a lower
+      and an upper bound. The bounds are the metric under the worst and the best
+      ordering of the rows within every bin (negatives first, or positives first), so
+      the exact value always lies between them.
+
+The other metrics need the predictions themselves and are not derived. New metrics
+only have to be registered in 'metrics.py'; no predictions are re-read.
+
+Usage:
+    python derive_metrics.py [--metrics NAME [NAME ...]]
+"""
+
+import argparse
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from logging_config import setup_logging
+import config.paths as paths
+from config.variables import models_mapping, scenarios_mapping
+from metrics import (
+    CONFUSION,
+    METRIC_REGISTRY,
+    RANKING,
+    ConfusionCounts,
+    ScoreCurves,
+    evaluate_metrics,
+    get_metric_names,
+)
+from statistics_store import (
+    descending_bins,
+    binned_score_curves,
+    load_statistics_store,
+)
+from utils import save_dataframe_as_csv
+
+logger = logging.getLogger(__name__)
+setup_logging(paths.METRICS_CALCULATION_LOG_FPATH)
+
+
+def ordered_score_curves(
+    score_histograms: np.ndarray, positives_first: bool
+) -> ScoreCurves:
+    """
+    Score curves with one point per row, for the ordering of the rows that puts the
+    positive (or the negative) rows of every bin first.
+
+    Args:
+        score_histograms (np.ndarray): (experiments, 2, bins) histograms of the scores
+            of the negative and the positive rows. Every experiment must have the
+            same number of rows.
+        positives_first (bool): Whether the positive rows of a bin come first.
+
+    Returns:
+        ScoreCurves: The curves, shape (experiments, rows).
+    """
+    negatives, positives = descending_bins(score_histograms.astype(np.int64))
+    num_experiments, num_bins = negatives.shape
+    num_rows = int(negatives[0].sum() + positives[0].sum())
+
+    # the labels of every row, bin by bin: (experiments, bins, 2) runs of labels
+    if positives_first:
+        runs = np.stack([positives, negatives], axis=-1)
+        run_labels = np.array([1, 0], dtype=np.int64)
+    else:
+        runs = np.stack([negatives, positives], axis=-1)
+        run_labels = np.array([0, 1], dtype=np.int64)
+    labels = np.repeat(np.tile(run_labels, num_experiments * num_bins), runs.ravel())
+    tps = np.cumsum(labels.reshape(num_experiments, num_rows), axis=-1)
+    return ScoreCurves(np.arange(1, num_rows + 1) - tps, tps)
+
+
+def derive_ranking_metrics(
+    score_histograms: np.ndarray, metric_names: List[str]
+) -> Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """
+    Approximate ranking metrics of several experiments from their score histograms.
+
+    The bounds assume that a metric only changes in one direction when a positive
+    row moves ahead of a negative row, as AUC, PR-AUC and average precision do.
+
+    Args:
+        score_histograms (np.ndarray): (experiments, 2, bins) histograms of the scores
+            of the negative and the positive rows. Every experiment must have the
+            same number of rows.
+        metric_names (List[str]): The ranking metrics to derive.
+
+    Returns:
+        Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]: Metric names as keys
+            and the approximation, lower bound and upper bound per experiment as
+            values.
+    """
+    approximations = evaluate_metrics(
+        {RANKING: binned_score_curves(score_histograms)}, metric_names
+    )
+    best = evaluate_metrics(
+        {RANKING: ordered_score_curves(score_histograms, positives_first=True)},
+        metric_names,
+    )
+    worst = evaluate_metrics(
+        {RANKING: ordered_score_curves(score_histograms, positives_first=False)},
+        metric_names,
+    )
+    return {
+        name: (
+            approximations[name],
+            np.minimum(best[name], worst[name]),
+            np.maximum(best[name], worst[name]),
+        )
+        for name in metric_names
+    }
+
+
+def derive_metrics(metric_names: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Derive metrics of every experiment from the statistics store and save them next
+    to the metrics table.
+
+    Args:
+        metric_names (Optional[List[str]]): The metrics to derive (default: every
+            registered confusion-count and ranking metric).
+
+    Returns:
+        pd.DataFrame: The derived metrics, with a lower and an upper bound column for
+            every approximated metric.
+    """
+    print("Deriving metrics from the sufficient-statistics store...")
+    keys, statistics = load_statistics_store(paths.STATISTICS_STORE_FPATH)
+    if keys.empty:
+        raise FileNotFoundError(
+            f"No statistics store at {paths.STATISTICS_STORE_FPATH}. "
+            "Run f1_calculate_metrics.py first."
+        )
+    if metric_names is None:
+        metric_names = get_metric_names(CONFUSION) + get_metric_names(RANKING)
+    for name in metric_names:
+        if METRIC_REGISTRY[name].statistic not in (CONFUSION, RANKING):
+            raise ValueError(
+                f"Metric '{name}' cannot be derived from the statistics store."
+            )
+    confusion_names = [
+        name for name in metric_names if METRIC_REGISTRY[name].statistic == CONFUSION
+    ]
+    ranking_names = [
+        name for name in metric_names if METRIC_REGISTRY[name].statistic == RANKING
+    ]
+
+    # confusion-count metrics are exact
+    results = evaluate_metrics(
+        {CONFUSION: ConfusionCounts(*statistics["confusion"].T)}, confusion_names
+    )
+
+    # ranking metrics are approximated per dataset fold, whose experiments all have
+    # the same rows
+    for name in ranking_names:
+        for suffix in ["", "_Lower", "_Upper"]:
+            results[f"{name}{suffix}"] = np.empty(len(keys))
+    for _, fold_rows in keys.groupby("Dataset_Fold", sort=False).indices.items():
+        derived = derive_ranking_metrics(
+            statistics["score_histograms"][fold_rows], ranking_names
+        )
+        for name, (approximation, lower, upper) in derived.items():
+            results[name][fold_rows] = approximation
+            results[f"{name}_Lower"][fold_rows] = lower
+            results[f"{name}_Upper"][fold_rows] = upper
+
+    results_df = pd.concat([keys, pd.DataFrame(results).round(4)], axis=1).reset_index(
+        drop=True
+    )
+    # map scenario names to scenario display names
+    results_df["Scenario"] = results_df["Scenario"].map(scenarios_mapping)
+    results_df["Model"] = results_df["Model"].map(models_mapping)
+    save_dataframe_as_csv(results_df, paths.DERIVED_METRICS_FPATH, decimals=4)
+    logger.info("Metrics derived from the statistics store and saved.")
+    return results_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Derive metrics from the sufficient-statistics store."
+    )
+    parser.add_argument(
+        "--metrics",
+        nargs="+",
+        choices=get_metric_names(CONFUSION) + get_metric_names(RANKING),
+        default=None,
+        help="The metrics to derive (default: every confusion-count and ranking "
+        "metric).",
+    )
+    args = parser.parse_args()
+    derive_metrics(args.metrics)
@@ -3,100 +3,803 @@ Calculate classification metrics for binary class imbalance experiments.
 
 This script processes prediction results across multiple datasets, models, and
 imbalance handling scenarios. It computes various performance metrics and saves
-the results to a CSV file.
+the results to the metrics table (see 'metrics_table.py').
+
+Only the experiments whose inputs changed since the previous run are recomputed (see
+'metrics_manifest.py'); pass --full to recompute everything.
+
+With --streaming, the predictions and test keys are instead read in chunks and
+the memory used does not depend on the size of the predictions files (see
+'streaming_metrics.py'). The metrics are the same as a regular run's; this always
+recomputes everything.
+
+With --shard i/N (and optionally --datasets, --scenarios, --models), only a
+deterministic share of the experiments is calculated and saved as a partial metrics
+file, so the shards can run on several machines over a shared file system; the
+'merge' command then combines them into the metrics table (see 'metric_shards.py').
 
 Usage:
-    python f1_calculate_metrics.py
+    python f1_calculate_metrics.py [--workers N] [--full]
+    python f1_calculate_metrics.py --streaming [--workers N]
+    python f1_calculate_metrics.py --shard i/N [--datasets ...] [--scenarios ...]
+        [--models ...] [--workers N]
+    python f1_calculate_metrics.py merge
+
+The options of one form can't be combined with those of another.
 
 Requires:
-    - Prediction files for each dataset-model-scenario combination
+    - Prediction files for each dataset-model-scenario combination (or the columnar
+      store compiled from them with 'predictions_store.py')
     - Dataset schema and test key files
     - CSV files listing models and datasets
 """
 
+import argparse
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-import logging
 
 from logging_config import ContextFilter, setup_logging
 import config.paths as paths
 from utils import (
     get_dataset_files,
-    get_predictions,
-    save_dataframe_as_csv,
+    get_dataset_schema,
+    get_predictions_chunks,
+    get_test_key_chunks,
+    get_test_key_size,
+    run_tasks,
+)
+from predictions_store import get_predictions_source, read_predictions
+from profiling import profile_step
+from metrics_manifest import (
+    compute_cell_signatures,
+    find_stale_cells,
+    get_cell_key,
+    get_engine_signature,
+    load_manifest,
+    save_manifest,
+)
+from statistics_store import (
+    KEY_COLUMNS,
+    compute_experiment_statistics,
+    load_statistics_store,
+    save_statistics_store,
+)
+from metrics_table import DIMENSION_COLUMNS, load_metrics_table, save_metrics_table
+from metric_shards import (
+    assign_shard_folds,
+    load_metric_shards,
+    parse_shard,
+    save_metric_shard,
+    select_experiment_grid,
+)
+from streaming_metrics import StreamingTestKey, stream_experiment_predictions
+from config.variables import (
+    scenarios_mapping,
+    models_mapping,
+    dataset_folds,
+    score_histogram_bins,
+    streaming_chunk_rows,
+)
+from metrics import (
+    TestKeyIndex,
+    get_metric_names,
+    score_stacked_predictions,
+    stack_fold_predictions,
 )
-from config.variables import scenarios_mapping, models_mapping, dataset_folds
-from metrics import get_binary_classification_scores
 
 logger = logging.getLogger(__name__)
 setup_logging(paths.METRICS_CALCULATION_LOG_FPATH)
 
 
-def calculate_metrics() -> pd.DataFrame:
+# the key columns followed by every registered metric, in registration order
+METRICS_COLUMNS = ["Scenario", "Dataset_Fold", "Model"] + get_metric_names()
+
+
+def calculate_fold_metrics(
+    dataset_fold: str,
+    experiments: List[Tuple[str, str]],
+) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    """
+    Calculate metrics for the given experiments of a single dataset fold. The
+    dataset schema and test key are read once, and all the fold's experiments are
+    scored together in one batch.
+
+    Args:
+        dataset_fold (str): The name of the dataset fold.
+        experiments (List[Tuple[str, str]]): (scenario, model) pairs, in output order.
+
+    Returns:
+        Tuple[List[Dict], Dict[str, np.ndarray]]: One metrics dictionary per
+            experiment, and the experiments' sufficient statistics for the statistics
+            store, both in the given order.
+    """
+    # read the dataset schema and test key files
+    data_schema, test_key = get_dataset_files(dataset_fold)
+    # index the test key once for aligning all of the fold's prediction files
+    test_key_index = TestKeyIndex(data_schema, test_key)
+
+    experiment_predictions, context_filters = [], []
+    for scenario, model in experiments:
+        # read the predictions
+        with profile_step(
+            "read_predictions",
+            dataset_fold=dataset_fold,
+            scenario=scenario,
+            model=model,
+        ):
+            experiment_predictions.append(
+                read_predictions(scenario, dataset_fold, model)
+            )
+        # Create a ContextFilter with the current dataset_fold, scenario, and model
+        context_filters.append(
+            ContextFilter(dataset=dataset_fold, scenario=scenario, model=model)
+        )
+
+    # calculate the metrics of all experiments at once
+    with profile_step("calculate_metrics", dataset_fold=dataset_fold):
+        y_pred, y_pred_proba = stack_fold_predictions(
+            data_schema, test_key_index, experiment_predictions, context_filters
+        )
+        fold_metrics = score_stacked_predictions(
+            test_key_index.labels, y_pred, y_pred_proba
+        )
+    for metrics, (scenario, model) in zip(fold_metrics, experiments):
+        metrics["Scenario"] = scenario
+        metrics["Dataset_Fold"] = dataset_fold
+        metrics["Model"] = model
+    fold_statistics = compute_experiment_statistics(
+        test_key_index.labels, y_pred, y_pred_proba, score_histogram_bins
+    )
+    return fold_metrics, fold_statistics
+
+
+def log_predictions_source(predictions_source: str) -> None:
+    """Report whether the predictions are read from the columnar store or the files."""
+    source = (
+        "the columnar store"
+        if predictions_source == "store"
+        else "the prediction files"
+    )
+    print(f"Reading the predictions from {source}.")
+    logger.info("Reading the predictions from %s.", source)
+
+
+def load_existing_metrics(scenarios: List[str], models: List[str]) -> pd.DataFrame:
+    """
+    Load the previous run's metrics table with scenario and model names mapped back
+    from their display names. Rows that don't map to a known scenario or model are
+    dropped.
+
+    Args:
+        scenarios (List[str]): The scenario names.
+        models (List[str]): The model names.
+
+    Returns:
+        pd.DataFrame: The previous metrics, or an empty DataFrame if there are none.
+    """
+    # a table that only exists as (rounded) CSV export is recomputed
+    if not os.path.exists(paths.METRICS_TABLE_FPATH):
+        return pd.DataFrame(columns=METRICS_COLUMNS)
+    existing = load_metrics_table()
+    if list(existing.columns) != METRICS_COLUMNS:
+        return pd.DataFrame(columns=METRICS_COLUMNS)
+    existing = existing.astype({column: str for column in DIMENSION_COLUMNS})
+    scenario_names = {scenarios_mapping[s]: s for s in scenarios}
+    model_names = {models_mapping[m]: m for m in models}
+    existing["Scenario"] = existing["Scenario"].map(scenario_names)
+    existing["Model"] = existing["Model"].map(model_names)
+    return existing.dropna(subset=["Scenario", "Model"])
+
+
+def save_statistics(
+    results_df: pd.DataFrame,
+    all_metrics: List[Dict],
+    statistics_by_fold: List[Dict[str, np.ndarray]],
+    stored_keys: pd.DataFrame,
+    stored_statistics: Dict[str, np.ndarray],
+) -> None:
+    """
+    Save the sufficient statistics of the experiments in the metrics table, taking
+    the up-to-date experiments from the previous statistics store.
+
+    Args:
+        results_df (pd.DataFrame): The metrics table, with scenario and model names.
+        all_metrics (List[Dict]): The metrics of the recomputed experiments.
+        statistics_by_fold (List[Dict[str, np.ndarray]]): The statistics of the
+            recomputed experiments, per dataset fold, in the order of `all_metrics`.
+        stored_keys (pd.DataFrame): The keys of the previous statistics store.
+        stored_statistics (Dict[str, np.ndarray]): The previous statistics.
+    """
+    new_keys = pd.DataFrame(all_metrics, columns=KEY_COLUMNS)
+    keys = pd.concat([stored_keys, new_keys], ignore_index=True)
+    statistics = {}
+    for name in statistics_by_fold[0] if statistics_by_fold else stored_statistics:
+        statistics[name] = np.concatenate(
+            ([stored_statistics[name]] if name in stored_statistics else [])
+            + [fold_statistics[name] for fold_statistics in statistics_by_fold]
+        )
+    # recomputed rows come last, so they replace the stored ones
+    latest = np.flatnonzero(~keys.duplicated(keep="last").to_numpy())
+    # and the rows are saved in the order of the metrics table
+    rows = latest[
+        pd.MultiIndex.from_frame(keys.iloc[latest]).get_indexer(
+            pd.MultiIndex.from_frame(results_df[KEY_COLUMNS])
+        )
+    ]
+    save_statistics_store(
+        paths.STATISTICS_STORE_FPATH,
+        keys.iloc[rows].reset_index(drop=True),
+        {name: values[rows] for name, values in statistics.items()},
+    )
+
+
+def sort_metrics_canonically(
+    results_df: pd.DataFrame, scenarios: List[str], models: List[str]
+) -> pd.DataFrame:
+    """
+    Sort the rows of a metrics table (with scenario and model names) in the canonical
+    dataset_fold, scenario, model order.
+
+    Args:
+        results_df (pd.DataFrame): The metrics table.
+        scenarios (List[str]): The scenario names, in order.
+        models (List[str]): The model names, in order.
+
+    Returns:
+        pd.DataFrame: The sorted metrics table.
+    """
+    canonical_order = {
+        "Dataset_Fold": {name: i for i, name in enumerate(dataset_folds)},
+        "Scenario": {name: i for i, name in enumerate(scenarios)},
+        "Model": {name: i for i, name in enumerate(models)},
+    }
+    return results_df.sort_values(
+        by=["Dataset_Fold", "Scenario", "Model"],
+        key=lambda col: col.map(canonical_order[col.name]),
+    ).reset_index(drop=True)
+
+
+def calculate_metrics(workers: int = 1, incremental: bool = True) -> pd.DataFrame:
     """
     Calculate metrics for a given dataframe.
 
+    Args:
+        workers (int): Number of worker processes. With more than one worker, the
+                       dataset folds are fanned out to a process pool (one fold per
+                       task, so each worker reads a test key once). The results are
+                       always returned in the same order as a serial run.
+        incremental (bool): Only recompute the experiments whose predictions, test key
+                            or schema changed since the last run (or that are new),
+                            according to the manifest next to the metrics file, and
+                            merge them into the existing metrics table.
+
     Returns:
         pd.DataFrame: Dataframe containing metrics.
     """
     print("Calculating metrics on all experiments' predictions...")
-    all_metrics = []
     scenarios = list(scenarios_mapping.keys())
     models = list(models_mapping.keys())
-    total_iterations = len(dataset_folds) * len(scenarios) * len(models)
+    predictions_source = get_predictions_source()
+    log_predictions_source(predictions_source)
+
+    engine_signature = get_engine_signature(METRICS_COLUMNS, predictions_source)
+    cell_signatures = compute_cell_signatures(dataset_folds, scenarios, models)
+    existing = (
+        load_existing_metrics(scenarios, models)
+        if incremental
+        else pd.DataFrame(columns=METRICS_COLUMNS)
+    )
+    existing_cells = [
+        get_cell_key(row.Scenario, row.Model, row.Dataset_Fold)
+        for row in existing.itertuples(index=False)
+    ]
+    stored_keys, stored_statistics = load_statistics_store(
+        paths.STATISTICS_STORE_FPATH, score_histogram_bins
+    )
+    stored_cells = [
+        get_cell_key(row.Scenario, row.Model, row.Dataset_Fold)
+        for row in stored_keys.itertuples(index=False)
+    ]
+    # cells missing from either the metrics table or the statistics store are redone
+    stale_cells = find_stale_cells(
+        load_manifest(paths.METRICS_MANIFEST_FPATH) if incremental else None,
+        engine_signature,
+        cell_signatures,
+        set(existing_cells) & set(stored_cells),
+    )
+
+    # the experiments to compute, per dataset fold
+    experiments_by_fold = {}
+    for dataset_fold in dataset_folds:
+        experiments = [
+            (scenario, model)
+            for scenario in scenarios
+            for model in models
+            if get_cell_key(scenario, model, dataset_fold) in stale_cells
+        ]
+        if experiments:
+            experiments_by_fold[dataset_fold] = experiments
+    total_iterations = len(stale_cells)
+    if total_iterations < len(cell_signatures):
+        print(
+            f"Recomputing {total_iterations} of {len(cell_signatures)} experiments; "
+            "the rest are up to date."
+        )
 
     with tqdm(total=total_iterations, desc="Calculating Metrics", unit="task") as pbar:
-        for dataset_fold in dataset_folds:
-            # read the dataset schema and test key files
-            data_schema, test_key = get_dataset_files(dataset_fold)
-
-            for scenario in scenarios:
-                for model in models:
-                    # Create a ContextFilter with the current dataset_fold, scenario, and model
-                    context_filter = ContextFilter(
-                        dataset=dataset_fold,
-                        scenario=scenario,
-                        model=model,
-                    )
-
-                    # read the predictions
-                    predictions = get_predictions(scenario, dataset_fold, model)
-                    # calculate the metrics
-                    metrics = get_binary_classification_scores(
-                        data_schema,
-                        test_key,
-                        predictions,
-                        context_filter,
-                    )
-                    metrics["Scenario"] = scenario
-                    metrics["Dataset_Fold"] = dataset_fold
-                    metrics["Model"] = model
-                    all_metrics.append(metrics)
-                    pbar.update(1)
-
-    reordered_cols = [
-        "Scenario",
-        "Dataset_Fold",
-        "Model",
-        "Accuracy",
-        "MCC",
-        "Precision",
-        "Recall",
-        "F1-score",
-        "F2-score",
-        "AUC",
-        "PR-AUC",
-        "Log-Loss",
-        "Brier-Score",
+        results_by_fold = run_tasks(
+            calculate_fold_metrics,
+            list(experiments_by_fold.items()),
+            workers,
+            on_result=lambda result: pbar.update(len(result[0])),
+        )
+
+    # flatten in dataset_fold order so the row order is deterministic
+    all_metrics = [
+        metrics for fold_metrics, _ in results_by_fold for metrics in fold_metrics
     ]
-    results_df = pd.DataFrame(all_metrics)[reordered_cols]
+
+    # keep the up-to-date rows of the previous run
+    existing = existing[
+        [cell in cell_signatures and cell not in stale_cells for cell in existing_cells]
+    ]
+    results_df = pd.DataFrame(all_metrics, columns=METRICS_COLUMNS)
+    if not existing.empty:
+        results_df = sort_metrics_canonically(
+            pd.concat([existing, results_df], ignore_index=True).astype(
+                {col: float for col in METRICS_COLUMNS[3:]}
+            ),
+            scenarios,
+            models,
+        )
+
+    save_statistics(
+        results_df,
+        all_metrics,
+        [statistics for _, statistics in results_by_fold],
+        stored_keys,
+        stored_statistics,
+    )
+
     # map scenario names to scenario display names
     results_df["Scenario"] = results_df["Scenario"].map(scenarios_mapping)
     results_df["Model"] = results_df["Model"].map(models_mapping)
     # save the metrics
-    save_dataframe_as_csv(results_df, paths.METRICS_FPATH)
+    results_df = save_metrics_table(results_df)
+    save_manifest(
+        paths.METRICS_MANIFEST_FPATH,
+        engine_signature,
+        cell_signatures,
+        predictions_source,
+    )
     logger.info("Metrics calculated and saved.")
+    return results_df
+
+
+def calculate_metrics_shard(
+    shard: str,
+    datasets: Optional[List[str]] = None,
+    scenarios: Optional[List[str]] = None,
+    models: Optional[List[str]] = None,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Calculate the metrics of one shard of the (filtered) experiment grid and save them
+    as a partial metrics file in the shards directory (see 'metric_shards.py'). Every
+    experiment of the shard is computed; merge the shards with `merge_metrics_shards`.
+
+    Args:
+        shard (str): 'i/N', the i-th (1-based) of N shards.
+        datasets (Optional[List[str]]): Datasets or dataset folds to include (default:
+            all).
+        scenarios (Optional[List[str]]): Scenarios to include (default: all).
+        models (Optional[List[str]]): Models to include (default: all).
+        workers (int): Number of worker processes (one dataset fold per task).
+
+    Returns:
+        pd.DataFrame: The shard's metrics, with scenario and model names.
+    """
+    shard_index, num_shards = parse_shard(shard)
+    predictions_source = get_predictions_source()
+    log_predictions_source(predictions_source)
+    grid_folds, grid_scenarios, grid_models = select_experiment_grid(
+        dataset_folds, scenarios_mapping, models_mapping, datasets, scenarios, models
+    )
+    shard_folds = assign_shard_folds(
+        grid_folds,
+        num_shards,
+        {fold: get_test_key_size(fold) for fold in grid_folds},
+    )[shard_index - 1]
+    print(
+        f"Calculating metrics of shard {shard_index}/{num_shards}: "
+        f"{len(shard_folds)} of {len(grid_folds)} dataset folds..."
+    )
+    experiments = [
+        (scenario, model) for scenario in grid_scenarios for model in grid_models
+    ]
+    with tqdm(
+        total=len(shard_folds) * len(experiments),
+        desc="Calculating Metrics",
+        unit="task",
+    ) as pbar:
+        results_by_fold = run_tasks(
+            calculate_fold_metrics,
+            [(dataset_fold, experiments) for dataset_fold in shard_folds],
+            workers,
+            on_result=lambda result: pbar.update(len(result[0])),
+        )
+
+    results_df = pd.DataFrame(
+        [metrics for fold_metrics, _ in results_by_fold for metrics in fold_metrics],
+        columns=METRICS_COLUMNS,
+    )
+    statistics = {
+        name: np.concatenate(
+            [fold_statistics[name] for _, fold_statistics in results_by_fold]
+        )
+        for name in (results_by_fold[0][1] if results_by_fold else {})
+    }
+    save_metric_shard(
+        paths.METRIC_SHARDS_DIR,
+        shard_index,
+        num_shards,
+        results_df,
+        statistics,
+        {
+            "filters": {"datasets": datasets, "scenarios": scenarios, "models": models},
+            "engine_signature": get_engine_signature(
+                METRICS_COLUMNS, predictions_source
+            ),
+            "predictions_source": predictions_source,
+            "cell_signatures": compute_cell_signatures(
+                shard_folds, grid_scenarios, grid_models
+            ),
+        },
+    )
+    logger.info("Metrics of shard %d/%d calculated and saved.", shard_index, num_shards)
+    return results_df
+
+
+def merge_metrics_shards() -> pd.DataFrame:
+    """
+    Merge the shards in the shards directory into the metrics table, in the canonical
+    order, together with their statistics store and manifest. Fails unless all shards
+    of the same run are complete and cover every experiment of their (filtered) grid
+    exactly once.
+
+    When the shards only cover part of the experiment grid (a filtered run), the
+    other experiments are kept from the existing metrics table and statistics store,
+    provided they were calculated with the same engine (code and predictions source);
+    otherwise nothing is written.
+
+    Returns:
+        pd.DataFrame: Dataframe containing metrics.
+    """
+    print(f"Merging the metric shards in {paths.METRIC_SHARDS_DIR}...")
+    metadata, results_df, statistics = load_metric_shards(
+        paths.METRIC_SHARDS_DIR, METRICS_COLUMNS
+    )
+    engine_signature = metadata["engine_signature"]
+    if engine_signature != get_engine_signature(
+        METRICS_COLUMNS, metadata["predictions_source"]
+    ):
+        raise ValueError("The shards were calculated with different metric code.")
+    grid_folds, grid_scenarios, grid_models = select_experiment_grid(
+        dataset_folds, scenarios_mapping, models_mapping, **metadata["filters"]
+    )
+    expected_cells = {
+        get_cell_key(scenario, model, dataset_fold)
+        for dataset_fold in grid_folds
+        for scenario in grid_scenarios
+        for model in grid_models
+    }
+    cells = [
+        get_cell_key(row.Scenario, row.Model, row.Dataset_Fold)
+        for row in results_df.itertuples(index=False)
+    ]
+    duplicated = len(cells) - len(set(cells))
+    missing = expected_cells - set(cells)
+    extra = set(cells) - expected_cells
+    if duplicated or missing or extra:
+        raise ValueError(
+            f"The shards don't cover the experiment grid exactly once: {duplicated} "
+            f"duplicated, {len(missing)} missing and {len(extra)} unexpected "
+            "experiments."
+        )
+
+    # the experiments outside the shards' grid are kept from the previous run, if it
+    # was calculated with the same engine
+    scenarios = list(scenarios_mapping.keys())
+    models = list(models_mapping.keys())
+    all_cells = {
+        get_cell_key(scenario, model, dataset_fold)
+        for dataset_fold in dataset_folds
+        for scenario in scenarios
+        for model in models
+    }
+    manifest = load_manifest(paths.METRICS_MANIFEST_FPATH)
+    same_engine = manifest is not None and manifest["engine"] == engine_signature
+    existing = (
+        load_existing_metrics(scenarios, models)
+        if same_engine
+        else pd.DataFrame(columns=METRICS_COLUMNS)
+    )
+    stored_keys, stored_statistics = load_statistics_store(
+        paths.STATISTICS_STORE_FPATH, score_histogram_bins
+    )
+    stored_cells = {
+        get_cell_key(row.Scenario, row.Model, row.Dataset_Fold)
+        for row in stored_keys.itertuples(index=False)
+    }
+    existing_cells = [
+        get_cell_key(row.Scenario, row.Model, row.Dataset_Fold)
+        for row in existing.itertuples(index=False)
+    ]
+    kept = [
+        cell in all_cells and cell not in expected_cells and cell in stored_cells
+        for cell in existing_cells
+    ]
+    existing = existing[kept]
+    kept_cells = {cell for cell, keep in zip(existing_cells, kept) if keep}
+    uncovered = all_cells - expected_cells - kept_cells
+    if uncovered:
+        raise ValueError(
+            f"The shards cover {len(expected_cells)} of the {len(all_cells)} "
+            f"experiments, and {len(uncovered)} of the others are not in the metrics "
+            "table calculated with the same metric code and predictions source. Run "
+            "their shards too, or calculate the metrics first; nothing was written."
+        )
+
+    merged_df = sort_metrics_canonically(
+        pd.concat([existing, results_df], ignore_index=True).astype(
+            {col: float for col in METRICS_COLUMNS[3:]}
+        ),
+        scenarios,
+        models,
+    )
+    save_statistics(
+        merged_df,
+        results_df[KEY_COLUMNS].to_dict("records"),
+        [statistics],
+        stored_keys,
+        stored_statistics,
+    )
+    # the input hashes the experiments were calculated from, for later incremental
+    # runs
+    cell_signatures = {
+        cell: manifest["cells"][cell]
+        for cell in kept_cells
+        if cell in manifest["cells"]
+    }
+    cell_signatures.update(metadata["cell_signatures"])
+    # map scenario names to scenario display names
+    merged_df["Scenario"] = merged_df["Scenario"].map(scenarios_mapping)
+    merged_df["Model"] = merged_df["Model"].map(models_mapping)
+    merged_df = save_metrics_table(merged_df)
+    save_manifest(
+        paths.METRICS_MANIFEST_FPATH,
+        engine_signature,
+        cell_signatures,
+        metadata["predictions_source"],
+    )
+    if len(existing):
+        print(
+            f"Merged {len(results_df)} experiments from the shards; kept "
+            f"{len(existing)} from the existing metrics table."
+        )
+    logger.info("Metric shards merged and saved.")
+    return merged_df
+
+
+def calculate_fold_metrics_streaming(
+    dataset_fold: str,
+    experiments: List[Tuple[str, str]],
+    chunk_rows: int,
+) -> Tuple[List[Dict], Dict[str, np.ndarray]]:
+    """
+    Calculate metrics for the given experiments of a single dataset fold, reading the
+    test key and every predictions file in chunks.
+
+    Args:
+        dataset_fold (str): The name of the dataset fold.
+        experiments (List[Tuple[str, str]]): (scenario, model) pairs, in output order.
+        chunk_rows (int): Maximum number of rows read at once.
+
+    Returns:
+        Tuple[List[Dict], Dict[str, np.ndarray]]: One metrics dictionary per
+            experiment, and the experiments' sufficient statistics for the statistics
+            store, both in the given order.
+    """
+    data_schema = get_dataset_schema(dataset_fold)
+    test_key = StreamingTestKey(
+        data_schema, get_test_key_chunks(dataset_fold, chunk_rows)
+    )
+    fold_metrics, experiment_statistics = [], []
+    for scenario, model in experiments:
+        y_pred, y_pred_proba = stream_experiment_predictions(
+            data_schema,
+            test_key,
+            get_predictions_chunks(scenario, dataset_fold, model, chunk_rows),
+            ContextFilter(dataset=dataset_fold, scenario=scenario, model=model),
+        )
+        # scored alone, so only one experiment's predictions are held at a time
+        (metrics,) = score_stacked_predictions(
+            test_key.labels, y_pred[np.newaxis], y_pred_proba[np.newaxis]
+        )
+        metrics["Scenario"] = scenario
+        metrics["Dataset_Fold"] = dataset_fold
+        metrics["Model"] = model
+        fold_metrics.append(metrics)
+        experiment_statistics.append(
+            compute_experiment_statistics(
+                test_key.labels,
+                y_pred[np.newaxis],
+                y_pred_proba[np.newaxis],
+                score_histogram_bins,
+            )
+        )
+    fold_statistics = {
+        name: np.concatenate([statistics[name] for statistics in experiment_statistics])
+        for name in experiment_statistics[0]
+    }
+    return fold_metrics, fold_statistics
+
+
+def calculate_metrics_streaming(
+    workers: int = 1,
+    chunk_rows: int = streaming_chunk_rows,
+) -> pd.DataFrame:
+    """
+    Calculate metrics of every experiment with bounded memory, reading the prediction
+    files and test keys in chunks. The metrics and the statistics store are the same
+    as with `calculate_metrics`.
+
+    Args:
+        workers (int): Number of worker processes (one dataset fold per task).
+        chunk_rows (int): Maximum number of rows read at once.
+
+    Returns:
+        pd.DataFrame: Dataframe containing metrics.
+    """
+    print("Calculating metrics on all experiments' predictions (streaming)...")
+    experiments = [
+        (scenario, model) for scenario in scenarios_mapping for model in models_mapping
+    ]
+    with tqdm(
+        total=len(dataset_folds) * len(experiments),
+        desc="Calculating Metrics",
+        unit="task",
+    ) as pbar:
+        results_by_fold = run_tasks(
+            calculate_fold_metrics_streaming,
+            [(dataset_fold, experiments, chunk_rows) for dataset_fold in dataset_folds],
+            workers,
+            on_result=lambda result: pbar.update(len(result[0])),
+        )
+
+    all_metrics = [
+        metrics for fold_metrics, _ in results_by_fold for metrics in fold_metrics
+    ]
+    results_df = pd.DataFrame(all_metrics, columns=METRICS_COLUMNS)
+    # every experiment is recomputed, so nothing is kept from the previous store
+    save_statistics(
+        results_df,
+        all_metrics,
+        [statistics for _, statistics in results_by_fold],
+        pd.DataFrame(columns=KEY_COLUMNS),
+        {},
+    )
+    # map scenario names to scenario display names
+    results_df["Scenario"] = results_df["Scenario"].map(scenarios_mapping)
+    results_df["Model"] = results_df["Model"].map(models_mapping)
+    results_df = save_metrics_table(results_df)
+    # no input signatures are recorded, so the next incremental run recomputes
+    # everything
+    if os.path.exists(paths.METRICS_MANIFEST_FPATH):
+        os.remove(paths.METRICS_MANIFEST_FPATH)
+    logger.info("Metrics calculated (streaming) and saved.")
+    return results_df
 
 
 if __name__ == "__main__":
-    calculate_metrics()
+    parser = argparse.ArgumentParser(description="Calculate experiment metrics.")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["calculate", "merge"],
+        default="calculate",
+        help="'merge' merges the metric shards into the metrics table "
+        "(default: calculate).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: 1, i.e. run serially).",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Recompute every experiment instead of only the changed or new ones.",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="Read the predictions and test keys in chunks: the memory used does not "
+        "depend on the size of the predictions files.",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        help="Calculate only shard i/N of the experiments (e.g. 1/4) and save it to "
+        "the shards directory, for merging.",
+    )
+    parser.add_argument(
+        "--datasets",
+        nargs="+",
+        default=None,
+        help="Only the experiments of these datasets or dataset folds (with --shard).",
+    )
+    parser.add_argument(
+        "--scenarios",
+        nargs="+",
+        default=None,
+        help="Only the experiments of these scenarios (with --shard).",
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        default=None,
+        help="Only the experiments of these models (with --shard).",
+    )
+    args = parser.parse_args()
+    filters = [args.datasets, args.scenarios, args.models]
+    given_options = {
+        "--workers": args.workers is not None,
+        "--full": args.full,
+        "--streaming": args.streaming,
+        "--shard": args.shard is not None,
+        "--datasets": args.datasets is not None,
+        "--scenarios": args.scenarios is not None,
+        "--models": args.models is not None,
+    }
+    # a filtered run is a single shard
+    sharded = args.shard is not None or any(filters)
+    if args.command == "merge":
+        mode, allowed_options = "merge", []
+    elif args.streaming:
+        mode, allowed_options = "--streaming", ["--workers", "--streaming"]
+    elif sharded:
+        mode = "--shard or the filters"
+        allowed_options = [
+            "--workers",
+            "--shard",
+            "--datasets",
+            "--scenarios",
+            "--models",
+        ]
+    else:
+        mode, allowed_options = "a regular run", ["--workers", "--full"]
+    # options the chosen calculation doesn't use are rejected rather than ignored
+    conflicts = [
+        option
+        for option, given in given_options.items()
+        if given and option not in allowed_options
+    ]
+    if conflicts:
+        parser.error(f"{', '.join(conflicts)} can't be used with {mode}.")
+    workers = 1 if args.workers is None else args.workers
+
+    if args.command == "merge":
+        merge_metrics_shards()
+    elif sharded:
+        calculate_metrics_shard(args.shard or "1/1", *filters, workers=workers)
+    elif args.streaming:
+        calculate_metrics_streaming(workers=workers)
+    else:
+        calculate_metrics(workers=workers, incremental=not args.full)
@@ -1,62 +1,71 @@
 """
 Aggregate and summarize classification metrics from binary class imbalance experiments.
 
-This script processes the raw metrics CSV file generated by the 'f1_calculate_metrics.py' script.
-It merges these metrics with model and dataset metadata, then aggregates them at various 
-levels (overall, by dataset, by model, and by model-dataset combination), computing mean 
-and standard deviation across folds.
+This script processes the raw metrics table generated by the 'f1_calculate_metrics.py' script.
+It merges these metrics with model and dataset metadata, then aggregates them at various
+levels (overall, by dataset, by model, and by model-dataset combination), computing mean
+and standard deviation across folds. Every level is a slice of the results cube (see
+'results_cube.py'): the metrics are summed per fold at the finest level once, and every
+level is derived from these sums (like grouping sets), in one pass.
 
 Prerequisites:
-    - Raw metrics CSV file generated by 'f1_calculate_metrics.py'
+    - Raw metrics table generated by 'f1_calculate_metrics.py'
 
 Usage:
     python f2_summarize_metrics.py
 
+The long (per level) and pivoted forms of the summary are produced in one step, both
+ordered by the configured scenarios, metrics and models.
+
 Outputs:
-    CSV files containing summarized metrics at different aggregation levels.
+    The numeric summary (mean, standard deviation and number of folds) of all aggregation
+    levels, its CSV export per level, and the pivoted "Mean ± Std Dev" tables.
 """
 
 import pandas as pd
-from typing import List, Optional
-
-from utils import read_csv_as_df, save_dataframe_as_csv
-from config.variables import ordered_scenarios, metrics, ordered_models
-from config import paths, variables
-
-
-def prepare_metrics_df_with_metadata(
-    metrics_df: pd.DataFrame,
-    ordered_models: List[str],
-) -> pd.DataFrame:
+from typing import Dict, List, Optional, Tuple
+
+from metrics_summary import (
+    AGGREGATION_LEVELS,
+    format_mean_std,
+    load_metrics_summary,
+    pivot_level_summary,
+    save_metrics_summary,
+)
+from metrics_table import load_metrics_table
+from results_cube import ResultsCube
+from utils import save_dataframe_as_csv
+from config.variables import ordered_scenarios, metrics
+from config import paths
+
+
+def aggregate_metrics_at_levels(
+    metrics_df: pd.DataFrame, ordered_metrics: List[str], levels: List[str]
+) -> Dict[str, pd.DataFrame]:
     """
-    Prepare metrics dataframe with metadata from models and datasets.
+    Aggregate metrics at several levels in one pass: the metrics are summed per fold
+    at the finest level once, and every level is a slice of the results cube.
 
     Args:
-        metrics_df (pd.DataFrame): DataFrame containing the metrics for all experiments.
-        ordered_models List[str]: Ordered list of all models.
+        metrics_df (pd.DataFrame): DataFrame containing the metrics with metadata.
+        ordered_metrics (List[str]): Ordered list of metric names.
+        levels (List[str]): The levels ('overall', 'model', 'dataset' or
+            'model_dataset').
 
     Returns:
-        pd.DataFrame: DataFrame containing the metrics with metadata (e.g., dataset, fold, model order).
+        Dict[str, pd.DataFrame]: Aggregated DataFrame of every level, with columns:
+            'Scenario', 'Metric', the level's group columns (as the index), 'Mean',
+            'Std Dev' and 'N'.
     """
-    prepared_df = metrics_df.copy()
-    prepared_df["Dataset"] = prepared_df["Dataset_Fold"].map(
-        lambda x: x.split("_fold")[0]
-    )
-    prepared_df["Fold"] = prepared_df["Dataset_Fold"].map(lambda x: x[-1]).astype(int)
-
-    # Create a mapping of model names to their order
-    models_order = {model: i for i, model in enumerate(ordered_models)}
-    prepared_df["Model Order"] = prepared_df["Model"].map(models_order)
-    return prepared_df
+    cube = ResultsCube(metrics_df, ordered_metrics)
+    return {level: cube.aggregate(AGGREGATION_LEVELS[level]) for level in levels}
 
 
 def aggregate_metrics(
     metrics_df: pd.DataFrame, ordered_metrics: List[str], by: str = "overall"
 ) -> pd.DataFrame:
     """
-    Aggregate metrics for each scenario and metric. Calculates the mean across models,
-    datasets, for each scenario, metric, and fold. Then calculates the mean and standard
-    deviation across the 5 folds.
+    Aggregate metrics for each scenario and metric at one level.
 
     Args:
         metrics_df (pd.DataFrame): DataFrame containing the metrics for 9000 experiments.
@@ -65,212 +74,88 @@ def aggregate_metrics(
                     Can be 'overall', 'model', 'dataset', or 'model_dataset'.
 
     Returns:
-        pd.DataFrame: Aggregated DataFrame with columns: 'Scenario', 'Metric', 'Mean ± Std Dev'.
+        pd.DataFrame: Aggregated DataFrame with columns: 'Scenario', 'Metric', 'Mean',
+            'Std Dev', 'N'.
     """
-    if by == "overall":
-        groupby_columns = []
-
-    elif by == "model":
-        groupby_columns = ["Model", "Model Order"]
-
-    elif by == "dataset":
-        groupby_columns = ["Dataset"]
-        metrics_df["Dataset"] = metrics_df["Dataset"].str.replace(
-            r"_fold_\d+", "", regex=True
-        )
-
-    elif by == "model_dataset":
-        groupby_columns = ["Model", "Model Order", "Dataset"]
-        metrics_df["Dataset"] = metrics_df["Dataset"].str.replace(
-            r"_fold_\d+", "", regex=True
-        )
-
-    # Calculate the mean across all models and datasets for each scenario, metric, and fold
-    grouped = (
-        metrics_df.groupby(["Scenario", "Fold"] + groupby_columns)[ordered_metrics]
-        .mean()
-        .reset_index()
-    )
-
-    # Calculate the mean and standard deviation across the 5 folds
-    aggregated = (
-        grouped.groupby(["Scenario"] + groupby_columns)[ordered_metrics]
-        .agg(["mean", "std"])
-        .reset_index()
-    )
-
-    # Flatten the multi-level column index created by the aggregation
-    aggregated.columns = ["_".join(col).strip("_") for col in aggregated.columns]
-
-    # Reshape the DataFrame to have 'Scenario', 'Metric', 'Mean ± Std Dev' columns
-    aggregated_melted = aggregated.melt(
-        id_vars=(["Scenario"] + groupby_columns),
-        var_name="metric_stat",
-        value_name="value",
-    )
-
-    # Split the 'metric_stat' column into separate 'metric' and 'stat' columns
-    aggregated_melted[["Metric", "Stat"]] = aggregated_melted["metric_stat"].str.rsplit(
-        "_", n=1, expand=True
-    )
-
-    # Pivot the table to get 'mean' and 'std_dev' as separate columns
-    aggregated_pivot = aggregated_melted.pivot_table(
-        index=["Scenario", "Metric"] + groupby_columns, columns="Stat", values="value"
-    ).reset_index()
-
-    # Combine the mean and standard deviation into a single column
-    aggregated_pivot["Mean ± Std Dev"] = (
-        aggregated_pivot["mean"].round(variables.rounding).astype(str)
-        + " ± "
-        + aggregated_pivot["std"].round(variables.rounding).astype(str)
-    )
-
-    # Drop the 'mean' and 'std' columns as they are now combined
-    aggregated_pivot.drop(columns=["mean", "std"], inplace=True)
-
-    # Set the index back
-    aggregated_pivot.set_index(["Scenario", "Metric"] + groupby_columns, inplace=True)
-
-    return aggregated_pivot
+    return aggregate_metrics_at_levels(metrics_df, ordered_metrics, [by])[by]
 
 
-def summarize_metrics():
+def summarize_metrics(metrics_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Summarize the metrics by aggregating them at various levels (overall, by dataset, by model,
-    and by model-dataset combination) and saving the summarized metrics to CSV files.
-    """
-    orig_metrics = read_csv_as_df(paths.METRICS_FPATH)
-    prepared_metrics_df = prepare_metrics_df_with_metadata(orig_metrics, ordered_models)
-
-    ordered_metrics = [metric["name"] for metric in metrics]
+    and by model-dataset combination) and saving the numeric summary and its CSV exports.
 
-    # Summarize at various levels and save the results
-    aggregated_df = aggregate_metrics(
-        prepared_metrics_df, ordered_metrics, by="overall"
-    )
-    save_dataframe_as_csv(aggregated_df, paths.OVERALL_METRICS_FPATH, index=True)
+    Args:
+        metrics_df (Optional[pd.DataFrame]): The metrics table (default: loaded from disk).
 
-    aggregated_df = aggregate_metrics(
-        prepared_metrics_df, ordered_metrics, by="dataset"
-    )
-    save_dataframe_as_csv(aggregated_df, paths.BY_DATASET_METRICS_FPATH, index=True)
+    Returns:
+        pd.DataFrame: The numeric summary of all levels (see 'metrics_summary.py').
+    """
+    if metrics_df is None:
+        metrics_df = load_metrics_table()
 
-    aggregated_df = aggregate_metrics(prepared_metrics_df, ordered_metrics, by="model")
-    save_dataframe_as_csv(aggregated_df, paths.BY_MODEL_METRICS_FPATH, index=True)
+    ordered_metrics = [metric["name"] for metric in metrics]
 
-    aggregated_df = aggregate_metrics(
-        prepared_metrics_df, ordered_metrics, by="model_dataset"
-    )
-    save_dataframe_as_csv(
-        aggregated_df, paths.BY_MODEL_DATASET_METRICS_FPATH, index=True
+    # Summarize at various levels in one pass and save the results
+    summary = save_metrics_summary(
+        aggregate_metrics_at_levels(
+            metrics_df, ordered_metrics, list(AGGREGATION_LEVELS)
+        )
     )
 
     print("Metrics summarized.")
+    return summary
 
 
-def pivot_and_order_table(
-    df: pd.DataFrame,
-    index_cols: List[str],
-    ordered_scenarios: List[str],
-    ordered_metrics: List[str],
-    models: Optional[List[str]] = None,
-) -> pd.DataFrame:
+def create_pivoted_tables(
+    summary: Optional[pd.DataFrame] = None,
+) -> Dict[str, pd.DataFrame]:
     """
-    Pivot the table and order the columns and rows according to specified orders.
+    Create pivoted tables from the summary, with the "Mean ± Std Dev" text of every
+    scenario, and save them to CSV files.
 
     Args:
-        df (pd.DataFrame): DataFrame to pivot.
-        index_cols (List[str]): Columns to use as the index in the pivot table.
-        ordered_scenarios (List[str]): Ordered list of scenario names.
-        ordered_metrics (List[str]): Ordered list of metric names.
-        models (Optional[List[str]]): Ordered list of model names, if applicable.
+        summary (Optional[pd.DataFrame]): The numeric summary returned by
+            'summarize_metrics' (default: loaded from disk).
 
     Returns:
-        pd.DataFrame: Pivoted and ordered DataFrame.
+        Dict[str, pd.DataFrame]: The pivoted tables by the path they are saved to.
     """
-    # Pivot the table
-    pivoted = df.pivot(index=index_cols, columns="Scenario", values="Mean ± Std Dev")
-
-    # Reorder the columns (scenarios)
-    pivoted = pivoted.reindex(columns=ordered_scenarios)
-
-    # Reset index to make all columns available
-    pivoted.reset_index(inplace=True)
-
-    # Create a sorting key based on the order of metrics and models
-    sort_columns = []
-    if "Metric" in index_cols:
-        pivoted["Metric"] = pd.Categorical(
-            pivoted["Metric"], categories=ordered_metrics, ordered=True
-        )
-        sort_columns.append("Metric")
-
-    if "Dataset" in index_cols or "Dataset" in pivoted.columns:
-        sort_columns.append("Dataset")
-
-    if "Model" in index_cols and models:
-        sort_columns.append("Model Order")
-
-    # Sort the dataframe
-    if sort_columns:
-        pivoted.sort_values(sort_columns, inplace=True)
+    if summary is None:
+        summary = load_metrics_summary()
+
+    pivoted_tables = {}
+    for level, fpath in [
+        ("overall", paths.OVERALL_PIVOTED_METRICS_FPATH),
+        ("dataset", paths.BY_DATASET_PIVOTED_METRICS_FPATH),
+        ("model", paths.BY_MODEL_PIVOTED_METRICS_FPATH),
+        ("model_dataset", paths.BY_MODEL_DATASET_PIVOTED_METRICS_FPATH),
+    ]:
+        means, stds = pivot_level_summary(summary, level)
+        pivoted_tables[fpath] = format_mean_std(means, stds, ordered_scenarios)
+        save_dataframe_as_csv(pivoted_tables[fpath], fpath)
 
-    # Remove the temporary 'Model Order' column if it was created
-    if "Model Order" in pivoted.columns:
-        pivoted.drop("Model Order", axis=1, inplace=True)
-
-    return pivoted
+    print("Pivoted tables created and saved.")
+    return pivoted_tables
 
 
-def create_pivoted_tables():
+def summarize_and_pivot_metrics(
+    metrics_df: Optional[pd.DataFrame] = None,
+) -> Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]:
     """
-    Create pivoted tables from the aggregated metrics and save them to CSV files.
-    """
-    # Read the CSV files
-    overall_df = read_csv_as_df(paths.OVERALL_METRICS_FPATH)
-    by_dataset_df = read_csv_as_df(paths.BY_DATASET_METRICS_FPATH)
-    by_model_df = read_csv_as_df(paths.BY_MODEL_METRICS_FPATH)
-    by_model_dataset_df = read_csv_as_df(paths.BY_MODEL_DATASET_METRICS_FPATH)
-
-    ordered_metrics = [metric["name"] for metric in metrics]
+    Summarize the metrics and pivot the summary in one step, from the in-memory
+    aggregates, saving the summary, its CSV exports and the pivoted tables.
 
-    # Create pivoted tables
-    overall_pivoted = pivot_and_order_table(
-        overall_df, ["Metric"], ordered_scenarios, ordered_metrics
-    )
-    by_dataset_pivoted = pivot_and_order_table(
-        by_dataset_df,
-        ["Metric", "Dataset"],
-        ordered_scenarios,
-        ordered_metrics,
-    )
-    by_model_pivoted = pivot_and_order_table(
-        by_model_df,
-        ["Metric", "Model", "Model Order"],
-        ordered_scenarios,
-        ordered_metrics,
-        ordered_models,
-    )
-    by_model_dataset_pivoted = pivot_and_order_table(
-        by_model_dataset_df,
-        ["Metric", "Dataset", "Model", "Model Order"],
-        ordered_scenarios,
-        ordered_metrics,
-        ordered_models,
-    )
-
-    # Save the pivoted tables
-    save_dataframe_as_csv(overall_pivoted, paths.OVERALL_PIVOTED_METRICS_FPATH)
-    save_dataframe_as_csv(by_dataset_pivoted, paths.BY_DATASET_PIVOTED_METRICS_FPATH)
-    save_dataframe_as_csv(by_model_pivoted, paths.BY_MODEL_PIVOTED_METRICS_FPATH)
-    save_dataframe_as_csv(
-        by_model_dataset_pivoted, paths.BY_MODEL_DATASET_PIVOTED_METRICS_FPATH
-    )
+    Args:
+        metrics_df (Optional[pd.DataFrame]): The metrics table (default: loaded from disk).
 
-    print("Pivoted tables created and saved.")
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, pd.DataFrame]]: The numeric summary of all levels,
+            and the pivoted tables by the path they are saved to.
+    """
+    summary = summarize_metrics(metrics_df)
+    return summary, create_pivoted_tables(summary)
 
 
 if __name__ == "__main__":
-    summarize_metrics()
-    create_pivoted_tables()
+    summarize_and_pivot_metrics()
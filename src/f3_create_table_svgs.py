@@ -1,23 +1,26 @@
 """
 This module generates SVG tables for overall results, results by model, and results by dataset,
-based on CSV files containing pivoted metrics. The tables are styled with customizable parameters 
+based on the numeric summary of the metrics. The tables are styled with customizable parameters 
 including font sizes, background colors, and border settings. The tables highlight specific cells 
 based on the extreme values (e.g., maximum or minimum) within specified columns.
 
 Main components:
 - `filter_df_col_by_val`: Filters a DataFrame by a specific value in a column and optionally 
                           drops the column.
-- `generate_table_svgs`: Reads data from CSV files, applies styling and cell highlighting, 
+- `generate_table_svgs`: Pivots the summary, applies styling and cell highlighting, 
                         and generates SVG tables.
 
 External dependencies:
 - pandas for DataFrame manipulation.
 - matplotlib for plotting.
-- Custom utility modules for reading CSV files and configuring chart settings.
+- Custom utility modules for the metrics summary and configuring chart settings.
 """
 import os
+from typing import Optional
 
-from utils import read_csv_as_df
+import pandas as pd
+
+from metrics_summary import format_mean_std, load_metrics_summary, pivot_level_summary
 from config import paths
 from config.chart_cfg import (
     table_font_size,
@@ -33,7 +36,7 @@ from config.chart_cfg import (
     highlight_color,
 )
 from charts.chart_utils import df_to_svg, find_extreme_cells
-from config.variables import ordered_scenarios, metrics
+from config.variables import ordered_scenarios, metrics, rounding
 
 
 def filter_df_col_by_val(df, col, val, drop_col=True):
@@ -62,7 +65,35 @@ def filter_df_by_min_max_metrics(df, metrics, min_max):
     return filtered_df
 
 
-def generate_table_svgs():
+def get_results_table(summary, level):
+    """
+    Get the "Mean ± Std Dev" table of a level, and its means as shown in the table.
+
+    Args:
+    - summary (pd.DataFrame): The numeric summary of the metrics.
+    - level (str): 'overall', 'dataset' or 'model'.
+
+    Returns:
+    - Tuple[pd.DataFrame, pd.DataFrame]: The table, and its means, rounded.
+    """
+    means, stds = pivot_level_summary(summary, level)
+    rounded_means = means.round({scenario: rounding for scenario in ordered_scenarios})
+    return format_mean_std(means, stds, ordered_scenarios), rounded_means
+
+
+def generate_table_svgs(summary: Optional[pd.DataFrame] = None):
+    """
+    Generate the SVG tables of the overall results and of the results by model and by
+    dataset. The cells with the extreme mean of every row, as rounded in the table, are
+    highlighted.
+
+    Args:
+    - summary (Optional[pd.DataFrame]): The numeric summary of the metrics (default:
+      loaded from disk).
+    """
+    if summary is None:
+        summary = load_metrics_summary()
+
     common_params = {
         "bold_first_row": True,
         "bold_first_col": True,
@@ -79,10 +110,10 @@ def generate_table_svgs():
     }
 
     # Overall results
-    overall_results = read_csv_as_df(paths.OVERALL_PIVOTED_METRICS_FPATH)
+    overall_results, overall_means = get_results_table(summary, "overall")
     highlight_cells = {}
     for min_max in ["min", "max"]:
-        filtered_df = filter_df_by_min_max_metrics(overall_results, metrics, min_max)
+        filtered_df = filter_df_by_min_max_metrics(overall_means, metrics, min_max)
         highlight_cells.update(
             find_extreme_cells(
                 filtered_df,
@@ -107,8 +138,8 @@ def generate_table_svgs():
     )
 
     # Results by model and dataset
-    by_model_results = read_csv_as_df(paths.BY_MODEL_PIVOTED_METRICS_FPATH)
-    by_dataset_results = read_csv_as_df(paths.BY_DATASET_PIVOTED_METRICS_FPATH)
+    by_model_results, by_model_means = get_results_table(summary, "model")
+    by_dataset_results, by_dataset_means = get_results_table(summary, "dataset")
 
     for metric in [m["name"] for m in metrics]:
         # By model results
@@ -121,7 +152,10 @@ def generate_table_svgs():
             else "min"
         )
         highlight_cells = find_extreme_cells(
-            by_model_results_filtered, ordered_scenarios, by="row", extreme=extreme
+            filter_df_col_by_val(by_model_means, "Metric", metric),
+            ordered_scenarios,
+            by="row",
+            extreme=extreme,
         )
         df_to_svg(
             by_model_results_filtered,
@@ -143,7 +177,10 @@ def generate_table_svgs():
             by_dataset_results, "Metric", metric, drop_col=True
         )
         highlight_cells = find_extreme_cells(
-            by_dataset_results_filtered, ordered_scenarios, by="row", extreme=extreme
+            filter_df_col_by_val(by_dataset_means, "Metric", metric),
+            ordered_scenarios,
+            by="row",
+            extreme=extreme,
         )
         df_to_svg(
             by_dataset_results_filtered,
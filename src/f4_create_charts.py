@@ -1,5 +1,9 @@
-from config import paths
+from typing import Optional
+
 import pandas as pd
+
+from config import paths
+from metrics_table import load_metrics_table
 from charts.bar_chart import create_bar_chart
 
 from charts.better_scenario import (
@@ -8,8 +12,9 @@ from charts.better_scenario import (
 )
 
 
-def create_charts():
-    metrics = pd.read_csv(paths.METRICS_FPATH)
+def create_charts(metrics_df: Optional[pd.DataFrame] = None):
+    # the charts add columns to the table, so they get a copy of a table passed in
+    metrics = load_metrics_table() if metrics_df is None else metrics_df.copy()
     create_bar_chart(metrics, paths.BAR_CHART_FPATH)
     create_which_is_better_chart(metrics, paths.WHICH_IS_BETTER_CHART_FPATH)
     create_scenario_impact_chart(metrics, paths.DATASET_IMPACT_CHART, by="Dataset")
@@ -1,7 +1,9 @@
 import os
 import itertools
+from typing import Optional
 import pandas as pd
 from config import paths
+from metrics_table import load_metrics_table
 from config.variables import metrics as metrics_dict
 from scipy.stats import ttest_rel
 from statsmodels.stats.anova import AnovaRM
@@ -16,13 +18,17 @@ def run_anova(
     ordered_metrics = [metric["name"] for metric in metrics_dict]
 
     metrics = (
-        metrics.groupby(["Scenario", "Dataset", "Model"])[ordered_metrics]
+        metrics.groupby(["Scenario", "Dataset", "Model"], observed=True)[
+            ordered_metrics
+        ]
         .mean()
         .reset_index()
     )
 
     metrics = (
-        metrics.groupby(["Scenario", "Dataset"])[ordered_metrics].mean().reset_index()
+        metrics.groupby(["Scenario", "Dataset"], observed=True)[ordered_metrics]
+        .mean()
+        .reset_index()
     )
 
     metrics = metrics.melt(
@@ -58,13 +64,17 @@ def run_paired_t_tests(
     ordered_metrics = [metric["name"] for metric in metrics_dict]
 
     metrics = (
-        metrics.groupby(["Scenario", "Dataset", "Model"])[ordered_metrics]
+        metrics.groupby(["Scenario", "Dataset", "Model"], observed=True)[
+            ordered_metrics
+        ]
         .mean()
         .reset_index()
     )
 
     metrics = (
-        metrics.groupby(["Scenario", "Dataset"])[ordered_metrics].mean().reset_index()
+        metrics.groupby(["Scenario", "Dataset"], observed=True)[ordered_metrics]
+        .mean()
+        .reset_index()
     )
 
     metrics = metrics.melt(
@@ -72,7 +82,11 @@ def run_paired_t_tests(
     )
 
     metrics = metrics.pivot_table(
-        index="Dataset", columns=["Scenario", "Metric"], values="Value", aggfunc="mean"
+        index="Dataset",
+        columns=["Scenario", "Metric"],
+        values="Value",
+        aggfunc="mean",
+        observed=True,
     )
 
     groups = metrics.columns.levels[0]
@@ -114,8 +128,9 @@ def run_paired_t_tests(
     print("Paired t-test results saved to", save_dir_path)
 
 
-def run_statistical_tests() -> None:
-    metrics = pd.read_csv(paths.METRICS_FPATH)
+def run_statistical_tests(metrics_df: Optional[pd.DataFrame] = None) -> None:
+    # the tests add columns to the table, so they get a copy of a table passed in
+    metrics = load_metrics_table() if metrics_df is None else metrics_df.copy()
     run_anova(metrics)
     run_paired_t_tests(metrics)
 
@@ -1,29 +1,127 @@
+import atexit
+import contextvars
+import json
 import logging
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
+# The experiment context (dataset, scenario, model) of the records logged by the
+# current thread or task.
+_log_context: contextvars.ContextVar[Dict[str, Optional[str]]] = contextvars.ContextVar(
+    "log_context", default={}
+)
+
+# The queue that the records of this process and its worker processes are sent to,
+# and the listener thread that writes them.
+_log_queue = None
+_log_listener: Optional[QueueListener] = None
+
+CONTEXT_FIELDS = ["dataset", "scenario", "model"]
+
+
+class ContextFilter:
+    """
+    Context info (dataset, scenario, model) of the log records of one experiment.
+
+    Used as a context manager, it sets the context of every record logged inside the
+    block. The context is kept in a contextvar, so concurrent tasks never see each
+    other's context and no logger has to be modified: `LogContextFilter`, on the
+    handler, stamps it onto the records.
+    """
 
-class ContextFilter(logging.Filter):
     def __init__(self, dataset=None, scenario=None, model=None):
-        super().__init__()
         self.dataset = dataset
         self.scenario = scenario
         self.model = model
+        self._tokens = []
+
+    def __enter__(self) -> "ContextFilter":
+        self._tokens.append(
+            _log_context.set({field: getattr(self, field) for field in CONTEXT_FIELDS})
+        )
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        _log_context.reset(self._tokens.pop())
+
+
+class LogContextFilter(logging.Filter):
+    """Stamps the current experiment context onto every record."""
 
     def filter(self, record):
-        record.dataset = self.dataset
-        record.scenario = self.scenario
-        record.model = self.model
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
         return True
 
 
+class JsonLinesFormatter(logging.Formatter):
+    """Formats every record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+        return json.dumps(entry)
+
+
+def _use_log_queue(log_queue) -> None:
+    """Send the records of the root logger to the queue."""
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter())
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.INFO)
+
+
 def setup_logging(log_file_path: str):
     """
     Set up logging configuration to log to a file and disable console logging.
 
+    The records are written as JSON lines. Logging calls only put the record on a
+    queue; a listener thread writes them to the file, so the calls never block on
+    file I/O. Worker processes send their records to the same queue (see
+    `configure_worker_logging`). Like `logging.basicConfig`, this does nothing if the
+    root logger already has handlers.
+
     Args:
         log_file_path (str): The path to the log file.
     """
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[logging.FileHandler(log_file_path)],
-    )
+    global _log_queue, _log_listener
+    if logging.getLogger().handlers:
+        return
+    file_handler = logging.FileHandler(log_file_path)
+    file_handler.setFormatter(JsonLinesFormatter())
+    _log_queue = multiprocessing.Queue(-1)
+    _log_listener = QueueListener(_log_queue, file_handler)
+    _log_listener.start()
+    # flush the queue before the interpreter exits
+    atexit.register(_log_listener.stop)
+    _use_log_queue(_log_queue)
+
+
+def get_log_queue():
+    """The queue of the logging set up by `setup_logging` (None if not set up)."""
+    return _log_queue
+
+
+def configure_worker_logging(log_queue) -> None:
+    """
+    Initializer of worker processes: send their records to the parent process's log
+    queue, which its listener thread writes.
+
+    Args:
+        log_queue: The parent's queue from `get_log_queue`, or None to leave the
+            worker's logging as it is.
+    """
+    if log_queue is not None:
+        _use_log_queue(log_queue)
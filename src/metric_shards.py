@@ -0,0 +1,273 @@
+"""
+Sharded metric calculation across machines, and the merge of the shards.
+
+The experiment grid (optionally filtered by dataset, scenario and model) is split into
+N shards of whole dataset folds, so that every shard reads a test key once. The split
+only depends on the grid and on the size of the test keys, so every node computes the
+same split without any coordination: node i runs shard i/N and writes its partial
+results to the shards directory on a shared file system. The metric values don't depend
+on the node either (ties between the class probabilities are broken by a fixed rule,
+see 'metrics.predict_positive_class'), so merged shards match a single-node run.
+
+Every shard writes three files, named after the shard ('all_metrics_shard_i_of_N'):
+
+    .csv    its rows of the metrics table (scenario and model names, not display
+            names)
+    .npz    the sufficient statistics of these rows (see 'statistics_store.py')
+    .json   the shard's metadata: number of shards, filters, engine signature,
+            predictions source (store or CSV files) and the input hashes of its
+            experiments. It is written last, so a shard without
+            it is incomplete.
+
+The merge validates that all N shards of the same grid and engine are complete and
+that every experiment of the grid is in exactly one of them.
+"""
+
+import glob
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from statistics_store import KEY_COLUMNS, load_statistics_store, save_statistics_store
+from utils import read_csv_as_df, save_dataframe_as_csv
+
+SHARD_FORMAT_VERSION = 2
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification.
+
+    Args:
+        shard (str): 'i/N', the i-th (1-based) of N shards.
+
+    Returns:
+        Tuple[int, int]: The shard index and the number of shards.
+    """
+    try:
+        shard_index, num_shards = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{shard}': expected 'i/N', e.g. '1/4'.")
+    if not 1 <= shard_index <= num_shards:
+        raise ValueError(f"Invalid shard '{shard}': i must be between 1 and N.")
+    return shard_index, num_shards
+
+
+def _select(
+    names: List[str], display_names: Dict[str, str], selection: Optional[List[str]]
+) -> List[str]:
+    """The names that are selected by name or display name, in their own order."""
+    if not selection:
+        return list(names)
+    unknown = set(selection) - set(names) - {display_names.get(n) for n in names}
+    if unknown:
+        raise ValueError(f"Unknown names in filter: {sorted(unknown)}.")
+    return [
+        name
+        for name in names
+        if name in selection or display_names.get(name) in selection
+    ]
+
+
+def select_experiment_grid(
+    dataset_folds: List[str],
+    scenarios_mapping: Dict[str, str],
+    models_mapping: Dict[str, str],
+    datasets: Optional[List[str]] = None,
+    scenarios: Optional[List[str]] = None,
+    models: Optional[List[str]] = None,
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Filter the experiment grid, keeping its canonical order.
+
+    Args:
+        dataset_folds (List[str]): All dataset folds.
+        scenarios_mapping (Dict[str, str]): All scenario names and display names.
+        models_mapping (Dict[str, str]): All model names and display names.
+        datasets (Optional[List[str]]): Datasets (e.g. 'abalone_binarized') or dataset
+            folds to keep (default: all).
+        scenarios (Optional[List[str]]): Scenario names or display names to keep
+            (default: all).
+        models (Optional[List[str]]): Model names or display names to keep (default:
+            all).
+
+    Returns:
+        Tuple[List[str], List[str], List[str]]: The selected dataset folds, scenarios
+            and models.
+    """
+    fold_datasets = {fold: fold.split("_fold")[0] for fold in dataset_folds}
+    return (
+        _select(dataset_folds, fold_datasets, datasets),
+        _select(list(scenarios_mapping), scenarios_mapping, scenarios),
+        _select(list(models_mapping), models_mapping, models),
+    )
+
+
+def assign_shard_folds(
+    dataset_folds: List[str], num_shards: int, fold_sizes: Dict[str, int]
+) -> List[List[str]]:
+    """
+    Split the dataset folds into shards of about the same total test key size. The
+    largest folds are assigned first, each to the shard with the smallest total so
+    far; ties are broken by name and shard index, so the split is deterministic.
+
+    Args:
+        dataset_folds (List[str]): The dataset folds, in canonical order.
+        num_shards (int): The number of shards.
+        fold_sizes (Dict[str, int]): The size of every fold's test key.
+
+    Returns:
+        List[List[str]]: The dataset folds of every shard, in canonical order.
+    """
+    totals = [0] * num_shards
+    assignment = {}
+    for fold in sorted(dataset_folds, key=lambda fold: (-fold_sizes[fold], fold)):
+        shard = min(range(num_shards), key=lambda i: (totals[i], i))
+        assignment[fold] = shard
+        totals[shard] += fold_sizes[fold]
+    return [
+        [fold for fold in dataset_folds if assignment[fold] == shard]
+        for shard in range(num_shards)
+    ]
+
+
+def get_shard_fpath(shards_dir: str, shard_index: int, num_shards: int, ext: str):
+    """Path of one of the files of a shard."""
+    return os.path.join(
+        shards_dir, f"all_metrics_shard_{shard_index}_of_{num_shards}.{ext}"
+    )
+
+
+def save_metric_shard(
+    shards_dir: str,
+    shard_index: int,
+    num_shards: int,
+    results_df: pd.DataFrame,
+    statistics: Dict[str, np.ndarray],
+    metadata: Dict,
+) -> None:
+    """
+    Save the partial results of a shard.
+
+    Args:
+        shards_dir (str): The shards directory.
+        shard_index (int): The shard's index (1-based).
+        num_shards (int): The number of shards.
+        results_df (pd.DataFrame): The shard's rows of the metrics table.
+        statistics (Dict[str, np.ndarray]): The statistics of these rows.
+        metadata (Dict): The filters, engine signature, predictions source and input
+            hashes of the shard's experiments.
+    """
+    os.makedirs(shards_dir, exist_ok=True)
+    metadata_fpath = get_shard_fpath(shards_dir, shard_index, num_shards, "json")
+    # an older run of this shard is incomplete until its metadata is rewritten
+    if os.path.exists(metadata_fpath):
+        os.remove(metadata_fpath)
+    # the metrics are kept with full precision until they are merged
+    save_dataframe_as_csv(
+        results_df,
+        get_shard_fpath(shards_dir, shard_index, num_shards, "csv"),
+        decimals=4,
+    )
+    save_statistics_store(
+        get_shard_fpath(shards_dir, shard_index, num_shards, "npz"),
+        results_df[KEY_COLUMNS],
+        statistics,
+    )
+    tmp_path = f"{metadata_fpath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": SHARD_FORMAT_VERSION,
+                "shard_index": shard_index,
+                "num_shards": num_shards,
+                "experiments": len(results_df),
+                **metadata,
+            },
+            f,
+            indent=1,
+            sort_keys=True,
+        )
+    os.replace(tmp_path, metadata_fpath)
+
+
+def load_metric_shards(
+    shards_dir: str, columns: List[str]
+) -> Tuple[Dict, pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    Load and validate the shards: every shard of the same run (number of shards,
+    filters, engine signature and predictions source) must be complete, with the expected columns.
+
+    Args:
+        shards_dir (str): The shards directory.
+        columns (List[str]): The expected columns of the metrics table.
+
+    Returns:
+        Tuple[Dict, pd.DataFrame, Dict[str, np.ndarray]]: The metadata of the run
+            (with the input hashes of all shards' experiments), the shards' rows and
+            their statistics, shard after shard.
+    """
+    metadata_fpaths = sorted(
+        glob.glob(os.path.join(shards_dir, "all_metrics_shard_*_of_*.json"))
+    )
+    if not metadata_fpaths:
+        raise FileNotFoundError(f"No complete metric shards in {shards_dir}.")
+    shards = []
+    for fpath in metadata_fpaths:
+        with open(fpath, "r", encoding="utf-8") as f:
+            shards.append(json.load(f))
+
+    run_fields = [
+        "version",
+        "num_shards",
+        "filters",
+        "engine_signature",
+        "predictions_source",
+    ]
+    runs = {json.dumps([shard.get(f) for f in run_fields]) for shard in shards}
+    if len(runs) > 1:
+        raise ValueError(
+            f"The shards in {shards_dir} come from different runs (number of shards, "
+            "filters, metric code or predictions source). Remove the stale shard files and merge again."
+        )
+    num_shards = shards[0]["num_shards"]
+    found = sorted(shard["shard_index"] for shard in shards)
+    missing = sorted(set(range(1, num_shards + 1)) - set(found))
+    if missing:
+        raise ValueError(
+            f"Shards {missing} of {num_shards} are missing or incomplete in "
+            f"{shards_dir}."
+        )
+
+    frames, statistics_parts, cell_signatures = [], [], {}
+    for shard in sorted(shards, key=lambda shard: shard["shard_index"]):
+        shard_index = shard["shard_index"]
+        frame = read_csv_as_df(
+            get_shard_fpath(shards_dir, shard_index, num_shards, "csv")
+        )
+        if list(frame.columns) != columns:
+            raise ValueError(f"Shard {shard_index} has unexpected columns.")
+        keys, statistics = load_statistics_store(
+            get_shard_fpath(shards_dir, shard_index, num_shards, "npz")
+        )
+        if (
+            len(frame) != shard["experiments"]
+            or len(keys) != len(frame)
+            or (keys.to_numpy() != frame[KEY_COLUMNS].astype(str).to_numpy()).any()
+        ):
+            raise ValueError(f"Shard {shard_index}'s files don't match each other.")
+        frames.append(frame)
+        if len(keys):
+            statistics_parts.append(statistics)
+        cell_signatures.update(shard["cell_signatures"])
+
+    metadata = {field: shards[0][field] for field in run_fields}
+    metadata["cell_signatures"] = cell_signatures
+    statistics = {
+        name: np.concatenate([part[name] for part in statistics_parts])
+        for name in (statistics_parts[0] if statistics_parts else {})
+    }
+    return metadata, pd.concat(frames, ignore_index=True), statistics
@@ -1,125 +1,854 @@
 import pandas as pd
 import numpy as np
-from sklearn.metrics import (
-    accuracy_score,
-    f1_score,
-    precision_score,
-    recall_score,
-    roc_auc_score,
-    fbeta_score,
-    precision_recall_curve,
-    auc,
-    log_loss,
-    brier_score_loss,
-    matthews_corrcoef,
-)
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 import logging
 
+from config.variables import metrics as metrics_dict
 from logging_config import ContextFilter
 
 logger = logging.getLogger(__name__)
 
 
-def get_binary_classification_scores(
-    data_schema: dict,
-    test_key: pd.DataFrame,
-    predictions: pd.DataFrame,
-    context_filter: ContextFilter,
-):
+def _safe_divide(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+    """Element-wise division giving 0 where the denominator is 0 (sklearn's zero_division=0)."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(
+        numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0
+    )
+
+
+# The sufficient statistics that metrics are computed from. Each one is built once per
+# batch of experiments, however many registered metrics use it.
+CONFUSION = "confusion"  # ConfusionCounts at the applied decision threshold
+RANKING = "ranking"  # ScoreCurves from the sorted scores
+CALIBRATION = "calibration"  # CalibrationBins of the probabilities
+PROBABILITIES = "probabilities"  # ProbabilityRows, the raw per-row probabilities
+
+# Number of equal-width probability bins of the calibration statistic.
+CALIBRATION_BINS = 10
+
+
+class ConfusionCounts(NamedTuple):
+    """Confusion counts of any shape, e.g. per experiment, threshold or resample."""
+
+    tp: np.ndarray
+    fp: np.ndarray
+    fn: np.ndarray
+    tn: np.ndarray
+
+
+class ScoreCurves(NamedTuple):
+    """
+    Cumulative false and true positive counts along the decreasing sorted scores, of
+    shape (curves, positions). `is_threshold` marks the positions that end a run of
+    equal scores and `previous` holds the position of the previous threshold. Both are
+    None when the curves are already reduced to their thresholds.
+    """
+
+    fps: np.ndarray
+    tps: np.ndarray
+    is_threshold: Optional[np.ndarray] = None
+    previous: Optional[np.ndarray] = None
+
+
+class CalibrationBins(NamedTuple):
+    """
+    Per probability bin (last axis): the number of rows, the sum of their positive
+    class probabilities and the number of positive rows among them.
+    """
+
+    counts: np.ndarray
+    proba_sums: np.ndarray
+    positives: np.ndarray
+
+
+class ProbabilityRows(NamedTuple):
+    """
+    The true labels (rows,) and positive class probabilities (experiments, rows), with
+    optional (resamples, rows) weights for weighted means over the rows.
+    """
+
+    y_true: np.ndarray
+    y_pred_proba: np.ndarray
+    weights: Optional[np.ndarray] = None
+
+    def mean(self, row_values: np.ndarray) -> np.ndarray:
+        """(Weighted) mean of per-row values over the rows."""
+        if self.weights is None:
+            return np.mean(row_values, axis=-1)
+        return row_values @ self.weights.T / self.y_true.size
+
+
+class MetricDefinition(NamedTuple):
+    """
+    A registered metric, the sufficient statistic it is computed from, and whether
+    its higher values are better.
     """
-    Calculates various metrics given the test_key, predictions, and schema file.
+
+    name: str
+    statistic: str
+    compute: Callable[[Any], np.ndarray]
+    greater_is_better: bool
+
+
+# Registered metrics, in the column order of the metrics table.
+METRIC_REGISTRY: Dict[str, MetricDefinition] = {}
+
+
+def register_metric(
+    name: str,
+    statistic: str,
+    greater_is_better: bool = True,
+) -> Callable[[Callable], Callable]:
+    """
+    Decorator registering a metric function. The function receives the statistic it
+    declares (one of CONFUSION, RANKING, CALIBRATION or PROBABILITIES) and returns the
+    metric value for every experiment.
 
     Args:
-        data_schema (dict): Dictionary containing data schema.
-        test_key (pd.DataFrame): Dataframe containing test key.
-        predictions (pd.DataFrame): Dataframe containing predictions.
-        context_filter (ContextFilter): Logging filter with context info (dataset, scenario, model).
+        name (str): The metric name, used as its column in the metrics table.
+        statistic (str): The sufficient statistic the metric is computed from.
+        greater_is_better (bool): Whether higher values of the metric are better.
 
     Returns:
-        dict: JSON object with metric names as keys and metric values as values.
+        Callable[[Callable], Callable]: The decorator.
     """
-    logger.addFilter(context_filter)  # Add the context filter to the logger
-    logger.info(
-        "Starting metric calculation for dataset: %s, scenario: %s, model: %s",
-        context_filter.dataset,
-        context_filter.scenario,
-        context_filter.model,
+
+    def decorator(compute: Callable) -> Callable:
+        METRIC_REGISTRY[name] = MetricDefinition(
+            name, statistic, compute, greater_is_better
+        )
+        return compute
+
+    return decorator
+
+
+def get_metric_names(statistic: Optional[str] = None) -> List[str]:
+    """Names of the registered metrics, optionally only those using one statistic."""
+    return [
+        name
+        for name, definition in METRIC_REGISTRY.items()
+        if statistic is None or definition.statistic == statistic
+    ]
+
+
+def check_summary_metrics(summary_metrics: List[Dict[str, str]]) -> None:
+    """
+    Check the summarized metrics (the `metrics` entries of 'config/variables.py')
+    against the registry: every metric must be registered once, and its "max" or
+    "min" must agree with whether its higher values are better.
+
+    Args:
+        summary_metrics (List[Dict[str, str]]): The metric names and "min_max".
+
+    Raises:
+        ValueError: If a metric is unknown, repeated or has the wrong "min_max".
+    """
+    names = [metric["name"] for metric in summary_metrics]
+    repeated = sorted({name for name in names if names.count(name) > 1})
+    unknown = [name for name in names if name not in METRIC_REGISTRY]
+    misdirected = [
+        metric["name"]
+        for metric in summary_metrics
+        if metric["name"] in METRIC_REGISTRY
+        and metric["min_max"]
+        != ("max" if METRIC_REGISTRY[metric["name"]].greater_is_better else "min")
+    ]
+    if repeated or unknown or misdirected:
+        raise ValueError(
+            "The summarized metrics in config/variables.py don't match the metric "
+            f"registry: repeated {repeated}, unregistered {unknown}, wrong "
+            f"'min_max' {misdirected}."
+        )
+
+
+def evaluate_metrics(
+    statistics: Dict[str, Any], metric_names: Optional[List[str]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Evaluate registered metrics from already computed sufficient statistics.
+
+    Args:
+        statistics (Dict[str, Any]): The statistics, keyed by statistic kind.
+        metric_names (Optional[List[str]]): The metrics to evaluate (default: all).
+
+    Returns:
+        Dict[str, np.ndarray]: Metric names as keys and metric values as values.
+    """
+    if metric_names is None:
+        metric_names = get_metric_names()
+    return {
+        name: METRIC_REGISTRY[name].compute(statistics[METRIC_REGISTRY[name].statistic])
+        for name in metric_names
+    }
+
+
+def confusion_counts(y_true: np.ndarray, y_pred: np.ndarray) -> ConfusionCounts:
+    """
+    Build the binary confusion counts of several experiments scored on the same rows.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred (np.ndarray): Binary (0/1) predicted labels, shape (experiments, rows).
+
+    Returns:
+        ConfusionCounts: True positives, false positives, false negatives and true
+            negatives per experiment.
+    """
+    y_true = np.asarray(y_true) == 1
+    y_pred = np.asarray(y_pred) == 1
+    tp = np.count_nonzero(y_pred & y_true, axis=-1)
+    fp = np.count_nonzero(y_pred, axis=-1) - tp
+    fn = np.count_nonzero(y_true) - tp
+    tn = y_true.size - tp - fp - fn
+    return ConfusionCounts(tp, fp, fn, tn)
+
+
+def ranked_score_curves(
+    y_true: np.ndarray, y_score: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort every experiment's scores once (in decreasing order) and return the cumulative
+    false and true positive counts at every position, with a mask of the positions
+    that end a run of equal scores, i.e. the distinct score thresholds. This is the
+    shared input for the ranking metrics and the threshold sweep.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_score (np.ndarray): Predicted probabilities of the positive class, shape
+            (experiments, rows).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Cumulative false
+            positives, cumulative true positives, the sorted scores and the threshold
+            mask, each of shape (experiments, rows).
+    """
+    order = np.argsort(y_score, axis=-1, kind="stable")[:, ::-1]
+    sorted_score = np.take_along_axis(y_score, order, axis=-1)
+    tps = np.cumsum(np.asarray(y_true, dtype=np.int64)[order], axis=-1)
+    fps = np.arange(1, y_score.shape[-1] + 1) - tps
+
+    is_threshold = np.ones(y_score.shape, dtype=bool)
+    is_threshold[:, :-1] = sorted_score[:, :-1] != sorted_score[:, 1:]
+    return fps, tps, sorted_score, is_threshold
+
+
+def _previous_threshold_positions(is_threshold: np.ndarray) -> np.ndarray:
+    """Position of the previous threshold point for every position (-1 if none)."""
+    positions = np.where(is_threshold, np.arange(is_threshold.shape[-1]), -1)
+    previous = np.empty_like(positions)
+    previous[:, 0] = -1
+    np.maximum.accumulate(positions[:, :-1], axis=-1, out=previous[:, 1:])
+    return previous
+
+
+def score_curves(y_true: np.ndarray, y_score: np.ndarray) -> ScoreCurves:
+    """The RANKING statistic: `ranked_score_curves` plus the previous thresholds."""
+    fps, tps, _, is_threshold = ranked_score_curves(y_true, y_score)
+    return ScoreCurves(
+        fps, tps, is_threshold, _previous_threshold_positions(is_threshold)
     )
 
-    # Extract necessary fields from the schema
-    id_field = data_schema["id"]["name"]
-    target_class = str(data_schema["target"]["classes"][1])
-    target_field = data_schema["target"]["name"]
-    target_classes = data_schema["target"]["classes"]
 
-    # Extract true labels
-    Y = test_key[target_field].astype(str)
-    obs_class_names = list(set(Y))
+def probability_bins(y_pred_proba: np.ndarray, bins: int) -> np.ndarray:
+    """
+    Bin of every probability in `bins` equal-width bins over [0, 1] (1.0 is in the
+    last bin). Probabilities within 1e-6 of a bin edge are snapped to the edge before
+    flooring, so that rounding errors (e.g. 0.57 * 100 = 56.99999999999999, or 0.7
+    stored as float32) don't move them to the bin below.
+    """
+    scaled = np.asarray(y_pred_proba, dtype=np.float64) * bins
+    edges = np.round(scaled)
+    scaled = np.where(np.abs(scaled - edges) < bins * 1e-6, edges, scaled)
+    return np.clip(np.floor(scaled).astype(np.int64), 0, bins - 1)
+
 
-    # Rename prediction columns to match class names
-    pred_class_names = [str(c) for c in predictions[obs_class_names]]
-    predictions.columns = [str(c) for c in list(predictions.columns)]
+def calibration_bins(
+    y_true: np.ndarray,
+    y_pred_proba: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+) -> CalibrationBins:
+    """
+    The CALIBRATION statistic: bin every experiment's probabilities into
+    CALIBRATION_BINS equal-width bins and sum the rows, probabilities and positives
+    per bin.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+        weights (Optional[np.ndarray]): (resamples, rows) row weights; the sums are
+            then weighted and get a resamples axis.
+
+    Returns:
+        CalibrationBins: Sums of shape (experiments, bins), or
+            (experiments, resamples, bins) with weights.
+    """
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred_proba = np.asarray(y_pred_proba, dtype=np.float64)
+    bins = probability_bins(y_pred_proba, CALIBRATION_BINS)
+    num_experiments = len(y_pred_proba)
+
+    if weights is None:
+        # offset every experiment's bins so one bincount sums them all
+        flat_bins = (
+            bins + np.arange(num_experiments)[:, np.newaxis] * CALIBRATION_BINS
+        ).ravel()
+        shape = (num_experiments, CALIBRATION_BINS)
+        minlength = num_experiments * CALIBRATION_BINS
+        return CalibrationBins(
+            np.bincount(flat_bins, minlength=minlength).reshape(shape),
+            np.bincount(flat_bins, y_pred_proba.ravel(), minlength).reshape(shape),
+            np.bincount(
+                flat_bins, np.broadcast_to(y_true, bins.shape).ravel(), minlength
+            ).reshape(shape),
+        )
 
-    # Apply decision threshold if available
+    sums = []
+    for experiment_bins, proba in zip(bins, y_pred_proba):
+        one_hot = np.zeros((y_true.size, CALIBRATION_BINS))
+        one_hot[np.arange(y_true.size), experiment_bins] = 1.0
+        sums.append(
+            (
+                weights @ one_hot,
+                weights @ (one_hot * proba[:, np.newaxis]),
+                weights @ (one_hot * y_true[:, np.newaxis]),
+            )
+        )
+    return CalibrationBins(*(np.stack(statistic) for statistic in zip(*sums)))
+
+
+def _at_positions(
+    values: np.ndarray, positions: Optional[np.ndarray], initial: float
+) -> np.ndarray:
+    """
+    Gather `values` at `positions`, using `initial` where the position is -1. Without
+    positions, every position's previous position is the one before it.
+    """
+    if positions is None:
+        initial_column = np.full((len(values), 1), initial, dtype=values.dtype)
+        return np.concatenate([initial_column, values[:, :-1]], axis=-1)
+    gathered = np.take_along_axis(values, np.maximum(positions, 0), axis=-1)
+    return np.where(positions >= 0, gathered, initial)
+
+
+def _sum_at_thresholds(
+    values: np.ndarray, is_threshold: Optional[np.ndarray]
+) -> np.ndarray:
+    """Sum `values` along the row axis over the threshold positions only."""
+    if is_threshold is None:
+        return values.sum(axis=-1)
+    return np.where(is_threshold, values, 0).sum(axis=-1)
+
+
+def _precision_recall(curves: ScoreCurves) -> Tuple[np.ndarray, np.ndarray]:
+    """Precision and recall at every position of the score curves."""
+    fps, tps = curves.fps, curves.tps
+    positives = tps[:, -1:]
+    # thresholds without any (weighted) row above them stay at the curve's start
+    precision = _safe_divide(tps, tps + fps)
+    precision[tps + fps == 0] = 1.0
+    recall = _safe_divide(tps, np.broadcast_to(positives, tps.shape))
+    recall[positives[:, 0] == 0] = 1.0
+    return precision, recall
+
+
+@register_metric("Accuracy", CONFUSION)
+def accuracy(counts: ConfusionCounts) -> np.ndarray:
+    """Fraction of correctly predicted rows."""
+    tp, fp, fn, tn = counts
+    return (tp + tn) / (tp + fp + fn + tn)
+
+
+@register_metric("MCC", CONFUSION)
+def matthews_corrcoef(counts: ConfusionCounts) -> np.ndarray:
+    """Matthews correlation coefficient, 0 when any margin of the counts is empty."""
+    tp, fp, fn, tn = counts
+    denominator = np.sqrt(
+        np.asarray(tp + fp, dtype=np.float64) * (tp + fn) * (tn + fp) * (tn + fn)
+    )
+    return _safe_divide(tp * tn - fp * fn, denominator)
+
+
+@register_metric("Precision", CONFUSION)
+def precision(counts: ConfusionCounts) -> np.ndarray:
+    """Fraction of the predicted positives that are positive, 0 without any."""
+    return _safe_divide(counts.tp, counts.tp + counts.fp)
+
+
+@register_metric("Recall", CONFUSION)
+def recall(counts: ConfusionCounts) -> np.ndarray:
+    """Fraction of the positives that are predicted positive, 0 without any."""
+    return _safe_divide(counts.tp, counts.tp + counts.fn)
+
+
+@register_metric("F1-score", CONFUSION)
+def f1_score(counts: ConfusionCounts) -> np.ndarray:
+    """Harmonic mean of precision and recall."""
+    tp, fp, fn, _ = counts
+    return _safe_divide(2 * tp, 2 * tp + fp + fn)
+
+
+@register_metric("F2-score", CONFUSION)
+def f2_score(counts: ConfusionCounts) -> np.ndarray:
+    """F-beta score with beta = 2, weighting recall higher than precision."""
+    tp, fp, fn, _ = counts
+    return _safe_divide(5 * tp, 5 * tp + 4 * fn + fp)
+
+
+@register_metric("AUC", RANKING)
+def roc_auc(curves: ScoreCurves) -> np.ndarray:
+    """
+    Area under the ROC curve. The trapezoids between consecutive thresholds are summed
+    in (possibly weighted) counts, so the result is the exact area, rounded once. It
+    is NaN for curves with one class only.
+    """
+    fps, tps, is_threshold, previous = curves
+    negatives, positives = fps[:, -1], tps[:, -1]
+    trapezoids = (fps - _at_positions(fps, previous, 0)) * (
+        tps + _at_positions(tps, previous, 0)
+    )
+    twice_area = _sum_at_thresholds(trapezoids, is_threshold)
+    denominator = 2.0 * negatives * positives
+    return np.divide(
+        twice_area,
+        denominator,
+        out=np.full(denominator.shape, np.nan),
+        where=denominator > 0,
+    )
+
+
+@register_metric("PR-AUC", RANKING)
+def pr_auc(curves: ScoreCurves) -> np.ndarray:
+    """
+    Area under the precision-recall curve (trapezoidal, as sklearn's
+    precision_recall_curve + auc).
+    """
+    precision, recall = _precision_recall(curves)
+    # the curve starts at (recall 0, precision 1)
+    trapezoids = (
+        (recall - _at_positions(recall, curves.previous, 0.0))
+        * (precision + _at_positions(precision, curves.previous, 1.0))
+        / 2.0
+    )
+    return _sum_at_thresholds(trapezoids, curves.is_threshold)
+
+
+@register_metric("Log-Loss", PROBABILITIES, greater_is_better=False)
+def log_loss(rows: ProbabilityRows) -> np.ndarray:
+    """Mean negative log-likelihood, with the probabilities clipped to [eps, 1 - eps]."""
+    eps = np.finfo(rows.y_pred_proba.dtype).eps
+    clipped = np.clip(rows.y_pred_proba, eps, 1 - eps)
+    y_true = rows.y_true
+    return rows.mean(-(y_true * np.log(clipped) + (1 - y_true) * np.log1p(-clipped)))
+
+
+@register_metric("Brier-Score", PROBABILITIES, greater_is_better=False)
+def brier_score(rows: ProbabilityRows) -> np.ndarray:
+    """Mean squared difference between the labels and the probabilities."""
+    return rows.mean((rows.y_true - rows.y_pred_proba) ** 2)
+
+
+@register_metric("Balanced Accuracy", CONFUSION)
+def balanced_accuracy(counts: ConfusionCounts) -> np.ndarray:
+    """Mean of the recall of the positive and of the negative class."""
+    tp, fp, fn, tn = counts
+    return (_safe_divide(tp, tp + fn) + _safe_divide(tn, tn + fp)) / 2
+
+
+@register_metric("G-Mean", CONFUSION)
+def geometric_mean(counts: ConfusionCounts) -> np.ndarray:
+    """Geometric mean of the recall of the positive and of the negative class."""
+    tp, fp, fn, tn = counts
+    return np.sqrt(_safe_divide(tp, tp + fn) * _safe_divide(tn, tn + fp))
+
+
+@register_metric("Cohen's Kappa", CONFUSION)
+def cohen_kappa(counts: ConfusionCounts) -> np.ndarray:
+    """Cohen's kappa, 0 when the expected agreement is already perfect."""
+    tp, fp, fn, tn = counts
+    total = tp + fp + fn + tn
+    # observed and chance agreement, both scaled by total**2
+    chance = np.asarray(tp + fp, dtype=np.float64) * (tp + fn) + np.asarray(
+        fn + tn, dtype=np.float64
+    ) * (fp + tn)
+    return _safe_divide(total * (tp + tn) - chance, total * total - chance)
+
+
+@register_metric("Average Precision", RANKING)
+def average_precision(curves: ScoreCurves) -> np.ndarray:
+    """Step-wise area under the precision-recall curve, as sklearn's average_precision_score."""
+    precision, recall = _precision_recall(curves)
+    steps = (recall - _at_positions(recall, curves.previous, 0.0)) * precision
+    return _sum_at_thresholds(steps, curves.is_threshold)
+
+
+@register_metric("ECE", CALIBRATION, greater_is_better=False)
+def expected_calibration_error(bins: CalibrationBins) -> np.ndarray:
+    """Expected calibration error over CALIBRATION_BINS equal-width bins."""
+    gaps = np.abs(bins.proba_sums - bins.positives).sum(axis=-1)
+    return _safe_divide(gaps, bins.counts.sum(axis=-1))
+
+
+# every metric of the summaries must be registered above
+check_summary_metrics(metrics_dict)
+
+
+def compute_binary_metrics_batch(
+    y_true: np.ndarray,
+    y_pred: np.ndarray,
+    y_pred_proba: np.ndarray,
+    metric_names: Optional[List[str]] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Fused metric engine for several experiments scored on the same rows, e.g. all the
+    scenario/model predictions of a dataset fold stacked into matrices. Each
+    sufficient statistic that the requested metrics need is computed once for all
+    experiments (the confusion counts, a single sort of each experiment's scores, the
+    calibration bins), and every metric is derived from them.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred (np.ndarray): Binary (0/1) predicted labels, shape (experiments, rows).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+        metric_names (Optional[List[str]]): The metrics to compute (default: all
+            registered metrics).
+
+    Returns:
+        Dict[str, np.ndarray]: Metric names as keys and (unrounded) metric values, one
+            per experiment, as values.
+    """
+    if metric_names is None:
+        metric_names = get_metric_names()
+    needed = {METRIC_REGISTRY[name].statistic for name in metric_names}
+    y_true = np.asarray(y_true, dtype=np.float64)
+    y_pred_proba = np.asarray(y_pred_proba)
+
+    statistics = {}
+    if CONFUSION in needed:
+        statistics[CONFUSION] = confusion_counts(y_true, y_pred)
+    if RANKING in needed:
+        if y_true.all() or not y_true.any():
+            raise ValueError(
+                "Only one class present in y_true. ROC AUC score is not defined in that case."
+            )
+        statistics[RANKING] = score_curves(y_true, y_pred_proba)
+    if CALIBRATION in needed:
+        statistics[CALIBRATION] = calibration_bins(y_true, y_pred_proba)
+    if PROBABILITIES in needed:
+        statistics[PROBABILITIES] = ProbabilityRows(
+            y_true, y_pred_proba.astype(np.float64)
+        )
+    return evaluate_metrics(statistics, metric_names)
+
+
+def compute_binary_metrics(
+    y_true: np.ndarray, y_pred: np.ndarray, y_pred_proba: np.ndarray
+) -> Dict[str, float]:
+    """
+    Compute every registered metric for a single experiment, with the same engine as
+    `compute_binary_metrics_batch`.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels.
+        y_pred (np.ndarray): Binary (0/1) predicted labels.
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class.
+
+    Returns:
+        Dict[str, float]: Metric names as keys and (unrounded) metric values as values.
+    """
+    metric_values = compute_binary_metrics_batch(
+        y_true,
+        np.asarray(y_pred)[np.newaxis],
+        np.asarray(y_pred_proba, dtype=np.float64)[np.newaxis],
+    )
+    return {name: float(values[0]) for name, values in metric_values.items()}
+
+
+def apply_decision_threshold(
+    predictions: pd.DataFrame, target_classes: List
+) -> np.ndarray:
+    """
+    Assign predicted classes by comparing the positive class probability against the
+    `decision_threshold` column in a single vectorized comparison. The threshold may
+    vary from row to row.
+
+    Class labels are handled as strings so that schema classes such as "True"/"False"
+    line up with boolean or numeric labels in the prediction and test key files.
+
+    Args:
+        predictions (pd.DataFrame): Predictions with string column names, including a
+                                    column per class and a `decision_threshold` column.
+        target_classes (List): The [negative, positive] classes from the schema.
+
+    Returns:
+        np.ndarray: Predicted class label (as a string) for every row.
+    """
+    negative_class, positive_class = (str(c) for c in target_classes)
+    positive_proba = predictions[positive_class].to_numpy(dtype=np.float64)
+    thresholds = predictions["decision_threshold"].to_numpy(dtype=np.float64)
+    return np.where(positive_proba >= thresholds, positive_class, negative_class)
+
+
+class TestKeyIndex:
+    """
+    A test key prepared once per dataset fold for aligning many prediction files:
+    an id -> position index plus the integer-encoded (0/1) true labels.
+    """
+
+    def __init__(self, data_schema: dict, test_key: pd.DataFrame):
+        self.id_field = data_schema["id"]["name"]
+        self.positive_class = str(data_schema["target"]["classes"][1])
+
+        target = test_key[data_schema["target"]["name"]].astype(str)
+        self.observed_classes = get_observed_classes(
+            data_schema["target"]["classes"], target.unique()
+        )
+        self.labels = (target == self.positive_class).to_numpy(dtype=np.int8)
+        self.ids = pd.Index(test_key[self.id_field])
+        if not self.ids.is_unique:
+            raise ValueError(f"Test key has duplicate values in '{self.id_field}'.")
+
+    def align(self, prediction_ids: np.ndarray) -> np.ndarray:
+        """
+        Map prediction ids to their positions in the test key with a vectorized lookup.
+
+        Missing, duplicate and extra ids are all collected and reported together.
+
+        Args:
+            prediction_ids (np.ndarray): The ids of the prediction rows.
+
+        Returns:
+            np.ndarray: The test key position of every prediction row.
+        """
+        positions = self.ids.get_indexer(prediction_ids)
+        extra = np.asarray(prediction_ids)[positions < 0]
+        counts = np.bincount(positions[positions >= 0], minlength=len(self.ids))
+        check_alignment(self.ids[counts == 0], self.ids[counts > 1], extra)
+        return positions
+
+
+def check_alignment(
+    missing: np.ndarray,
+    duplicated: np.ndarray,
+    extra: np.ndarray,
+    num_extra: Optional[int] = None,
+) -> None:
+    """
+    Raise a single error reporting all the test key ids missing from the predictions,
+    duplicated in them, and the prediction ids that are not in the test key.
+    `num_extra` is the number of extra ids when `extra` only holds some of them.
+    """
+    num_extra = len(extra) if num_extra is None else num_extra
+    problems = [
+        f"{count} {kind} ids (e.g. {values[:5].tolist()})"
+        for kind, values, count in (
+            ("missing", missing, len(missing)),
+            ("duplicated", duplicated, len(duplicated)),
+            ("extra", extra, num_extra),
+        )
+        if count
+    ]
+    if problems:
+        raise ValueError(
+            "Predictions don't match the test key: " + ", ".join(problems) + "."
+        )
+
+
+def get_observed_classes(target_classes: List, labels: Iterable[str]) -> List[str]:
+    """
+    The schema classes present in the test key labels, in the schema's order (so it
+    doesn't depend on the order labels are seen in, nor on string hashing).
+
+    Args:
+        target_classes (List): The [negative, positive] classes from the schema.
+        labels (Iterable[str]): The test key labels, as strings.
+
+    Returns:
+        List[str]: The observed classes.
+    """
+    labels = set(labels)
+    return [str(c) for c in target_classes if str(c) in labels]
+
+
+def predict_positive_class(
+    predictions: pd.DataFrame, target_classes: List, observed_classes: List[str]
+) -> np.ndarray:
+    """
+    Decide for every row whether the positive class is predicted: by the
+    `decision_threshold` column when there is one, otherwise by the highest class
+    probability. Ties go to the positive class, as with a decision threshold of 0.5.
+    When the test key has a single class, every row is predicted as that class.
+
+    The baseline took the `idxmax` over the classes of a Python set, so ties went to
+    whichever class the string hash put first and the metrics changed with
+    PYTHONHASHSEED; the fixed rule makes them reproducible across processes and
+    machines.
+
+    Args:
+        predictions (pd.DataFrame): Predictions with string column names.
+        target_classes (List): The [negative, positive] classes from the schema.
+        observed_classes (List[str]): The classes present in the test key
+            (see `get_observed_classes`).
+
+    Returns:
+        np.ndarray: Boolean mask of the rows predicted as the positive class.
+    """
+    negative_class, positive_class = (str(c) for c in target_classes)
     if "decision_threshold" in predictions.columns:
         logger.debug("Applying decision threshold.")
-        predictions["__pred_class"] = predictions.apply(
-            lambda row: target_classes[1]
-            if row[target_classes[1]] >= row["decision_threshold"]
-            else target_classes[0],
-            axis=1,
-        )
-    else:
-        predictions["__pred_class"] = pd.DataFrame(
-            predictions[pred_class_names], columns=pred_class_names
-        ).idxmax(axis=1)
+        return apply_decision_threshold(predictions, target_classes) == positive_class
+    if len(observed_classes) == 1:
+        return np.full(len(predictions), observed_classes[0] == positive_class)
 
-    # Merge predictions with the true labels
-    predictions = predictions.merge(test_key[[id_field, target_field]], on=[id_field])
-    Y_hat = predictions["__pred_class"].astype(str)
+    positive_proba = predictions[positive_class].to_numpy()
+    negative_proba = predictions[negative_class].to_numpy()
+    return positive_proba >= negative_proba
 
-    # Check for all negative predictions
-    if len(set(Y_hat)) == 1:
-        logger.warning("All predictions are of a single class: %s", Y_hat.iloc[0])
 
-    # Convert to binary labels for metric calculation
-    y_true = np.where(Y == target_class, 1.0, 0.0)
-    y_pred = np.where(Y_hat == target_class, 1.0, 0.0)
-    y_pred_proba = predictions[target_class].values
+def stack_fold_predictions(
+    data_schema: dict,
+    test_key_index: TestKeyIndex,
+    experiment_predictions: List[pd.DataFrame],
+    context_filters: List[ContextFilter],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Align the predictions of several experiments on the same dataset fold to the test
+    key and stack them into (experiments x rows) matrices.
 
+    Args:
+        data_schema (dict): Dictionary containing data schema.
+        test_key_index (TestKeyIndex): The dataset fold's test key prepared for
+            alignment.
+        experiment_predictions (List[pd.DataFrame]): The predictions of every
+            experiment.
+        context_filters (List[ContextFilter]): Logging context info (dataset,
+            scenario, model) for every experiment.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The boolean positive class predictions and the
+            positive class probabilities, in the test key's row order.
+    """
+    target_classes = data_schema["target"]["classes"]
+    positive_class = str(target_classes[1])
+    shape = (len(experiment_predictions), len(test_key_index.ids))
+
+    y_pred = np.empty(shape, dtype=bool)
+    y_pred_proba = np.empty(shape, dtype=np.float64)
+    for i, (predictions, context_filter) in enumerate(
+        zip(experiment_predictions, context_filters)
+    ):
+        with context_filter:  # log with the experiment's context
+            logger.info(
+                "Starting metric calculation for dataset: %s, scenario: %s, model: %s",
+                context_filter.dataset,
+                context_filter.scenario,
+                context_filter.model,
+            )
+            # Rename prediction columns to match class names
+            predictions.columns = [str(c) for c in list(predictions.columns)]
+            positions = test_key_index.align(
+                predictions[test_key_index.id_field].to_numpy()
+            )
+            predicted_positive = predict_positive_class(
+                predictions, target_classes, test_key_index.observed_classes
+            )
+
+            # Check for all negative predictions
+            if predicted_positive.all() or not predicted_positive.any():
+                logger.warning(
+                    "All predictions are of a single class: %s",
+                    str(target_classes[int(predicted_positive[0])]),
+                )
+
+            # Scatter the experiment into the test key's row order
+            y_pred[i, positions] = predicted_positive
+            y_pred_proba[i, positions] = predictions[positive_class].to_numpy()
+    return y_pred, y_pred_proba
+
+
+def get_fold_classification_scores(
+    data_schema: dict,
+    test_key_index: TestKeyIndex,
+    experiment_predictions: List[pd.DataFrame],
+    context_filters: List[ContextFilter],
+) -> List[Dict[str, float]]:
+    """
+    Calculates the metrics of several experiments on the same dataset fold in one
+    batch. The experiments are stacked with `stack_fold_predictions` and all metrics
+    are computed along the row axis at once.
+
+    Args:
+        data_schema (dict): Dictionary containing data schema.
+        test_key_index (TestKeyIndex): The dataset fold's test key prepared for
+            alignment.
+        experiment_predictions (List[pd.DataFrame]): The predictions of every
+            experiment.
+        context_filters (List[ContextFilter]): Logging filter with context info
+            (dataset, scenario, model) for every experiment.
+
+    Returns:
+        List[Dict[str, float]]: Metric names as keys and metric values as values, for
+            every experiment in the given order.
+    """
+    y_pred, y_pred_proba = stack_fold_predictions(
+        data_schema, test_key_index, experiment_predictions, context_filters
+    )
+    return score_stacked_predictions(test_key_index.labels, y_pred, y_pred_proba)
+
+
+def score_stacked_predictions(
+    y_true: np.ndarray, y_pred: np.ndarray, y_pred_proba: np.ndarray
+) -> List[Dict[str, float]]:
+    """
+    Calculates the rounded metrics of experiments stacked with
+    `stack_fold_predictions`.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred (np.ndarray): Binary (0/1) predicted labels, shape (experiments, rows).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+
+    Returns:
+        List[Dict[str, float]]: Metric names as keys and metric values as values, for
+            every experiment in the given order.
+    """
     logger.debug("Calculating metrics.")
-    # Calculate metrics with zero_division parameter
-    accuracy = accuracy_score(y_true, y_pred)
-    precision = precision_score(y_true, y_pred, zero_division=0)
-    recall = recall_score(y_true, y_pred, zero_division=0)
-    f1 = f1_score(y_true, y_pred, zero_division=0)
-    f2 = fbeta_score(y_true, y_pred, beta=2, zero_division=0)
-
-    # ROC-AUC score
-    roc_auc = roc_auc_score(y_true, y_pred_proba)
-
-    # PR-AUC score
-    precision_curve, recall_curve, _ = precision_recall_curve(y_true, y_pred_proba)
-    pr_auc = auc(recall_curve, precision_curve)
-
-    logloss = log_loss(y_true, y_pred_proba)
-    brier = brier_score_loss(y_true, y_pred_proba)
-    mcc = matthews_corrcoef(y_true, y_pred)
-
-    # Compile all metrics into a dictionary
-    scores = {
-        "Accuracy": np.round(accuracy, 4),
-        "Precision": np.round(precision, 4),
-        "Recall": np.round(recall, 4),
-        "F1-score": np.round(f1, 4),
-        "F2-score": np.round(f2, 4),
-        "AUC": np.round(roc_auc, 4),
-        "PR-AUC": np.round(pr_auc, 4),
-        "Log-Loss": np.round(logloss, 4),
-        "Brier-Score": np.round(brier, 4),
-        "MCC": np.round(mcc, 4),
-    }
+    metric_values = compute_binary_metrics_batch(y_true, y_pred, y_pred_proba)
+    logger.info("Metric calculation complete for %d experiments.", len(y_pred))
+    return [
+        {name: np.round(values[i], 4) for name, values in metric_values.items()}
+        for i in range(len(y_pred))
+    ]
+
+
+def get_binary_classification_scores(
+    data_schema: dict,
+    test_key: pd.DataFrame,
+    predictions: pd.DataFrame,
+    context_filter: ContextFilter,
+    test_key_index: Optional[TestKeyIndex] = None,
+):
+    """
+    Calculates various metrics given the test_key, predictions, and schema file.
+
+    Args:
+        data_schema (dict): Dictionary containing data schema.
+        test_key (pd.DataFrame): Dataframe containing test key.
+        predictions (pd.DataFrame): Dataframe containing predictions.
+        context_filter (ContextFilter): Logging filter with context info (dataset, scenario, model).
+        test_key_index (Optional[TestKeyIndex]): The test key prepared for alignment.
+            Pass it when scoring several prediction files against the same test key,
+            so it is only built once.
 
-    logger.info("Metric calculation complete.")
-    logger.removeFilter(context_filter)
-    return scores
+    Returns:
+        dict: JSON object with metric names as keys and metric values as values.
+    """
+    if test_key_index is None:
+        test_key_index = TestKeyIndex(data_schema, test_key)
+    return get_fold_classification_scores(
+        data_schema, test_key_index, [predictions], [context_filter]
+    )[0]
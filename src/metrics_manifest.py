@@ -0,0 +1,150 @@
+"""
+Content-hash manifest for incremental metric calculation.
+
+The manifest records, for every (scenario, model, dataset_fold) cell of the experiment
+grid, a hash of the cell's inputs: its predictions file, and the dataset's schema and
+test key. It also records an engine signature covering the source of every module
+that reads the inputs or computes the metric values, the output columns, and the
+source the predictions were read from ('store' or 'csv', see
+'predictions_store.get_predictions_source'). On the next run only the cells whose hash
+changed (or that are new) need to be recomputed; a changed engine signature
+invalidates every cell, so rows computed by different code or from different sources
+are never mixed.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Set
+
+from predictions_store import read_predictions_signature
+from utils import get_dataset_signature
+
+MANIFEST_VERSION = 1
+
+# The modules that read the inputs or compute the metric values, relative to src/
+ENGINE_MODULES = [
+    "f1_calculate_metrics.py",
+    "metrics.py",
+    "predictions_store.py",
+    "statistics_store.py",
+    "streaming_metrics.py",
+    "utils.py",
+]
+
+
+def get_cell_key(scenario: str, model: str, dataset_fold: str) -> str:
+    """Key of an experiment cell in the manifest."""
+    return f"{scenario}/{model}/{dataset_fold}"
+
+
+def get_engine_signature(columns: List[str], predictions_source: str) -> str:
+    """
+    Signature of the code, data source and output format that produce the metrics
+    table.
+
+    Args:
+        columns (List[str]): The columns of the metrics table.
+        predictions_source (str): Where the predictions are read from ('store' or
+            'csv').
+
+    Returns:
+        str: Hash of the engine modules' source, the predictions source and the
+            column list.
+    """
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for module in ENGINE_MODULES:
+        with open(os.path.join(src_dir, module), "rb") as f:
+            digest.update(f.read())
+    digest.update(predictions_source.encode("utf-8"))
+    digest.update(",".join(columns).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def compute_cell_signatures(
+    dataset_folds: List[str], scenarios: List[str], models: List[str]
+) -> Dict[str, str]:
+    """
+    Hash the inputs of every cell of the experiment grid.
+
+    Args:
+        dataset_folds (List[str]): The dataset folds.
+        scenarios (List[str]): The scenario names.
+        models (List[str]): The model names.
+
+    Returns:
+        Dict[str, str]: Input hash per cell key.
+    """
+    cell_signatures = {}
+    for dataset_fold in dataset_folds:
+        dataset_signature = get_dataset_signature(dataset_fold)
+        for scenario in scenarios:
+            for model in models:
+                predictions_signature = read_predictions_signature(
+                    scenario, dataset_fold, model
+                )
+                cell_signatures[get_cell_key(scenario, model, dataset_fold)] = (
+                    hashlib.sha1(
+                        f"{dataset_signature};{predictions_signature}".encode("utf-8")
+                    ).hexdigest()
+                )
+    return cell_signatures
+
+
+def load_manifest(manifest_path: str) -> Optional[Dict]:
+    """Load the manifest, or return None if it doesn't exist or has another version."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(
+    manifest_path: str,
+    engine_signature: str,
+    cell_signatures: Dict[str, str],
+    predictions_source: str,
+) -> None:
+    """Write the manifest atomically, so an interrupted run never leaves half of it."""
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "engine": engine_signature,
+        "predictions_source": predictions_source,
+        "cells": cell_signatures,
+    }
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def find_stale_cells(
+    manifest: Optional[Dict],
+    engine_signature: str,
+    cell_signatures: Dict[str, str],
+    available_cells: Set[str],
+) -> Set[str]:
+    """
+    Find the cells that need to be (re)computed.
+
+    Args:
+        manifest (Optional[Dict]): The manifest of the previous run, if any.
+        engine_signature (str): The current engine signature.
+        cell_signatures (Dict[str, str]): The current input hash per cell key.
+        available_cells (Set[str]): Cells with a row in the existing metrics table.
+
+    Returns:
+        Set[str]: Keys of the cells to compute.
+    """
+    if manifest is None or manifest["engine"] != engine_signature:
+        return set(cell_signatures)
+    previous = manifest["cells"]
+    return {
+        cell
+        for cell, signature in cell_signatures.items()
+        if previous.get(cell) != signature or cell not in available_cells
+    }
@@ -0,0 +1,239 @@
+"""
+The numeric summary of the metrics: the mean, standard deviation and number of folds of
+every metric, per scenario, at every aggregation level (overall, by dataset, by model and
+by model-dataset combination).
+
+The summary is stored as one Feather file (one row per level, scenario, metric and
+group), which is the source of truth of the summary tables. The per-level summary CSV
+files are numeric exports of it. The "Mean ± Std Dev" text of the pivoted tables and of
+the SVG tables is only formatted when they are rendered.
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import config.paths as paths
+from config.variables import metrics, ordered_models, ordered_scenarios, rounding
+from utils import save_dataframe_as_csv
+
+# The columns grouped by at every aggregation level
+AGGREGATION_LEVELS = {
+    "overall": [],
+    "dataset": ["Dataset"],
+    "model": ["Model", "Model Order"],
+    "model_dataset": ["Model", "Model Order", "Dataset"],
+}
+
+# The rows of the pivoted tables of every level
+PIVOT_INDEX_COLUMNS = {
+    "overall": ["Metric"],
+    "dataset": ["Metric", "Dataset"],
+    "model": ["Metric", "Model", "Model Order"],
+    "model_dataset": ["Metric", "Dataset", "Model", "Model Order"],
+}
+
+# The files the numeric summary of every level is exported to
+SUMMARY_FPATHS = {
+    "overall": paths.OVERALL_METRICS_FPATH,
+    "dataset": paths.BY_DATASET_METRICS_FPATH,
+    "model": paths.BY_MODEL_METRICS_FPATH,
+    "model_dataset": paths.BY_MODEL_DATASET_METRICS_FPATH,
+}
+
+STATISTIC_COLUMNS = ["Mean", "Std Dev", "N"]
+DIMENSION_COLUMNS = ["Level", "Scenario", "Metric", "Model", "Dataset"]
+
+# decimals of the CSV exports
+CSV_EXPORT_DECIMALS = 4
+
+
+def save_metrics_summary(level_summaries: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Save the summaries of all levels as one Feather file (via a temporary file), and
+    export every level's summary as CSV.
+
+    Args:
+        level_summaries (Dict[str, pd.DataFrame]): The summary of every level, indexed
+            by 'Scenario', 'Metric' and the level's group columns, with the 'Mean',
+            'Std Dev' and 'N' columns.
+
+    Returns:
+        pd.DataFrame: The typed summary that was saved.
+    """
+    for level, summary in level_summaries.items():
+        save_dataframe_as_csv(
+            summary, SUMMARY_FPATHS[level], decimals=CSV_EXPORT_DECIMALS, index=True
+        )
+    summary = pd.concat(
+        [
+            summary.reset_index().assign(Level=level)
+            for level, summary in level_summaries.items()
+        ],
+        ignore_index=True,
+    )
+    summary = summary[
+        ["Level", "Scenario", "Metric", "Model", "Model Order", "Dataset"]
+        + STATISTIC_COLUMNS
+    ].astype(
+        {
+            **{column: "category" for column in DIMENSION_COLUMNS},
+            "Model Order": "Int64",
+            "Mean": "float64",
+            "Std Dev": "float64",
+            "N": "int64",
+        }
+    )
+    os.makedirs(os.path.dirname(paths.METRICS_SUMMARY_FPATH), exist_ok=True)
+    tmp_path = f"{paths.METRICS_SUMMARY_FPATH}.tmp"
+    summary.to_feather(tmp_path)
+    os.replace(tmp_path, paths.METRICS_SUMMARY_FPATH)
+    return summary
+
+
+def load_metrics_summary() -> pd.DataFrame:
+    """
+    Load the summary of all levels.
+
+    Returns:
+        pd.DataFrame: The typed summary.
+    """
+    return pd.read_feather(paths.METRICS_SUMMARY_FPATH)
+
+
+def get_level_summary(summary: pd.DataFrame, level: str) -> pd.DataFrame:
+    """
+    Select the summary of one level.
+
+    Args:
+        summary (pd.DataFrame): The summary of all levels.
+        level (str): 'overall', 'dataset', 'model' or 'model_dataset'.
+
+    Returns:
+        pd.DataFrame: The level's summary, with the 'Scenario', 'Metric' and group
+            columns (as plain values) and the statistics.
+    """
+    level_summary = summary.loc[
+        summary["Level"] == level,
+        ["Scenario", "Metric"] + AGGREGATION_LEVELS[level] + STATISTIC_COLUMNS,
+    ]
+    return level_summary.astype(
+        {
+            column: "int64" if column == "Model Order" else str
+            for column in ["Scenario", "Metric"] + AGGREGATION_LEVELS[level]
+        }
+    ).reset_index(drop=True)
+
+
+def pivot_and_order_table(
+    df: pd.DataFrame,
+    index_cols: List[str],
+    ordered_scenarios: List[str],
+    ordered_metrics: List[str],
+    models: Optional[List[str]] = None,
+    values: str = "Mean",
+) -> pd.DataFrame:
+    """
+    Pivot the table and order the columns and rows according to specified orders.
+
+    Args:
+        df (pd.DataFrame): DataFrame to pivot.
+        index_cols (List[str]): Columns to use as the index in the pivot table.
+        ordered_scenarios (List[str]): Ordered list of scenario names.
+        ordered_metrics (List[str]): Ordered list of metric names.
+        models (Optional[List[str]]): Ordered list of model names, if applicable.
+        values (str): The column with the values of the cells.
+
+    Returns:
+        pd.DataFrame: Pivoted and ordered DataFrame.
+    """
+    # Pivot the table
+    pivoted = df.pivot(index=index_cols, columns="Scenario", values=values)
+
+    # Reorder the columns (scenarios)
+    pivoted = pivoted.reindex(columns=ordered_scenarios)
+
+    # Reset index to make all columns available
+    pivoted.reset_index(inplace=True)
+
+    # Create a sorting key based on the order of metrics and models
+    sort_columns = []
+    if "Metric" in index_cols:
+        pivoted["Metric"] = pd.Categorical(
+            pivoted["Metric"], categories=ordered_metrics, ordered=True
+        )
+        sort_columns.append("Metric")
+
+    if "Dataset" in index_cols or "Dataset" in pivoted.columns:
+        sort_columns.append("Dataset")
+
+    if "Model" in index_cols and models:
+        sort_columns.append("Model Order")
+
+    # Sort the dataframe
+    if sort_columns:
+        pivoted.sort_values(sort_columns, inplace=True)
+
+    # Remove the temporary 'Model Order' column if it was created
+    if "Model Order" in pivoted.columns:
+        pivoted.drop("Model Order", axis=1, inplace=True)
+
+    return pivoted
+
+
+def pivot_level_summary(
+    summary: pd.DataFrame, level: str
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Pivot the means and the standard deviations of one level, with a column per
+    scenario. Both tables have the same rows, in the same order and with the same
+    index.
+
+    Args:
+        summary (pd.DataFrame): The summary of all levels.
+        level (str): 'overall', 'dataset', 'model' or 'model_dataset'.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The pivoted means and standard deviations.
+    """
+    level_summary = get_level_summary(summary, level)
+    ordered_metrics = [metric["name"] for metric in metrics]
+    models = ordered_models if "Model" in AGGREGATION_LEVELS[level] else None
+    return tuple(
+        pivot_and_order_table(
+            level_summary,
+            PIVOT_INDEX_COLUMNS[level],
+            ordered_scenarios,
+            ordered_metrics,
+            models,
+            values=values,
+        )
+        for values in ["Mean", "Std Dev"]
+    )
+
+
+def format_mean_std(
+    means: pd.DataFrame, stds: pd.DataFrame, columns: List[str]
+) -> pd.DataFrame:
+    """
+    Format the cells of the given columns as "Mean ± Std Dev" text, rounded to the
+    configured number of decimals. Cells without a mean are left empty.
+
+    Args:
+        means (pd.DataFrame): Table of means.
+        stds (pd.DataFrame): Table of standard deviations, with the same rows.
+        columns (List[str]): The columns to format.
+
+    Returns:
+        pd.DataFrame: The table of means, with the columns formatted.
+    """
+    formatted = means.copy()
+    for column in columns:
+        text = (
+            means[column].round(rounding).astype(str)
+            + " ± "
+            + stds[column].round(rounding).astype(str)
+        )
+        formatted[column] = text.where(means[column].notna())
+    return formatted
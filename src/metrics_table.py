@@ -0,0 +1,73 @@
+"""
+The canonical metrics table: one row per experiment, with its scenario, dataset fold
+and model (display names) and every registered metric.
+
+The table is stored as a Feather file: the dimensions are categorical columns and the
+metrics are float64 columns, so it loads quickly and exactly as it was computed.
+'all_metrics.csv' is written next to it as an export only; the pipeline reads the
+Feather file.
+"""
+
+import os
+
+import pandas as pd
+
+import config.paths as paths
+from utils import save_dataframe_as_csv
+
+DIMENSION_COLUMNS = ["Scenario", "Dataset_Fold", "Model"]
+
+# decimals of the CSV export (the metrics are rounded to 4 decimals in metrics.py)
+CSV_EXPORT_DECIMALS = 4
+
+
+def to_typed_metrics_table(metrics_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cast the dimensions of a metrics table to categoricals (with their values as
+    sorted categories) and the metrics to float64.
+
+    Args:
+        metrics_df (pd.DataFrame): The metrics table.
+
+    Returns:
+        pd.DataFrame: The typed metrics table.
+    """
+    return metrics_df.astype(
+        {
+            column: "category" if column in DIMENSION_COLUMNS else "float64"
+            for column in metrics_df.columns
+        }
+    ).reset_index(drop=True)
+
+
+def save_metrics_table(metrics_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Save the metrics table as a Feather file (via a temporary file, so that readers
+    never see a partial table), and export it as CSV.
+
+    Args:
+        metrics_df (pd.DataFrame): The metrics table, with display names.
+
+    Returns:
+        pd.DataFrame: The typed metrics table that was saved.
+    """
+    metrics_df = to_typed_metrics_table(metrics_df)
+    os.makedirs(os.path.dirname(paths.METRICS_TABLE_FPATH), exist_ok=True)
+    tmp_path = f"{paths.METRICS_TABLE_FPATH}.tmp"
+    metrics_df.to_feather(tmp_path)
+    os.replace(tmp_path, paths.METRICS_TABLE_FPATH)
+    save_dataframe_as_csv(metrics_df, paths.METRICS_FPATH, decimals=CSV_EXPORT_DECIMALS)
+    return metrics_df
+
+
+def load_metrics_table() -> pd.DataFrame:
+    """
+    Load the metrics table. A table that only exists as CSV (from an older run) is
+    read from the CSV file.
+
+    Returns:
+        pd.DataFrame: The typed metrics table.
+    """
+    if os.path.exists(paths.METRICS_TABLE_FPATH):
+        return pd.read_feather(paths.METRICS_TABLE_FPATH)
+    return to_typed_metrics_table(pd.read_csv(paths.METRICS_FPATH))
@@ -0,0 +1,465 @@
+"""
+Columnar, memory-mappable store for the experiments' predictions.
+
+Parsing thousands of (gzipped) prediction CSVs dominates the metrics calculation. This
+module compiles all predictions in predictions.zip once into a handful of flat NumPy
+arrays, which later runs memory-map and slice without copying:
+
+    ids.npy                  int64    (rows,)     prediction ids
+    probabilities.npy        float64  (rows, 2)   [negative, positive] class probabilities
+    decision_thresholds.npy  float64  (rows,)     only for files whose threshold varies
+    index.csv                one row per (scenario, model, dataset_fold) with the offset
+                             and length of its rows, its column names and its constant
+                             decision threshold (stored once instead of per row)
+    metadata.json            format version and the size/mtime of the source archive
+
+Columns other than the id, the class probabilities and `decision_threshold` are not
+stored. The probabilities and thresholds keep the float64 values parsed from the CSV
+files, so the metrics computed from the store are the same as from the files
+(float32 moved values across the calibration bin edges and changed the log-loss and
+Brier score). Whether a run read the store or the files is logged and recorded in the
+metrics manifest (see `get_predictions_source`).
+
+Usage:
+    python predictions_store.py [--check] [--workers N]
+
+With --check, the store is not compiled: instead every registered metric of every
+experiment is computed from the store and from the prediction files, and the command
+fails if any of them differ by more than STORE_PARITY_TOLERANCE.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import config.paths as paths
+from config.variables import scenarios_mapping, models_mapping, dataset_folds
+from logging_config import ContextFilter
+from metrics import TestKeyIndex, compute_binary_metrics_batch, stack_fold_predictions
+from utils import (
+    get_dataset_files,
+    get_predictions,
+    get_predictions_signature,
+    run_tasks,
+)
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT_VERSION = 2
+
+# Largest difference allowed between a metric computed from the store and from the
+# prediction files (the store keeps the parsed float64 values, so they are equal).
+STORE_PARITY_TOLERANCE = 1e-12
+
+# Per-process cache of opened stores, keyed by (store directory, process id).
+_stores: Dict[Tuple[str, int], Optional["PredictionsStore"]] = {}
+
+
+def get_source_signature(zipped_file: str) -> Optional[Dict]:
+    """Return the size and modification time of the source archive, if it exists."""
+    if not os.path.exists(zipped_file):
+        return None
+    stat = os.stat(zipped_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _save_array(store_dir: str, name: str, array: np.ndarray) -> None:
+    """Save an array via a temporary file so that readers never see a partial file."""
+    tmp_path = os.path.join(store_dir, f"{name}.tmp.npy")
+    np.save(tmp_path, array)
+    os.replace(tmp_path, os.path.join(store_dir, f"{name}.npy"))
+
+
+def compile_predictions_store(
+    store_dir: str = paths.PREDICTIONS_STORE_DIR,
+) -> pd.DataFrame:
+    """
+    Convert all the experiments' predictions into the columnar store.
+
+    Args:
+        store_dir (str): Directory to write the store to.
+
+    Returns:
+        pd.DataFrame: The store's index.
+    """
+    print("Compiling predictions into the columnar store...")
+    scenarios = list(scenarios_mapping.keys())
+    models = list(models_mapping.keys())
+    total_iterations = len(dataset_folds) * len(scenarios) * len(models)
+
+    ids_chunks, probabilities_chunks, thresholds_chunks = [], [], []
+    index_rows = []
+    offset, threshold_offset = 0, 0
+
+    with tqdm(
+        total=total_iterations, desc="Compiling Predictions", unit="file"
+    ) as pbar:
+        for dataset_fold in dataset_folds:
+            data_schema, _ = get_dataset_files(dataset_fold)
+            id_field = data_schema["id"]["name"]
+            target_classes = [str(c) for c in data_schema["target"]["classes"]]
+
+            for scenario in scenarios:
+                for model in models:
+                    predictions = get_predictions(scenario, dataset_fold, model)
+                    predictions.columns = [str(c) for c in predictions.columns]
+
+                    ids = predictions[id_field].to_numpy()
+                    if not np.issubdtype(ids.dtype, np.integer):
+                        raise ValueError(
+                            f"Non-integer ids in predictions for {scenario}/{model}/"
+                            f"{dataset_fold} cannot be stored."
+                        )
+                    num_rows = len(predictions)
+                    ids_chunks.append(ids.astype(np.int64))
+                    probabilities_chunks.append(
+                        predictions[target_classes].to_numpy(dtype=np.float64)
+                    )
+
+                    # constant decision thresholds are stored once, in the index
+                    decision_threshold, row_threshold_offset = np.nan, -1
+                    if "decision_threshold" in predictions.columns:
+                        thresholds = predictions["decision_threshold"].to_numpy(
+                            dtype=np.float64
+                        )
+                        if num_rows and (thresholds == thresholds[0]).all():
+                            decision_threshold = float(thresholds[0])
+                        else:
+                            row_threshold_offset = threshold_offset
+                            thresholds_chunks.append(thresholds)
+                            threshold_offset += num_rows
+
+                    index_rows.append(
+                        {
+                            "Scenario": scenario,
+                            "Model": model,
+                            "Dataset_Fold": dataset_fold,
+                            "id_field": id_field,
+                            "negative_class": target_classes[0],
+                            "positive_class": target_classes[1],
+                            "offset": offset,
+                            "length": num_rows,
+                            "decision_threshold": decision_threshold,
+                            "threshold_offset": row_threshold_offset,
+                        }
+                    )
+                    offset += num_rows
+                    pbar.update(1)
+
+    os.makedirs(store_dir, exist_ok=True)
+    _save_array(store_dir, "ids", np.concatenate(ids_chunks))
+    _save_array(store_dir, "probabilities", np.concatenate(probabilities_chunks))
+    _save_array(
+        store_dir,
+        "decision_thresholds",
+        (
+            np.concatenate(thresholds_chunks)
+            if thresholds_chunks
+            else np.empty(0, dtype=np.float64)
+        ),
+    )
+    index = pd.DataFrame(index_rows)
+    index.to_csv(os.path.join(store_dir, "index.csv"), index=False)
+
+    # written last: a store without metadata is treated as incomplete
+    metadata = {
+        "format_version": STORE_FORMAT_VERSION,
+        "source": get_source_signature(paths.ZIPPED_PREDICTIONS_FILE),
+    }
+    with open(os.path.join(store_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+
+    print(f"Predictions store with {offset} rows written to {store_dir}.")
+    return index
+
+
+class PredictionsStore:
+    """Read-only, memory-mapped view of a compiled predictions store."""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.ids = np.load(os.path.join(store_dir, "ids.npy"), mmap_mode="r")
+        self.probabilities = np.load(
+            os.path.join(store_dir, "probabilities.npy"), mmap_mode="r"
+        )
+        self.decision_thresholds = np.load(
+            os.path.join(store_dir, "decision_thresholds.npy"), mmap_mode="r"
+        )
+        index = pd.read_csv(
+            os.path.join(store_dir, "index.csv"),
+            dtype={"negative_class": str, "positive_class": str, "id_field": str},
+        )
+        self.index = {
+            (row.Scenario, row.Model, row.Dataset_Fold): row
+            for row in index.itertuples(index=False)
+        }
+
+    def get_arrays(
+        self, scenario_name: str, dataset_name: str, model_name: str
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Zero-copy views of one experiment's predictions.
+
+        Args:
+            scenario_name (str): The name of the scenario.
+            dataset_name (str): The name of the dataset fold.
+            model_name (str): The name of the model.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The ids, the (rows, 2) class
+                probabilities and the decision thresholds (a 0-d array when the
+                threshold is constant, NaN when there is none).
+        """
+        entry = self.index.get((scenario_name, model_name, dataset_name))
+        if entry is None:
+            raise KeyError(
+                f"No predictions for {scenario_name}/{model_name}/{dataset_name} "
+                f"in {self.store_dir}."
+            )
+        rows = slice(entry.offset, entry.offset + entry.length)
+        if entry.threshold_offset >= 0:
+            thresholds = self.decision_thresholds[
+                entry.threshold_offset : entry.threshold_offset + entry.length
+            ]
+        else:
+            thresholds = np.asarray(entry.decision_threshold, dtype=np.float64)
+        return self.ids[rows], self.probabilities[rows], thresholds
+
+    def get_signature(
+        self, scenario_name: str, dataset_name: str, model_name: str
+    ) -> str:
+        """Content hash of one experiment's stored predictions."""
+        digest = hashlib.sha1()
+        for array in self.get_arrays(scenario_name, dataset_name, model_name):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return f"store-sha1:{digest.hexdigest()}"
+
+    def get_predictions(
+        self, scenario_name: str, dataset_name: str, model_name: str
+    ) -> pd.DataFrame:
+        """
+        One experiment's predictions as a DataFrame with the same columns as the
+        original predictions file.
+        """
+        ids, probabilities, thresholds = self.get_arrays(
+            scenario_name, dataset_name, model_name
+        )
+        entry = self.index[(scenario_name, model_name, dataset_name)]
+        columns = {
+            entry.id_field: ids,
+            entry.negative_class: probabilities[:, 0],
+            entry.positive_class: probabilities[:, 1],
+        }
+        if thresholds.ndim or not np.isnan(thresholds):
+            columns["decision_threshold"] = np.broadcast_to(thresholds, ids.shape)
+        return pd.DataFrame(columns, copy=False)
+
+
+def load_predictions_store(
+    store_dir: str = paths.PREDICTIONS_STORE_DIR,
+) -> Optional[PredictionsStore]:
+    """
+    Open the compiled predictions store, once per process.
+
+    Returns None when there is no complete store, or when predictions.zip has changed
+    since the store was compiled (the store is then stale and is not used).
+    """
+    key = (store_dir, os.getpid())
+    if key in _stores:
+        return _stores[key]
+
+    store = None
+    metadata_path = os.path.join(store_dir, "metadata.json")
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        source = get_source_signature(paths.ZIPPED_PREDICTIONS_FILE)
+        if metadata.get("format_version") != STORE_FORMAT_VERSION:
+            logger.warning(
+                "Ignoring predictions store with another format version; re-run "
+                "'python predictions_store.py' to rebuild it."
+            )
+        elif source is not None and source != metadata.get("source"):
+            logger.warning(
+                "Ignoring stale predictions store: %s changed since it was compiled.",
+                paths.ZIPPED_PREDICTIONS_FILE,
+            )
+        else:
+            store = PredictionsStore(store_dir)
+    _stores[key] = store
+    return store
+
+
+def get_predictions_source() -> str:
+    """
+    The source `read_predictions` reads from in this process: 'store' when the
+    compiled store is available and up to date, 'csv' otherwise.
+    """
+    return "csv" if load_predictions_store() is None else "store"
+
+
+def read_predictions(
+    scenario_name: str, dataset_name: str, model_name: str
+) -> pd.DataFrame:
+    """
+    Read the predictions for a given dataset and model, from the compiled store when
+    it is available and up to date, otherwise from the prediction files.
+
+    Args:
+        scenario_name (str): The name of the scenario.
+        dataset_name (str): The name of the dataset fold.
+        model_name (str): The name of the model.
+
+    Returns:
+        pd.DataFrame: The predictions.
+    """
+    store = load_predictions_store()
+    if store is not None:
+        return store.get_predictions(scenario_name, dataset_name, model_name)
+    return get_predictions(scenario_name, dataset_name, model_name)
+
+
+def read_predictions_signature(
+    scenario_name: str, dataset_name: str, model_name: str
+) -> str:
+    """
+    Content signature of the predictions for a given dataset and model, taken from the
+    prediction files when they exist, otherwise from the compiled store.
+
+    Args:
+        scenario_name (str): The name of the scenario.
+        dataset_name (str): The name of the dataset fold.
+        model_name (str): The name of the model.
+
+    Returns:
+        str: The predictions' content signature.
+    """
+    try:
+        return get_predictions_signature(scenario_name, dataset_name, model_name)
+    except FileNotFoundError:
+        store = load_predictions_store()
+        if store is None:
+            raise
+        return store.get_signature(scenario_name, dataset_name, model_name)
+
+
+def compare_fold_metrics(
+    dataset_fold: str, experiments: List[Tuple[str, str]]
+) -> pd.DataFrame:
+    """
+    Compute the (unrounded) metrics of a dataset fold's experiments from the store and
+    from the prediction files.
+
+    Args:
+        dataset_fold (str): The name of the dataset fold.
+        experiments (List[Tuple[str, str]]): (scenario, model) pairs.
+
+    Returns:
+        pd.DataFrame: The absolute difference of every metric, per experiment.
+    """
+    store = load_predictions_store()
+    data_schema, test_key = get_dataset_files(dataset_fold)
+    test_key_index = TestKeyIndex(data_schema, test_key)
+    context_filters = [
+        ContextFilter(dataset=dataset_fold, scenario=scenario, model=model)
+        for scenario, model in experiments
+    ]
+    metric_values = []
+    for read in (store.get_predictions, get_predictions):
+        y_pred, y_pred_proba = stack_fold_predictions(
+            data_schema,
+            test_key_index,
+            [read(scenario, dataset_fold, model) for scenario, model in experiments],
+            context_filters,
+        )
+        metric_values.append(
+            pd.DataFrame(
+                compute_binary_metrics_batch(
+                    test_key_index.labels, y_pred, y_pred_proba
+                )
+            )
+        )
+    differences = (metric_values[0] - metric_values[1]).abs()
+    differences.insert(0, "Model", [model for _, model in experiments])
+    differences.insert(0, "Dataset_Fold", dataset_fold)
+    differences.insert(0, "Scenario", [scenario for scenario, _ in experiments])
+    return differences
+
+
+def check_store_parity(
+    workers: int = 1, tolerance: float = STORE_PARITY_TOLERANCE
+) -> pd.DataFrame:
+    """
+    Check that every registered metric of every experiment is the same whether it is
+    computed from the store or from the prediction files.
+
+    Args:
+        workers (int): Number of worker processes (one dataset fold per task).
+        tolerance (float): The largest difference allowed.
+
+    Returns:
+        pd.DataFrame: The largest difference of every metric.
+    """
+    if load_predictions_store() is None:
+        raise FileNotFoundError(
+            "No up-to-date predictions store; run 'python predictions_store.py' first."
+        )
+    experiments = [
+        (scenario, model) for scenario in scenarios_mapping for model in models_mapping
+    ]
+    with tqdm(
+        total=len(dataset_folds) * len(experiments),
+        desc="Checking Store Parity",
+        unit="file",
+    ) as pbar:
+        differences = pd.concat(
+            run_tasks(
+                compare_fold_metrics,
+                [(dataset_fold, experiments) for dataset_fold in dataset_folds],
+                workers,
+                on_result=lambda result: pbar.update(len(result)),
+            ),
+            ignore_index=True,
+        )
+    metric_columns = differences.columns[3:]
+    max_differences = differences[metric_columns].max().rename("Max Difference")
+    print(max_differences.to_string())
+    outside = differences[(differences[metric_columns] > tolerance).any(axis=1)]
+    if len(outside):
+        raise ValueError(
+            f"{len(outside)} experiments have metrics that differ by more than "
+            f"{tolerance} between the store and the prediction files, e.g. "
+            f"{outside.iloc[0, :3].tolist()}."
+        )
+    print(f"All metrics of {len(differences)} experiments match the prediction files.")
+    return max_differences.to_frame()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile the predictions into the columnar store."
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Instead of compiling the store, check that the metrics computed from it "
+        "match the metrics computed from the prediction files.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes for --check (default: 1).",
+    )
+    args = parser.parse_args()
+    if args.check:
+        check_store_parity(workers=args.workers)
+    else:
+        compile_predictions_store()
@@ -0,0 +1,263 @@
+"""
+Optional instrumentation of the pipeline: wall time, CPU time, peak RSS and bytes read
+per pipeline stage, per task fanned out with `utils.run_tasks`, and per step inside a
+task (e.g. reading one experiment's predictions).
+
+Profiling is off by default and every hook is then a no-op. Enable it with
+`enable_profiling()` (e.g. `python run_all.py --profile`), then write the report with
+`write_profile_report`: a JSON file with all records, and a table of the slowest
+experiments.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+import psutil
+
+# interval of the peak RSS sampling, in seconds
+RSS_SAMPLING_INTERVAL = 0.05
+
+_enabled = False
+# records of this process: the stages, the tasks it ran or collected from worker
+# processes, and the steps of the task that is running
+_stage_records: List[Dict] = []
+_task_records: List[Dict] = []
+_step_records: List[Dict] = []
+
+
+def enable_profiling() -> None:
+    """Turn profiling on for this process and the worker processes it starts."""
+    global _enabled
+    _enabled = True
+
+
+def is_profiling_enabled() -> bool:
+    """Whether profiling is on."""
+    return _enabled
+
+
+class ResourceMonitor:
+    """
+    Measures the wall time, CPU time (including finished child processes), bytes read
+    and peak RSS (including live child processes, sampled in a background thread)
+    between `start` and `stop`.
+    """
+
+    def __init__(self, sample_rss: bool = True):
+        self.process = psutil.Process()
+        self.sample_rss = sample_rss
+        self.peak_rss = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _cpu_time(self) -> float:
+        times = self.process.cpu_times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def _bytes_read(self) -> int:
+        counters = self.process.io_counters()
+        return getattr(counters, "read_chars", counters.read_bytes)
+
+    def _rss(self) -> int:
+        rss = self.process.memory_info().rss
+        for child in self.process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(RSS_SAMPLING_INTERVAL):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def start(self) -> "ResourceMonitor":
+        self._start_wall = time.perf_counter()
+        self._start_cpu = self._cpu_time()
+        self._start_read = self._bytes_read()
+        if self.sample_rss:
+            self.peak_rss = self._rss()
+            self._thread = threading.Thread(target=self._sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> Dict:
+        """Stop measuring and return the measurements."""
+        usage = {
+            "wall_time_s": time.perf_counter() - self._start_wall,
+            "cpu_time_s": self._cpu_time() - self._start_cpu,
+            "bytes_read": self._bytes_read() - self._start_read,
+        }
+        if self.sample_rss:
+            self._stopped.set()
+            self._thread.join()
+            usage["peak_rss_mb"] = max(self.peak_rss, self._rss()) / 2**20
+        return usage
+
+
+@contextmanager
+def profile_stage(name: str) -> Iterator[None]:
+    """Profile a pipeline stage (no-op unless profiling is on)."""
+    if not _enabled:
+        yield
+        return
+    monitor = ResourceMonitor().start()
+    try:
+        yield
+    finally:
+        _stage_records.append({"stage": name, **monitor.stop()})
+
+
+@contextmanager
+def profile_step(step: str, **context) -> Iterator[None]:
+    """
+    Profile a step of the running task, e.g. reading one experiment's predictions.
+    The context (e.g. dataset_fold, scenario, model) is kept with the record. No-op
+    unless profiling is on.
+    """
+    if not _enabled:
+        yield
+        return
+    monitor = ResourceMonitor(sample_rss=False).start()
+    try:
+        yield
+    finally:
+        _step_records.append({"step": step, **context, **monitor.stop()})
+
+
+class ProfiledTask:
+    """
+    Picklable wrapper that runs a task function under profiling, in this process or a
+    worker process, and returns its result together with the task's record.
+    """
+
+    def __init__(self, function: Callable):
+        self.function = function
+
+    def __call__(self, *args):
+        enable_profiling()
+        _step_records.clear()
+        monitor = ResourceMonitor().start()
+        result = self.function(*args)
+        record = {
+            "task": self.function.__name__,
+            "args": [arg for arg in args if isinstance(arg, (str, int, float))],
+            "process": os.getpid(),
+            **monitor.stop(),
+            "steps": list(_step_records),
+        }
+        _step_records.clear()
+        return result, record
+
+
+def collect_task_record(record: Dict) -> None:
+    """Keep the record of a task returned by `ProfiledTask`."""
+    _task_records.append(record)
+
+
+def pop_task_records() -> List[Dict]:
+    """Return and forget the task records of this process (e.g. a worker process)."""
+    records = list(_task_records)
+    _task_records.clear()
+    return records
+
+
+def collect_task_records(records: List[Dict]) -> None:
+    """Keep the records of tasks collected in a worker process."""
+    _task_records.extend(records)
+
+
+def pop_stage_records() -> List[Dict]:
+    """Return and forget the stage records of this process (e.g. a worker process)."""
+    records = list(_stage_records)
+    _stage_records.clear()
+    return records
+
+
+def collect_stage_records(records: List[Dict]) -> None:
+    """Keep the records of stages that ran in a worker process."""
+    _stage_records.extend(records)
+
+
+def get_slowest_experiments(top_n: int) -> pd.DataFrame:
+    """
+    The experiments with the most time spent on them across the profiled tasks: the
+    time of the steps that name a model (e.g. reading its predictions), plus an equal
+    share of the rest of its task (e.g. the batched metric calculation).
+
+    Args:
+        top_n (int): Number of experiments to return.
+
+    Returns:
+        pd.DataFrame: The slowest experiments, slowest first.
+    """
+    rows = []
+    for task in _task_records:
+        steps = [step for step in task["steps"] if "model" in step]
+        if not steps:
+            continue
+        shared_time = task["wall_time_s"] - sum(step["wall_time_s"] for step in steps)
+        for step in steps:
+            rows.append(
+                {
+                    "Task": task["task"],
+                    "Scenario": step.get("scenario"),
+                    "Dataset_Fold": step.get("dataset_fold"),
+                    "Model": step["model"],
+                    "Step Time (s)": step["wall_time_s"],
+                    "Total Time (s)": step["wall_time_s"] + shared_time / len(steps),
+                    "Bytes Read": step["bytes_read"],
+                }
+            )
+    columns = [
+        "Task",
+        "Scenario",
+        "Dataset_Fold",
+        "Model",
+        "Step Time (s)",
+        "Total Time (s)",
+        "Bytes Read",
+    ]
+    return (
+        pd.DataFrame(rows, columns=columns)
+        .sort_values("Total Time (s)", ascending=False)
+        .head(top_n)
+        .reset_index(drop=True)
+    )
+
+
+def write_profile_report(
+    report_fpath: str, slowest_fpath: str, top_n: int = 20
+) -> Optional[pd.DataFrame]:
+    """
+    Save the profiling records as JSON and the slowest experiments as a table, and
+    print both summaries. Does nothing unless profiling is on.
+
+    Args:
+        report_fpath (str): Path of the JSON report.
+        slowest_fpath (str): Path of the slowest-experiments CSV table.
+        top_n (int): Number of experiments in the table.
+
+    Returns:
+        Optional[pd.DataFrame]: The slowest experiments, if profiling is on.
+    """
+    if not _enabled:
+        return None
+    os.makedirs(os.path.dirname(report_fpath), exist_ok=True)
+    with open(report_fpath, "w", encoding="utf-8") as f:
+        json.dump({"stages": _stage_records, "tasks": _task_records}, f, indent=2)
+
+    slowest = get_slowest_experiments(top_n)
+    slowest.to_csv(slowest_fpath, index=False, float_format="%.4f")
+    if _stage_records:
+        print(pd.DataFrame(_stage_records).to_markdown(index=False, floatfmt=".2f"))
+    if not slowest.empty:
+        print(f"\nSlowest {len(slowest)} experiments:")
+        print(slowest.to_markdown(index=False, floatfmt=".3f"))
+    print(f"\nProfile report saved to {report_fpath}.")
+    return slowest
@@ -0,0 +1,252 @@
+"""
+Results cube: fold-aware mean, standard deviation and number of folds of every metric,
+per scenario, grouped by any list of dimensions.
+
+The metrics of every experiment are summed (and counted) per scenario and fold at the
+finest grain (model and dataset) once. A slice of the cube, for a list of dimensions,
+averages these sums per scenario, fold and group, then takes the mean and standard
+deviation of the fold means across the folds. Slices are memoized, so repeated
+questions are answered from memory.
+
+The dimensions are 'Model', 'Model Order', 'Dataset' and 'Fold' (grouping by fold gives
+one fold per group, so no standard deviation), plus any dimension added with
+`add_dimension`, derived from one of them (e.g. a model family from the model, or an
+imbalance bucket from the dataset):
+
+    cube = ResultsCube(load_metrics_table())
+    cube.add_dimension("Family", "Model", {"XGBoost": "Boosting", ...})
+    by_family = cube.aggregate(["Family"])
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+from config.variables import metrics, ordered_models, ordered_scenarios
+
+# the columns of the finest grain, besides the scenario and the fold
+FINEST_COLUMNS = ["Model", "Model Order", "Dataset"]
+
+
+def prepare_metrics_df_with_metadata(
+    metrics_df: pd.DataFrame,
+    ordered_models: List[str],
+) -> pd.DataFrame:
+    """
+    Prepare metrics dataframe with metadata from models and datasets.
+
+    Args:
+        metrics_df (pd.DataFrame): DataFrame containing the metrics for all experiments.
+        ordered_models List[str]: Ordered list of all models.
+
+    Returns:
+        pd.DataFrame: DataFrame containing the metrics with metadata (e.g., dataset, fold, model order).
+    """
+    prepared_df = metrics_df.copy()
+    prepared_df["Dataset"] = prepared_df["Dataset_Fold"].map(
+        lambda x: x.split("_fold")[0]
+    )
+    prepared_df["Fold"] = prepared_df["Dataset_Fold"].map(lambda x: x[-1]).astype(int)
+
+    # Create a mapping of model names to their order (mapping the categorical column
+    # would make the order a categorical too, sorted by model name)
+    models_order = {model: i for i, model in enumerate(ordered_models)}
+    prepared_df["Model Order"] = prepared_df["Model"].astype(str).map(models_order)
+    return prepared_df
+
+
+def compute_fold_level_sums(
+    metrics_df: pd.DataFrame, ordered_metrics: List[str], groupby_columns: List[str]
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Sum the metrics, and count the values summed, for each scenario, fold and finest
+    group (missing group values, e.g. the order of an unknown model, are kept as a
+    group of their own). The fold-level means of any coarser group are the ratios of
+    the sums of these sums and counts.
+
+    Args:
+        metrics_df (pd.DataFrame): DataFrame containing the metrics with metadata.
+        ordered_metrics (List[str]): Ordered list of metric names.
+        groupby_columns (List[str]): The columns of the finest group.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The sums and the counts of every metric
+            (missing values are not counted), with the scenario, fold and group columns.
+    """
+    grouped = metrics_df.groupby(
+        ["Scenario", "Fold"] + groupby_columns, observed=True, sort=False, dropna=False
+    )[ordered_metrics]
+    return grouped.sum().reset_index(), grouped.count().reset_index()
+
+
+def aggregate_fold_level_sums(
+    sums: pd.DataFrame,
+    counts: pd.DataFrame,
+    ordered_metrics: List[str],
+    groupby_columns: List[str],
+) -> pd.DataFrame:
+    """
+    Aggregate the fold-level sums to one level. Calculates the mean across models and
+    datasets not grouped by, for each scenario, metric, and fold. Then calculates the
+    mean and standard deviation across the folds.
+
+    Args:
+        sums (pd.DataFrame): The fold-level sums of the metrics.
+        counts (pd.DataFrame): The fold-level counts of the metrics.
+        ordered_metrics (List[str]): Ordered list of metric names.
+        groupby_columns (List[str]): The columns grouped by at this level.
+
+    Returns:
+        pd.DataFrame: The mean, standard deviation and number of folds ('Mean', 'Std
+            Dev' and 'N' columns) of every scenario, metric and group, indexed by
+            'Scenario', 'Metric' and the group columns.
+    """
+    fold_columns = ["Scenario", "Fold"] + [c for c in groupby_columns if c != "Fold"]
+    fold_sums = sums.groupby(fold_columns, observed=True)[ordered_metrics].sum()
+    fold_counts = counts.groupby(fold_columns, observed=True)[ordered_metrics].sum()
+    fold_means = fold_sums / fold_counts.where(fold_counts > 0)
+
+    # Calculate the mean and standard deviation across the folds
+    grouped = fold_means.groupby(["Scenario"] + groupby_columns, observed=True)
+    aggregated = pd.concat(
+        {"Mean": grouped.mean(), "Std Dev": grouped.std(), "N": grouped.count()},
+        axis=1,
+        names=["Stat", "Metric"],
+    )
+
+    # Move the metrics from the columns to the index
+    aggregated = aggregated.stack(level="Metric", future_stack=True)
+    aggregated.columns.name = None
+    aggregated = aggregated.reorder_levels(
+        ["Scenario", "Metric"] + groupby_columns
+    ).sort_index()
+    return aggregated[aggregated["N"] > 0]
+
+
+def order_level_summary(
+    aggregated: pd.DataFrame, ordered_metrics: List[str]
+) -> pd.DataFrame:
+    """
+    Order the rows of a level's summary like the pivoted tables: by scenario and metric
+    in their configured order, then by model order and dataset name.
+
+    Args:
+        aggregated (pd.DataFrame): The level's summary, indexed by 'Scenario', 'Metric'
+            and the level's group columns.
+        ordered_metrics (List[str]): Ordered list of metric names.
+
+    Returns:
+        pd.DataFrame: The ordered summary.
+    """
+    ranks = {
+        "Scenario": {scenario: i for i, scenario in enumerate(ordered_scenarios)},
+        "Metric": {metric: i for i, metric in enumerate(ordered_metrics)},
+    }
+    sort_columns = [
+        column
+        for column in ["Scenario", "Metric", "Model Order", "Dataset"]
+        if column in aggregated.index.names
+    ]
+
+    def sort_key(column: pd.Series) -> pd.Series:
+        if column.name in ranks:
+            return column.astype(str).map(ranks[column.name])
+        return column.astype(str) if column.name == "Dataset" else column
+
+    return (
+        aggregated.reset_index()
+        .sort_values(sort_columns, key=sort_key, kind="stable")
+        .set_index(aggregated.index.names)
+    )
+
+
+class ResultsCube:
+    """
+    Fold-aware summaries of the metrics table by any list of dimensions, computed from
+    fold-level sums at the finest grain and memoized per list of dimensions.
+    """
+
+    def __init__(
+        self, metrics_df: pd.DataFrame, ordered_metrics: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            metrics_df (pd.DataFrame): The metrics table (with or without the metadata
+                columns of 'prepare_metrics_df_with_metadata').
+            ordered_metrics (Optional[List[str]]): The metrics to summarize, in order
+                (default: the configured metrics).
+        """
+        self.ordered_metrics = ordered_metrics or [metric["name"] for metric in metrics]
+        self._sums, self._counts = compute_fold_level_sums(
+            prepare_metrics_df_with_metadata(metrics_df, ordered_models),
+            self.ordered_metrics,
+            FINEST_COLUMNS,
+        )
+        self._slices: Dict[Tuple[str, ...], pd.DataFrame] = {}
+
+    @property
+    def dimensions(self) -> List[str]:
+        """The dimensions the cube can be grouped by."""
+        return [
+            column
+            for column in self._sums.columns
+            if column not in ["Scenario"] + self.ordered_metrics
+        ]
+
+    def add_dimension(
+        self,
+        name: str,
+        source: str,
+        mapping: Union[Dict[Any, Any], Callable[[Any], Any]],
+    ) -> None:
+        """
+        Add (or replace) a dimension derived from another one. Experiments whose source
+        value is not mapped are left out of the slices grouped by the new dimension.
+
+        Args:
+            name (str): Name of the new dimension.
+            source (str): The dimension it is derived from (e.g. 'Model' or 'Dataset').
+            mapping (Union[Dict[Any, Any], Callable[[Any], Any]]): The value of the new
+                dimension for every value of the source dimension.
+        """
+        if name in ["Scenario", "Fold"] + FINEST_COLUMNS:
+            raise ValueError(f"'{name}' is a built-in dimension of the cube.")
+        if source not in self.dimensions:
+            raise ValueError(
+                f"Unknown dimension '{source}'; the dimensions are {self.dimensions}."
+            )
+        values = self._sums[source].astype(object).map(mapping)
+        self._sums[name] = values
+        self._counts[name] = values
+        self._slices = {
+            key: summary for key, summary in self._slices.items() if name not in key
+        }
+
+    def aggregate(self, dimensions: Sequence[str] = ()) -> pd.DataFrame:
+        """
+        The mean, standard deviation and number of folds of every metric, per scenario
+        and group of the given dimensions.
+
+        Args:
+            dimensions (Sequence[str]): The dimensions to group by (default: none, the
+                overall summary).
+
+        Returns:
+            pd.DataFrame: The summary, indexed by 'Scenario', 'Metric' and the
+                dimensions, with the 'Mean', 'Std Dev' and 'N' columns.
+        """
+        key = tuple(dimensions)
+        unknown = set(key) - set(self.dimensions)
+        if unknown:
+            raise ValueError(
+                f"Unknown dimensions {sorted(unknown)}; the dimensions are "
+                f"{self.dimensions}."
+            )
+        if key not in self._slices:
+            self._slices[key] = order_level_summary(
+                aggregate_fold_level_sums(
+                    self._sums, self._counts, self.ordered_metrics, list(key)
+                ),
+                self.ordered_metrics,
+            )
+        return self._slices[key].copy()
@@ -1,13 +1,226 @@
+import argparse
+import os
+from functools import partial
+from typing import Dict, List
+
+import pandas as pd
+
+import config.paths as paths
+from config.variables import dataset_folds, metrics
+from dataset_characteristics import (
+    load_dataset_characteristics,
+    update_dataset_characteristics,
+)
 from f1_calculate_metrics import calculate_metrics
-from f2_summarize_metrics import summarize_metrics
+from f2_summarize_metrics import summarize_and_pivot_metrics
 from f3_create_table_svgs import generate_table_svgs
 from f4_create_charts import create_charts
 from f5_run_statistical_tests import run_statistical_tests
+from metrics_summary import SUMMARY_FPATHS, load_metrics_summary
+from metrics_table import load_metrics_table
+from profiling import enable_profiling, write_profile_report
+from stage_runner import Stage, run_stages
+from utils import read_csv_as_df
+
+PIVOTED_SUMMARY_FPATHS = [
+    paths.OVERALL_PIVOTED_METRICS_FPATH,
+    paths.BY_DATASET_PIVOTED_METRICS_FPATH,
+    paths.BY_MODEL_PIVOTED_METRICS_FPATH,
+    paths.BY_MODEL_DATASET_PIVOTED_METRICS_FPATH,
+]
+
+
+# The stage functions take the in-memory tables of their inputs and return the tables
+# they write, by path (see stage_runner.py); the files are side outputs.
+def run_calculate_metrics(artifacts: Dict[str, pd.DataFrame], workers: int = 1) -> Dict:
+    """Calculate the metrics table, with the given number of worker processes."""
+    return {paths.METRICS_TABLE_FPATH: calculate_metrics(workers=workers)}
+
+
+def run_index_dataset_characteristics(artifacts: Dict[str, pd.DataFrame]) -> Dict:
+    """Index the characteristics of the dataset folds."""
+    return {
+        paths.DATASET_CHARACTERISTICS_FPATH: update_dataset_characteristics(
+            dataset_folds
+        )
+    }
+
+
+def load_dataset_characteristics_artifact(fpath: str) -> pd.DataFrame:
+    """Load the dataset characteristics index for the stages that read it."""
+    return load_dataset_characteristics()
+
+
+def load_metrics_table_artifact(fpath: str) -> pd.DataFrame:
+    """Load the metrics table for the stages that read it."""
+    return load_metrics_table()
+
+
+def run_summarize_metrics(artifacts: Dict[str, pd.DataFrame]) -> Dict:
+    """Summarize the metrics and pivot the summary for the tables."""
+    summary, pivoted_tables = summarize_and_pivot_metrics(
+        artifacts.get(paths.METRICS_TABLE_FPATH)
+    )
+    return {paths.METRICS_SUMMARY_FPATH: summary, **pivoted_tables}
+
+
+def load_summary_artifact(fpath: str) -> pd.DataFrame:
+    """Load the numeric summary, or a summary table, for the stages that read it."""
+    if fpath == paths.METRICS_SUMMARY_FPATH:
+        return load_metrics_summary()
+    return read_csv_as_df(fpath)
+
+
+def run_generate_table_svgs(artifacts: Dict[str, pd.DataFrame]) -> None:
+    """Generate the SVG tables from the numeric summary."""
+    generate_table_svgs(artifacts.get(paths.METRICS_SUMMARY_FPATH))
+
+
+def run_create_charts(artifacts: Dict[str, pd.DataFrame]) -> None:
+    """Create the charts from the metrics table."""
+    create_charts(artifacts.get(paths.METRICS_TABLE_FPATH))
+
+
+def run_run_statistical_tests(artifacts: Dict[str, pd.DataFrame]) -> None:
+    """Run the statistical tests on the metrics table."""
+    run_statistical_tests(artifacts.get(paths.METRICS_TABLE_FPATH))
+
+
+def get_stages(workers: int = 1) -> List[Stage]:
+    """
+    The pipeline's stages, with the files they read and write.
+
+    Args:
+        workers (int): Number of worker processes of the metrics calculation.
+
+    Returns:
+        List[Stage]: The stages, in their preferred order.
+    """
+    return [
+        Stage(
+            name="calculate_metrics",
+            function=partial(run_calculate_metrics, workers=workers),
+            inputs=[
+                paths.ZIPPED_DATASETS_FILE,
+                paths.ZIPPED_PREDICTIONS_FILE,
+                paths.DATASETS_DIR,
+                paths.PREDICTIONS_DIR,
+                paths.PREDICTIONS_STORE_DIR,
+            ],
+            outputs=[
+                paths.METRICS_TABLE_FPATH,
+                paths.METRICS_FPATH,
+                paths.METRICS_MANIFEST_FPATH,
+                paths.STATISTICS_STORE_FPATH,
+            ],
+            modules=["f1_calculate_metrics"],
+            load=load_metrics_table_artifact,
+            # it fans the dataset folds out to its own worker processes
+            exclusive=True,
+        ),
+        Stage(
+            name="index_dataset_characteristics",
+            function=run_index_dataset_characteristics,
+            inputs=[paths.ZIPPED_DATASETS_FILE, paths.DATASETS_DIR],
+            outputs=[paths.DATASET_CHARACTERISTICS_FPATH],
+            modules=["dataset_characteristics"],
+            load=load_dataset_characteristics_artifact,
+        ),
+        Stage(
+            name="summarize_metrics",
+            function=run_summarize_metrics,
+            inputs=[paths.METRICS_TABLE_FPATH],
+            outputs=[paths.METRICS_SUMMARY_FPATH]
+            + list(SUMMARY_FPATHS.values())
+            + PIVOTED_SUMMARY_FPATHS,
+            modules=["f2_summarize_metrics"],
+            load=load_summary_artifact,
+        ),
+        Stage(
+            name="generate_table_svgs",
+            function=run_generate_table_svgs,
+            inputs=[paths.METRICS_SUMMARY_FPATH],
+            outputs=[os.path.join(paths.CHARTS_DIR, "overall_results.svg")]
+            + [
+                os.path.join(paths.CHARTS_DIR, f"{metric['name']}_results_by_{by}.svg")
+                for metric in metrics
+                for by in ["model", "dataset"]
+            ],
+            modules=["f3_create_table_svgs"],
+        ),
+        Stage(
+            name="create_charts",
+            function=run_create_charts,
+            inputs=[paths.METRICS_TABLE_FPATH],
+            outputs=[
+                paths.BAR_CHART_FPATH,
+                paths.WHICH_IS_BETTER_CHART_FPATH,
+                paths.DATASET_IMPACT_CHART,
+                paths.MODEL_IMPACT_CHART,
+            ],
+            modules=["f4_create_charts"],
+        ),
+        Stage(
+            name="run_statistical_tests",
+            function=run_run_statistical_tests,
+            inputs=[paths.METRICS_TABLE_FPATH],
+            outputs=[
+                paths.ANOVA_RESULTS_FPATH,
+                os.path.join(paths.STATISTICAL_TESTS_DIR, "ttest"),
+            ],
+            modules=["f5_run_statistical_tests"],
+        ),
+    ]
 
 
 if __name__ == "__main__":
-    calculate_metrics()
-    summarize_metrics()
-    generate_table_svgs()
-    create_charts()
-    run_statistical_tests()
+    parser = argparse.ArgumentParser(description="Run the entire pipeline.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Maximum number of independent stages run at once, in separate "
+        "processes (default: the number of CPUs).",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes of the metrics calculation (default: the "
+        "number of CPUs).",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every stage, even those whose inputs and code are unchanged.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Record wall time, CPU time, peak RSS and bytes read per stage and per "
+        "metrics calculation task, and save a profiling report.",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="Number of slowest experiments in the profiling report (default: 20).",
+    )
+    args = parser.parse_args()
+    if args.profile:
+        enable_profiling()
+
+    try:
+        run_stages(
+            get_stages(args.workers),
+            paths.PIPELINE_STATE_FPATH,
+            args.jobs,
+            args.force,
+        )
+    finally:
+        # also report the stages that ran when a stage fails
+        write_profile_report(
+            paths.PROFILE_REPORT_FPATH,
+            paths.PROFILE_SLOWEST_EXPERIMENTS_FPATH,
+            args.top,
+        )
@@ -0,0 +1,378 @@
+"""
+Dependency-aware runner for the pipeline stages.
+
+Every stage declares the files it reads, the files it writes and the modules it runs.
+A stage depends on the stages that write its inputs. The runner:
+
+    - skips a stage when the content of its inputs and of its source code (the
+      modules and every local module they import, including the config files) is
+      the same as when it last ran, and all its outputs exist
+    - runs the stages that don't depend on each other concurrently, in separate
+      processes (a stage that has nothing to run alongside, or that is marked
+      `exclusive`, runs alone in this process, so it can start its own worker
+      processes)
+    - keeps running the stages that don't depend on a failed stage, then reports the
+      failures
+    - hands the outputs of a stage to the stages that read them in memory: a stage
+      function receives the in-memory values of its inputs (by path) and returns the
+      values of its outputs, and the files it writes are side outputs. The outputs of
+      a skipped stage are loaded (by its `load` function) once, when a stage that
+      reads them runs, so every artifact is parsed at most once per run
+
+The signatures of the last successful run of every stage are kept in a state file.
+File contents are hashed once and the hashes are reused while a file's size and
+modification time don't change, so checking big inputs like predictions.zip is cheap.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from logging_config import configure_worker_logging, get_log_queue
+from profiling import (
+    collect_stage_records,
+    collect_task_records,
+    enable_profiling,
+    is_profiling_enabled,
+    pop_stage_records,
+    pop_task_records,
+    profile_stage,
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_VERSION = 1
+
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Stage(NamedTuple):
+    """
+    A pipeline stage: the files it reads and writes and the modules it runs.
+
+    `function` receives the in-memory values of the stage's inputs that are available,
+    by path, and returns the in-memory values of its outputs (or None). `load` reads
+    one of the stage's outputs from disk, for the stages that read it when this stage
+    is skipped; outputs without an in-memory value are read by the stages themselves.
+    An `exclusive` stage (e.g. one that fans out to its own worker processes) always
+    runs in this process, with no other stage running alongside it.
+    """
+
+    name: str
+    function: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]
+    inputs: List[str]
+    outputs: List[str]
+    modules: List[str]
+    load: Optional[Callable[[str], Any]] = None
+    exclusive: bool = False
+
+
+def _resolve_local_module(module_name: str) -> Optional[str]:
+    """The source file of a module under the source directory, if it is one."""
+    parts = module_name.split(".")
+    for candidate in [
+        os.path.join(SOURCE_DIR, *parts) + ".py",
+        os.path.join(SOURCE_DIR, *parts, "__init__.py"),
+    ]:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def get_source_files(module_names: List[str]) -> List[str]:
+    """
+    The source files of the given modules and of every local module they import,
+    directly or indirectly.
+
+    Args:
+        module_names (List[str]): Names of modules under the source directory.
+
+    Returns:
+        List[str]: The source files, sorted.
+    """
+    pending = [_resolve_local_module(name) for name in module_names]
+    files: Set[str] = set()
+    while pending:
+        fpath = pending.pop()
+        if fpath is None or fpath in files:
+            continue
+        files.add(fpath)
+        package = os.path.relpath(os.path.dirname(fpath), SOURCE_DIR)
+        package = "" if package == "." else package.replace(os.sep, ".")
+        with open(fpath, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=fpath)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom):
+                base = node.module or ""
+                if node.level:
+                    base = importlib.util.resolve_name(
+                        "." * node.level + base, package
+                    ).strip(".")
+                # `from package import module` imports a module too
+                names = [base] + [f"{base}.{alias.name}" for alias in node.names]
+            else:
+                continue
+            pending.extend(_resolve_local_module(name) for name in names if name)
+    return sorted(files)
+
+
+class FileHasher:
+    """
+    Content hashes of files and directories, cached by size and modification time so
+    that unchanged files are not read again.
+    """
+
+    def __init__(self, cache: Optional[Dict[str, Dict]] = None):
+        self.cache = cache if cache is not None else {}
+
+    def _hash_file(self, fpath: str) -> str:
+        stat = os.stat(fpath)
+        cached = self.cache.get(fpath)
+        if (
+            cached is not None
+            and cached["size"] == stat.st_size
+            and cached["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return cached["sha1"]
+        digest = hashlib.sha1()
+        with open(fpath, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        self.cache[fpath] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha1": digest.hexdigest(),
+        }
+        return digest.hexdigest()
+
+    def hash(self, path: str) -> str:
+        """Hash of a file, of all files under a directory, or 'missing'."""
+        if os.path.isfile(path):
+            return self._hash_file(path)
+        if not os.path.isdir(path):
+            return "missing"
+        digest = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                fpath = os.path.join(root, name)
+                digest.update(os.path.relpath(fpath, path).encode("utf-8"))
+                digest.update(self._hash_file(fpath).encode("utf-8"))
+        return digest.hexdigest()
+
+
+def get_stage_signature(stage: Stage, hasher: FileHasher) -> str:
+    """Hash of the content of a stage's inputs and source files."""
+    digest = hashlib.sha1(stage.name.encode("utf-8"))
+    for path in stage.inputs + get_source_files(stage.modules):
+        digest.update(f"{path}={hasher.hash(path)};".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_state(state_fpath: str) -> Dict:
+    """Load the runner's state, or an empty state if there is none."""
+    empty = {"version": STATE_VERSION, "stages": {}, "file_hashes": {}}
+    if not os.path.exists(state_fpath):
+        return empty
+    with open(state_fpath, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    return state if state.get("version") == STATE_VERSION else empty
+
+
+def save_state(state_fpath: str, state: Dict) -> None:
+    """Write the runner's state atomically."""
+    os.makedirs(os.path.dirname(state_fpath), exist_ok=True)
+    tmp_path = f"{state_fpath}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, state_fpath)
+
+
+def get_stage_dependencies(stages: List[Stage]) -> Dict[str, Set[str]]:
+    """The stages that write any of every stage's inputs."""
+    writers = {output: stage.name for stage in stages for output in stage.outputs}
+    return {
+        stage.name: {writers[path] for path in stage.inputs if path in writers}
+        for stage in stages
+    }
+
+
+def _run_stage_in_worker(
+    stage: Stage, artifacts: Dict[str, Any], profile: bool
+) -> Tuple[Dict[str, Any], List[Dict], List[Dict]]:
+    """
+    Run a stage in a worker process and return its outputs, its stage record and the
+    records of the tasks it ran (the worker process is reused, so both are popped).
+    """
+    if profile:
+        enable_profiling()
+    # drop the records a forked worker inherited from this process
+    pop_stage_records()
+    pop_task_records()
+    with profile_stage(stage.name):
+        outputs = stage.function(artifacts)
+    return outputs or {}, pop_stage_records(), pop_task_records()
+
+
+def run_stages(
+    stages: List[Stage], state_fpath: str, jobs: int = 1, force: bool = False
+) -> Dict[str, str]:
+    """
+    Run the stages in dependency order, skipping the up-to-date ones and running
+    independent ones concurrently.
+
+    Args:
+        stages (List[Stage]): The stages, in their preferred order.
+        state_fpath (str): Path of the runner's state file.
+        jobs (int): Maximum number of stages running at once.
+        force (bool): Run every stage, even when it is up to date.
+
+    Returns:
+        Dict[str, str]: The outcome of every stage: 'ran', 'skipped', 'failed' or
+            'blocked' (a stage it depends on failed).
+
+    Raises:
+        RuntimeError: If any stage failed.
+    """
+    state = load_state(state_fpath)
+    hasher = FileHasher(state["file_hashes"])
+    dependencies = get_stage_dependencies(stages)
+    by_name = {stage.name: stage for stage in stages}
+    outcomes: Dict[str, str] = {}
+    signatures: Dict[str, str] = {}
+    running: Dict[Future, str] = {}
+    errors: Dict[str, BaseException] = {}
+    # in-memory outputs of the stages that ran, and outputs of skipped stages loaded
+    # for the stages that read them
+    artifacts: Dict[str, Any] = {}
+    writers = {path: stage.name for stage in stages for path in stage.outputs}
+
+    def get_input_artifacts(stage: Stage) -> Dict[str, Any]:
+        for path in stage.inputs:
+            writer = by_name.get(writers.get(path, ""))
+            if (
+                path not in artifacts
+                and writer is not None
+                and writer.load is not None
+                and outcomes[writer.name] == "skipped"
+            ):
+                artifacts[path] = writer.load(path)
+        return {path: artifacts[path] for path in stage.inputs if path in artifacts}
+
+    def finish(
+        name: str, error: Optional[BaseException], outputs: Optional[Dict] = None
+    ) -> None:
+        if error is None:
+            outcomes[name] = "ran"
+            artifacts.update(outputs or {})
+            # hash the outputs now, so the next stages' checks reuse the hashes
+            for path in by_name[name].outputs:
+                hasher.hash(path)
+            state["stages"][name] = {"signature": signatures[name]}
+            save_state(state_fpath, state)
+            print(f"Stage '{name}' done.")
+        else:
+            outcomes[name] = "failed"
+            errors[name] = error
+            state["stages"].pop(name, None)
+            save_state(state_fpath, state)
+            logger.error("Stage '%s' failed: %r", name, error)
+            print(f"Stage '{name}' failed: {error!r}")
+
+    with ProcessPoolExecutor(
+        max_workers=max(jobs, 1),
+        initializer=configure_worker_logging,
+        initargs=(get_log_queue(),),
+    ) as executor:
+        while len(outcomes) < len(stages):
+            num_outcomes = len(outcomes)
+            started = set(running.values())
+            for stage in stages:
+                if stage.name in outcomes or stage.name in started:
+                    continue
+                if dependencies[stage.name] & {
+                    name
+                    for name, outcome in outcomes.items()
+                    if outcome in ("failed", "blocked")
+                }:
+                    outcomes[stage.name] = "blocked"
+                    print(f"Stage '{stage.name}' not run: a stage it needs failed.")
+            ready = [
+                stage
+                for stage in stages
+                if stage.name not in outcomes
+                and stage.name not in started
+                and dependencies[stage.name] <= set(outcomes)
+            ]
+
+            for stage in ready:
+                signatures[stage.name] = get_stage_signature(stage, hasher)
+                up_to_date = (
+                    not force
+                    and state["stages"].get(stage.name, {}).get("signature")
+                    == signatures[stage.name]
+                    and all(os.path.exists(path) for path in stage.outputs)
+                )
+                if up_to_date:
+                    outcomes[stage.name] = "skipped"
+                    print(f"Stage '{stage.name}' is up to date, skipped.")
+            ready = [stage for stage in ready if stage.name not in outcomes]
+            if not ready and not running:
+                if len(outcomes) == num_outcomes:
+                    raise ValueError("The stages have cyclic dependencies.")
+                continue
+
+            exclusive = [stage for stage in ready if stage.exclusive]
+            if not running and (exclusive or len(ready) == 1 or jobs <= 1):
+                # run a stage that can't (or mustn't) run concurrently with another
+                # one in this process, so that it can use its own worker processes
+                stage = (exclusive or ready)[0]
+                print(f"Running stage '{stage.name}'...")
+                try:
+                    with profile_stage(stage.name):
+                        outputs = stage.function(get_input_artifacts(stage))
+                    finish(stage.name, None, outputs)
+                except Exception as exc:
+                    finish(stage.name, exc)
+                continue
+
+            # an exclusive stage waits for the running stages; start no new ones
+            for stage in [] if exclusive else ready[: max(jobs, 1) - len(running)]:
+                print(f"Running stage '{stage.name}' in a worker process...")
+                try:
+                    stage_artifacts = get_input_artifacts(stage)
+                except Exception as exc:
+                    finish(stage.name, exc)
+                    continue
+                future = executor.submit(
+                    _run_stage_in_worker,
+                    stage,
+                    stage_artifacts,
+                    is_profiling_enabled(),
+                )
+                running[future] = stage.name
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    outputs, stage_records, task_records = future.result()
+                    collect_stage_records(stage_records)
+                    collect_task_records(task_records)
+                    finish(name, None, outputs)
+                else:
+                    finish(name, error)
+
+    if errors:
+        raise RuntimeError(
+            "Stages failed: "
+            + ", ".join(f"{name} ({error!r})" for name, error in errors.items())
+        )
+    return outcomes
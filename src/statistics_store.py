@@ -0,0 +1,148 @@
+"""
+Persisted sufficient statistics of every experiment.
+
+'f1_calculate_metrics.py' saves, next to the metrics table, a compact store of the
+statistics that metrics are derived from, so that new metrics can be computed without
+re-reading the predictions (see 'derive_metrics.py'). Per experiment it holds:
+
+    confusion         int64   (4,)          tp, fp, fn, tn at the applied threshold
+    class_counts      int64   (2,)          negative and positive rows
+    score_histograms  uint32  (2, bins)     histogram of the positive class scores of
+                                            the negative and the positive rows, in
+                                            `bins` equal-width bins over [0, 1]
+
+The store is a single compressed .npz file. Its rows are keyed by scenario, dataset
+fold and model, in the same order as the rows of the metrics table.
+"""
+
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from metrics import ScoreCurves, confusion_counts, probability_bins
+
+STATISTICS_FORMAT_VERSION = 1
+
+KEY_COLUMNS = ["Scenario", "Dataset_Fold", "Model"]
+
+
+def score_histogram_positions(y_pred_proba: np.ndarray, bins: int) -> np.ndarray:
+    """Bin of every score in `bins` equal-width bins over [0, 1] (1.0 is in the last)."""
+    return probability_bins(y_pred_proba, bins)
+
+
+def descending_bins(score_histograms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Negative and positive row counts per bin, from the highest scores down."""
+    return score_histograms[:, 0, ::-1], score_histograms[:, 1, ::-1]
+
+
+def binned_score_curves(score_histograms: np.ndarray) -> ScoreCurves:
+    """
+    Score curves of the binned scores, with one point per bin (the rows in a bin are
+    tied).
+
+    Args:
+        score_histograms (np.ndarray): (experiments, 2, bins) histograms of the scores
+            of the negative and the positive rows.
+
+    Returns:
+        ScoreCurves: The curves, shape (experiments, bins).
+    """
+    negatives, positives = descending_bins(score_histograms.astype(np.int64))
+    return ScoreCurves(np.cumsum(negatives, axis=-1), np.cumsum(positives, axis=-1))
+
+
+def compute_experiment_statistics(
+    y_true: np.ndarray, y_pred: np.ndarray, y_pred_proba: np.ndarray, bins: int
+) -> Dict[str, np.ndarray]:
+    """
+    Compute the stored statistics of several experiments scored on the same rows.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred (np.ndarray): Binary (0/1) predicted labels, shape (experiments, rows).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+        bins (int): Number of score histogram bins per class.
+
+    Returns:
+        Dict[str, np.ndarray]: The statistics, with experiments along the first axis.
+    """
+    y_true = np.asarray(y_true) == 1
+    num_experiments = len(y_pred_proba)
+    positives = np.count_nonzero(y_true)
+
+    # offset every (experiment, class) histogram so one bincount fills them all
+    positions = score_histogram_positions(y_pred_proba, bins)
+    positions += (np.arange(num_experiments)[:, np.newaxis] * 2 + y_true) * bins
+    histograms = np.bincount(positions.ravel(), minlength=num_experiments * 2 * bins)
+
+    return {
+        "confusion": np.stack(confusion_counts(y_true, y_pred), axis=-1).astype(
+            np.int64
+        ),
+        "class_counts": np.tile(
+            np.array([y_true.size - positives, positives], dtype=np.int64),
+            (num_experiments, 1),
+        ),
+        "score_histograms": histograms.reshape(num_experiments, 2, bins).astype(
+            np.uint32
+        ),
+    }
+
+
+def save_statistics_store(
+    fpath: str, keys: pd.DataFrame, statistics: Dict[str, np.ndarray]
+) -> None:
+    """
+    Save the statistics store via a temporary file, so that readers never see a
+    partial store.
+
+    Args:
+        fpath (str): Path of the .npz file.
+        keys (pd.DataFrame): Scenario, Dataset_Fold and Model of every row.
+        statistics (Dict[str, np.ndarray]): The statistics, aligned with `keys`.
+    """
+    os.makedirs(os.path.dirname(fpath), exist_ok=True)
+    tmp_path = f"{fpath}.tmp.npz"
+    np.savez_compressed(
+        tmp_path,
+        format_version=STATISTICS_FORMAT_VERSION,
+        **{column: keys[column].to_numpy(dtype=str) for column in KEY_COLUMNS},
+        **statistics,
+    )
+    os.replace(tmp_path, fpath)
+
+
+def load_statistics_store(
+    fpath: str, bins: Optional[int] = None
+) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    Load the statistics store.
+
+    Args:
+        fpath (str): Path of the .npz file.
+        bins (Optional[int]): The expected number of score histogram bins. A store
+            with a different number of bins (or format version) is treated as empty.
+
+    Returns:
+        Tuple[pd.DataFrame, Dict[str, np.ndarray]]: The keys of the rows and the
+            statistics. Both are empty if there is no usable store.
+    """
+    empty = pd.DataFrame(columns=KEY_COLUMNS), {}
+    if not os.path.exists(fpath):
+        return empty
+    with np.load(fpath) as store:
+        if int(store["format_version"]) != STATISTICS_FORMAT_VERSION:
+            return empty
+        if bins is not None and store["score_histograms"].shape[-1] != bins:
+            return empty
+        keys = pd.DataFrame({column: store[column] for column in KEY_COLUMNS})
+        statistics = {
+            name: store[name]
+            for name in store.files
+            if name not in KEY_COLUMNS and name != "format_version"
+        }
+    return keys, statistics
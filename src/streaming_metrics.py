@@ -0,0 +1,136 @@
+"""
+Streaming (chunked) evaluation of prediction files that don't fit in memory.
+
+The test key is read once per dataset fold, in chunks, into id-sorted arrays for
+joining. Every predictions file is then read in chunks and joined to the test key by
+id with a binary search, and each chunk is scattered into one experiment's arrays of
+predicted classes and positive class probabilities, in the test key's row order.
+These are the same arrays the in-memory engine scores, so every metric (the ranking
+metrics included) is exact and identical to a regular run.
+
+The memory used does not depend on the size of the predictions files, but it is
+proportional to the number of test key rows: the test key ids, positions and labels,
+plus the predicted class, the probability and a count of how often it was predicted
+for every row of the experiment being read. Only the first few unknown prediction
+ids are kept, for the error message.
+
+Used by 'f1_calculate_metrics.py --streaming'.
+"""
+
+import logging
+from typing import Iterable, Tuple
+
+import numpy as np
+import pandas as pd
+
+from logging_config import ContextFilter
+from metrics import check_alignment, get_observed_classes, predict_positive_class
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingTestKey:
+    """
+    A test key read in chunks into id-sorted arrays, for joining chunks of
+    predictions to it by id. The labels are kept in the test key's row order.
+    """
+
+    def __init__(self, data_schema: dict, test_key_chunks: Iterable[pd.DataFrame]):
+        self.id_field = data_schema["id"]["name"]
+        self.positive_class = str(data_schema["target"]["classes"][1])
+        target_field = data_schema["target"]["name"]
+
+        ids, labels, seen_labels = [], [], set()
+        for chunk in test_key_chunks:
+            target = chunk[target_field].astype(str)
+            seen_labels.update(target.unique())
+            ids.append(chunk[self.id_field].to_numpy())
+            labels.append((target == self.positive_class).to_numpy(dtype=np.int8))
+        self.observed_classes = get_observed_classes(
+            data_schema["target"]["classes"], seen_labels
+        )
+
+        ids = np.concatenate(ids)
+        # the row of every sorted id
+        self.rows = np.argsort(ids, kind="stable")
+        self.ids = ids[self.rows]
+        self.labels = np.concatenate(labels)
+        if (self.ids[1:] == self.ids[:-1]).any():
+            raise ValueError(f"Test key has duplicate values in '{self.id_field}'.")
+
+    def lookup(self, prediction_ids: np.ndarray) -> np.ndarray:
+        """The test key row of every prediction id (-1 for unknown ids)."""
+        positions = np.searchsorted(self.ids, prediction_ids)
+        positions[positions == len(self.ids)] = 0
+        known = self.ids[positions] == prediction_ids
+        return np.where(known, self.rows[positions], -1)
+
+
+def stream_experiment_predictions(
+    data_schema: dict,
+    test_key: StreamingTestKey,
+    prediction_chunks: Iterable[pd.DataFrame],
+    context_filter: ContextFilter,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Join one experiment's predictions, read chunk by chunk, to the test key.
+
+    Args:
+        data_schema (dict): Dictionary containing data schema.
+        test_key (StreamingTestKey): The dataset fold's test key.
+        prediction_chunks (Iterable[pd.DataFrame]): The experiment's predictions, in
+            chunks of rows.
+        context_filter (ContextFilter): Logging context info (dataset, scenario,
+            model) of the experiment.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The boolean positive class predictions and the
+            positive class probabilities, in the test key's row order.
+    """
+    target_classes = data_schema["target"]["classes"]
+    positive_class = str(target_classes[1])
+    num_rows = len(test_key.labels)
+
+    y_pred = np.zeros(num_rows, dtype=bool)
+    y_pred_proba = np.zeros(num_rows, dtype=np.float64)
+    # times every test key row is predicted (capped at 2), and the unknown ids (only
+    # the first few are kept for the error message)
+    seen = np.zeros(num_rows, dtype=np.uint8)
+    extra, num_extra = [], 0
+
+    with context_filter:
+        logger.info(
+            "Starting streaming metric calculation for dataset: %s, scenario: %s, "
+            "model: %s",
+            context_filter.dataset,
+            context_filter.scenario,
+            context_filter.model,
+        )
+        for chunk in prediction_chunks:
+            chunk.columns = [str(c) for c in chunk.columns]
+            prediction_ids = chunk[test_key.id_field].to_numpy()
+            positions = test_key.lookup(prediction_ids)
+            known = positions >= 0
+            num_extra += int((~known).sum())
+            extra.extend(prediction_ids[~known][: 5 - len(extra)].tolist())
+            chunk, positions = chunk[known], positions[known]
+            chunk_positions, chunk_counts = np.unique(positions, return_counts=True)
+            seen[chunk_positions] = np.minimum(seen[chunk_positions] + chunk_counts, 2)
+
+            y_pred[positions] = predict_positive_class(
+                chunk, target_classes, test_key.observed_classes
+            )
+            y_pred_proba[positions] = chunk[positive_class].to_numpy(dtype=np.float64)
+
+        check_alignment(
+            test_key.ids[seen[test_key.rows] == 0],
+            test_key.ids[seen[test_key.rows] > 1],
+            np.array(extra),
+            num_extra,
+        )
+        if y_pred.all() or not y_pred.any():
+            logger.warning(
+                "All predictions are of a single class: %s",
+                str(target_classes[int(y_pred[0])]),
+            )
+    return y_pred, y_pred_proba
@@ -0,0 +1,227 @@
+"""
+Sweep the decision threshold of every experiment.
+
+Each experiment's scores are sorted once; the cumulative true and false positive
+counts along the sorted scores are the confusion counts at every distinct threshold
+(predicting the positive class for scores >= threshold). Every threshold-dependent
+metric is derived from those counts for all thresholds and all of a fold's
+experiments at once, without a loop over thresholds.
+
+Two tables are saved next to the metrics table:
+    - the oracle-optimal threshold and the metric value it achieves, per
+      (scenario, dataset_fold, model) and metric
+    - the metric-vs-threshold curves, downsampled to evenly spaced thresholds
+
+Usage:
+    python threshold_sweep.py [--workers N]
+"""
+
+import argparse
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from logging_config import ContextFilter, setup_logging
+import config.paths as paths
+from config.variables import (
+    dataset_folds,
+    models_mapping,
+    scenarios_mapping,
+    threshold_curve_points,
+)
+from metrics import (
+    CONFUSION,
+    METRIC_REGISTRY,
+    ConfusionCounts,
+    TestKeyIndex,
+    evaluate_metrics,
+    get_metric_names,
+    ranked_score_curves,
+    stack_fold_predictions,
+)
+from predictions_store import read_predictions
+from utils import get_dataset_files, run_tasks, save_dataframe_as_csv
+
+logger = logging.getLogger(__name__)
+setup_logging(paths.METRICS_CALCULATION_LOG_FPATH)
+
+# the metrics that depend on the decision threshold: every registered metric computed
+# from the confusion counts
+SWEPT_METRICS = get_metric_names(CONFUSION)
+
+
+def sweep_thresholds(
+    y_true: np.ndarray, y_pred_proba: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Compute the threshold-dependent metrics of several experiments at every distinct
+    threshold.
+
+    Position 0 of the outputs is the threshold above every score (no positive
+    predictions, threshold inf); position k > 0 predicts the k highest scores as
+    positive.
+
+    Args:
+        y_true (np.ndarray): Binary (0/1) true labels, shape (rows,).
+        y_pred_proba (np.ndarray): Predicted probabilities of the positive class,
+            shape (experiments, rows).
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]: The thresholds, the mask
+            of the positions that are distinct thresholds, and the metric values,
+            each of shape (experiments, rows + 1).
+    """
+    fps, tps, sorted_score, is_threshold = ranked_score_curves(y_true, y_pred_proba)
+
+    def with_start(values: np.ndarray, start) -> np.ndarray:
+        start_column = np.full((len(values), 1), start, dtype=values.dtype)
+        return np.concatenate([start_column, values], axis=-1)
+
+    fps, tps = with_start(fps, 0), with_start(tps, 0)
+    thresholds = with_start(sorted_score.astype(np.float64), np.inf)
+    is_threshold = with_start(is_threshold, True)
+
+    negatives, positives = fps[:, -1:], tps[:, -1:]
+    metric_values = evaluate_metrics(
+        {CONFUSION: ConfusionCounts(tps, fps, positives - tps, negatives - fps)},
+        SWEPT_METRICS,
+    )
+    return thresholds, is_threshold, metric_values
+
+
+def calculate_fold_threshold_sweep(
+    dataset_fold: str,
+    experiments: List[Tuple[str, str]],
+    curve_points: int = threshold_curve_points,
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Sweep the decision threshold for the given experiments of a single dataset fold.
+
+    Args:
+        dataset_fold (str): The name of the dataset fold.
+        experiments (List[Tuple[str, str]]): (scenario, model) pairs, in output order.
+        curve_points (int): Number of evenly spaced thresholds in [0, 1] to keep of
+                            every curve.
+
+    Returns:
+        Tuple[List[Dict], List[Dict]]: The optimal threshold rows (one per experiment
+            and metric) and the curve rows (one per experiment and kept threshold).
+    """
+    data_schema, test_key = get_dataset_files(dataset_fold)
+    test_key_index = TestKeyIndex(data_schema, test_key)
+    _, y_pred_proba = stack_fold_predictions(
+        data_schema,
+        test_key_index,
+        [
+            read_predictions(scenario, dataset_fold, model)
+            for scenario, model in experiments
+        ],
+        [
+            ContextFilter(dataset=dataset_fold, scenario=scenario, model=model)
+            for scenario, model in experiments
+        ],
+    )
+    thresholds, is_threshold, metric_values = sweep_thresholds(
+        test_key_index.labels, y_pred_proba
+    )
+
+    # the best threshold per metric; ties go to the highest threshold
+    best = {}
+    for name in SWEPT_METRICS:
+        if METRIC_REGISTRY[name].greater_is_better:
+            best[name] = np.argmax(
+                np.where(is_threshold, metric_values[name], -np.inf), axis=-1
+            )
+        else:
+            best[name] = np.argmin(
+                np.where(is_threshold, metric_values[name], np.inf), axis=-1
+            )
+    # the curves at evenly spaced thresholds: the position of threshold t is the
+    # number of scores >= t
+    grid = np.linspace(0, 1, curve_points)
+    grid_positions = (y_pred_proba[:, :, np.newaxis] >= grid).sum(axis=1)
+    curves = {
+        name: np.take_along_axis(metric_values[name], grid_positions, axis=-1)
+        for name in SWEPT_METRICS
+    }
+
+    optimal_rows, curve_rows = [], []
+    for i, (scenario, model) in enumerate(experiments):
+        keys = {"Scenario": scenario, "Dataset_Fold": dataset_fold, "Model": model}
+        for name in SWEPT_METRICS:
+            optimal_rows.append(
+                {
+                    **keys,
+                    "Metric": name,
+                    "Threshold": thresholds[i, best[name][i]],
+                    "Value": metric_values[name][i, best[name][i]],
+                }
+            )
+        for j, threshold in enumerate(grid):
+            curve_rows.append(
+                {
+                    **keys,
+                    "Threshold": threshold,
+                    **{name: curves[name][i, j] for name in SWEPT_METRICS},
+                }
+            )
+    return optimal_rows, curve_rows
+
+
+def run_threshold_sweep(workers: int = 1) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Sweep the decision threshold of every experiment and save the optimal thresholds
+    and the downsampled curves next to the metrics table.
+
+    Args:
+        workers (int): Number of worker processes. With more than one worker, the
+                       dataset folds are fanned out to a process pool. The results
+                       are always returned in the same order as a serial run.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: The optimal thresholds and the curves.
+    """
+    print("Sweeping the decision thresholds of all experiments...")
+    experiments = [
+        (scenario, model) for scenario in scenarios_mapping for model in models_mapping
+    ]
+
+    with tqdm(
+        total=len(dataset_folds), desc="Sweeping Thresholds", unit="fold"
+    ) as pbar:
+        results_by_fold = run_tasks(
+            calculate_fold_threshold_sweep,
+            [(dataset_fold, experiments) for dataset_fold in dataset_folds],
+            workers,
+            on_result=lambda _: pbar.update(1),
+        )
+
+    tables = []
+    for i, fpath in enumerate(
+        [paths.OPTIMAL_THRESHOLDS_FPATH, paths.THRESHOLD_CURVES_FPATH]
+    ):
+        table = pd.DataFrame([row for result in results_by_fold for row in result[i]])
+        # map scenario names to scenario display names
+        table["Scenario"] = table["Scenario"].map(scenarios_mapping)
+        table["Model"] = table["Model"].map(models_mapping)
+        save_dataframe_as_csv(table, fpath, decimals=4)
+        tables.append(table)
+    logger.info("Threshold sweep calculated and saved.")
+    return tables[0], tables[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Sweep the decision thresholds of all experiments."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes (default: 1, i.e. run serially).",
+    )
+    args = parser.parse_args()
+    run_threshold_sweep(args.workers)
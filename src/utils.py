@@ -1,9 +1,13 @@
+import hashlib
 import json
 import os
 import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-from typing import Dict
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
 from config.variables import metrics as metrics_dict
+from logging_config import configure_worker_logging, get_log_queue
+from profiling import ProfiledTask, collect_task_record, is_profiling_enabled
 
 import config.paths as paths
 
@@ -43,6 +47,242 @@ def save_dataframe_as_csv(
     )
 
 
+def run_tasks(
+    function: Callable,
+    args_list: List[Tuple],
+    workers: int = 1,
+    on_result: Optional[Callable[[Any], None]] = None,
+) -> List:
+    """
+    Calls a function once per tuple of arguments, serially or fanned out to a process
+    pool, and returns the results in the order of the arguments. When profiling is on
+    (see 'profiling.py'), the profiling record of every call is collected.
+
+    Args:
+    - function (Callable): Module-level (picklable) function to call.
+    - args_list (List[Tuple]): Positional arguments of every call.
+    - workers (int): Number of worker processes; with 1 or fewer, run serially.
+    - on_result (Optional[Callable[[Any], None]]): Called with every result as soon
+      as it is available, e.g. to update a progress bar.
+
+    Returns:
+    - List: The results, in the order of `args_list`.
+    """
+    profiled = is_profiling_enabled()
+    if profiled:
+        # every task also returns its profiling record
+        function = ProfiledTask(function)
+
+    def handle_result(result: Any) -> Any:
+        if profiled:
+            result, record = result
+            collect_task_record(record)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    if workers <= 1:
+        return [handle_result(function(*args)) for args in args_list]
+
+    results = [None] * len(args_list)
+    # the workers send their log records to this process's log queue
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=configure_worker_logging,
+        initargs=(get_log_queue(),),
+    ) as executor:
+        futures = {
+            executor.submit(function, *args): i for i, args in enumerate(args_list)
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = handle_result(future.result())
+    return results
+
+
+# Per-process cache of opened zip archives and their member index, keyed by
+# (archive path, process id). Forked workers must not share an open archive handle.
+_archive_indexes: Dict[Tuple[str, int], Tuple] = {}
+
+
+def get_archive_index(
+    zipped_file: str,
+) -> Tuple[zipfile.ZipFile, Dict[str, zipfile.ZipInfo]]:
+    """Open a zip archive and index its members by name.
+
+    The archive is opened and indexed once per process. It is re-indexed when the
+    archive's modification time or size changes, so a replaced archive is never served
+    from a stale index.
+
+    Args:
+    - zipped_file (str): The path of the zip archive.
+
+    Returns:
+    - zip_ref (zipfile.ZipFile): The open archive.
+    - members (Dict[str, zipfile.ZipInfo]): The archive's file members keyed by name.
+    """
+    stat = os.stat(zipped_file)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    key = (zipped_file, os.getpid())
+
+    cached = _archive_indexes.get(key)
+    if cached is None or cached[0] != signature:
+        if cached is not None:
+            cached[1].close()
+        zip_ref = zipfile.ZipFile(zipped_file, "r")
+        members = {
+            info.filename: info for info in zip_ref.infolist() if not info.is_dir()
+        }
+        cached = (signature, zip_ref, members)
+        _archive_indexes[key] = cached
+    return cached[1], cached[2]
+
+
+def locate_data_file(
+    extracted_dir: str, zipped_file: str, relative_paths: List[str]
+) -> Tuple[Optional[zipfile.ZipFile], Union[zipfile.ZipInfo, str]]:
+    """Find the first existing file among `relative_paths`.
+
+    Files are looked up in the zip archive when it exists. An already extracted
+    directory is only used when there is no archive.
+
+    Args:
+    - extracted_dir (str): The directory the archive extracts to.
+    - zipped_file (str): The path of the zip archive.
+    - relative_paths (List[str]): Candidate paths relative to `extracted_dir`.
+
+    Returns:
+    - zip_ref (Optional[zipfile.ZipFile]): The open archive, or None for a plain file.
+    - location (Union[zipfile.ZipInfo, str]): The archive member or the file path.
+    """
+    if os.path.exists(zipped_file):
+        zip_ref, members = get_archive_index(zipped_file)
+        archive_dir = os.path.relpath(extracted_dir, paths.DATA_DIR).replace(
+            os.sep, "/"
+        )
+        for relative_path in relative_paths:
+            member_name = f"{archive_dir}/{relative_path}"
+            if member_name in members:
+                return zip_ref, members[member_name]
+        raise FileNotFoundError(
+            f"None of {relative_paths} exist under {archive_dir}/ in {zipped_file}."
+        )
+
+    if not os.path.exists(extracted_dir):
+        raise FileNotFoundError(
+            f"Directory {extracted_dir} and file {zipped_file} do not exist."
+        )
+    for relative_path in relative_paths:
+        file_path = os.path.join(extracted_dir, *relative_path.split("/"))
+        if os.path.exists(file_path):
+            return None, file_path
+    raise FileNotFoundError(f"None of {relative_paths} exist in {extracted_dir}.")
+
+
+def open_data_file(
+    extracted_dir: str, zipped_file: str, relative_paths: List[str]
+) -> Tuple[IO[bytes], str]:
+    """Open the first existing file among `relative_paths` for binary reading,
+    streaming it straight from the zip archive when there is one.
+
+    Args:
+    - extracted_dir (str): The directory the archive extracts to.
+    - zipped_file (str): The path of the zip archive.
+    - relative_paths (List[str]): Candidate paths relative to `extracted_dir`.
+
+    Returns:
+    - file (IO[bytes]): The open file. The caller is responsible for closing it.
+    - name (str): The name of the file that was opened.
+    """
+    zip_ref, location = locate_data_file(extracted_dir, zipped_file, relative_paths)
+    if zip_ref is not None:
+        return zip_ref.open(location), location.filename
+    return open(location, "rb"), location
+
+
+def get_data_file_signature(
+    extracted_dir: str, zipped_file: str, relative_paths: List[str]
+) -> str:
+    """Content signature of the first existing file among `relative_paths`.
+
+    For archive members the CRC-32 and size recorded in the archive are used, so the
+    file doesn't need to be read. Extracted files are hashed.
+
+    Args:
+    - extracted_dir (str): The directory the archive extracts to.
+    - zipped_file (str): The path of the zip archive.
+    - relative_paths (List[str]): Candidate paths relative to `extracted_dir`.
+
+    Returns:
+    - signature (str): The file's content signature.
+    """
+    zip_ref, location = locate_data_file(extracted_dir, zipped_file, relative_paths)
+    if zip_ref is not None:
+        return f"crc32:{location.CRC:08x}:{location.file_size}"
+    with open(location, "rb") as file:
+        return f"sha1:{hashlib.sha1(file.read()).hexdigest()}"
+
+
+def read_data_csv(
+    extracted_dir: str, zipped_file: str, relative_paths: List[str]
+) -> pd.DataFrame:
+    """Read a (possibly gzipped) CSV file from a zip archive or its extracted directory.
+
+    Args:
+    - extracted_dir (str): The directory the archive extracts to.
+    - zipped_file (str): The path of the zip archive.
+    - relative_paths (List[str]): Candidate paths relative to `extracted_dir`.
+
+    Returns:
+    - df (pd.DataFrame): The parsed CSV file.
+    """
+    file, name = open_data_file(extracted_dir, zipped_file, relative_paths)
+    with file:
+        return pd.read_csv(file, compression="gzip" if name.endswith(".gz") else None)
+
+
+def read_data_csv_chunks(
+    extracted_dir: str, zipped_file: str, relative_paths: List[str], chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    """Read a (possibly gzipped) CSV file from a zip archive or its extracted directory
+    in chunks of rows, so the whole file is never held in memory.
+
+    Args:
+    - extracted_dir (str): The directory the archive extracts to.
+    - zipped_file (str): The path of the zip archive.
+    - relative_paths (List[str]): Candidate paths relative to `extracted_dir`.
+    - chunk_rows (int): Maximum number of rows per chunk.
+
+    Returns:
+    - chunks (Iterator[pd.DataFrame]): The parsed chunks, in file order.
+    """
+    file, name = open_data_file(extracted_dir, zipped_file, relative_paths)
+    with file, pd.read_csv(
+        file,
+        compression="gzip" if name.endswith(".gz") else None,
+        chunksize=chunk_rows,
+    ) as reader:
+        yield from reader
+
+
+def _dataset_file_paths(dataset_name: str) -> Tuple[List[str], List[str]]:
+    """Candidate schema and test key paths of a dataset, relative to DATASETS_DIR."""
+    return (
+        [f"{dataset_name}/{dataset_name}_schema.json"],
+        [f"{dataset_name}/{dataset_name}_test_key.csv.gz"],
+    )
+
+
+def _predictions_file_paths(
+    scenario_name: str, dataset_name: str, model_name: str
+) -> List[str]:
+    """Candidate predictions file paths, relative to PREDICTIONS_DIR."""
+    predictions_dir = f"{scenario_name}/{model_name}/{dataset_name}"
+    return [
+        f"{predictions_dir}/predictions.csv.gz",
+        f"{predictions_dir}/predictions.csv",
+    ]
+
+
 def get_dataset_files(dataset_name: str):
     """Read the test_key and schema files for a given dataset.
 
@@ -53,28 +293,64 @@ def get_dataset_files(dataset_name: str):
     - data_schema (Dict): The schema of the dataset.
     - test_key (pd.DataFrame): The test key of the dataset.
     """
+    _, test_key_paths = _dataset_file_paths(dataset_name)
+    data_schema = get_dataset_schema(dataset_name)
+    test_key = read_data_csv(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, test_key_paths
+    )
+    return data_schema, test_key
 
-    if not os.path.exists(paths.DATASETS_DIR):
-        if not os.path.exists(paths.ZIPPED_DATASETS_FILE):
-            raise FileNotFoundError(
-                f"Directory {paths.DATASETS_DIR} and file {paths.ZIPPED_DATASETS_FILE} do not exist."
-            )
-        # unzip the datasets file
-        with zipfile.ZipFile(paths.ZIPPED_DATASETS_FILE, "r") as zip_ref:
-            zip_ref.extractall(paths.DATA_DIR)
 
-    data_schema_path = os.path.join(
-        paths.DATASETS_DIR, dataset_name, f"{dataset_name}_schema.json"
+def get_dataset_schema(dataset_name: str) -> Dict:
+    """Read the schema file of a given dataset.
+
+    Args:
+    - dataset_name (str): The name of the dataset.
+
+    Returns:
+    - data_schema (Dict): The schema of the dataset.
+    """
+    schema_paths, _ = _dataset_file_paths(dataset_name)
+    schema_file, _ = open_data_file(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, schema_paths
     )
-    with open(data_schema_path, "r", encoding="utf-8") as f:
-        data_schema = json.load(f)
+    with schema_file:
+        return json.load(schema_file)
 
-    test_key = pd.read_csv(
-        os.path.join(
-            paths.DATASETS_DIR, dataset_name, f"{dataset_name}_test_key.csv.gz"
-        )
+
+def get_test_key_size(dataset_name: str) -> int:
+    """Size in bytes of the test key file of a given dataset, taken from the archive
+    index (or the file system) without reading the file.
+
+    Args:
+    - dataset_name (str): The name of the dataset.
+
+    Returns:
+    - size (int): The file's size.
+    """
+    _, test_key_paths = _dataset_file_paths(dataset_name)
+    zip_ref, location = locate_data_file(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, test_key_paths
+    )
+    if zip_ref is not None:
+        return location.file_size
+    return os.path.getsize(location)
+
+
+def get_test_key_chunks(dataset_name: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Read the test key of a given dataset in chunks of rows.
+
+    Args:
+    - dataset_name (str): The name of the dataset.
+    - chunk_rows (int): Maximum number of rows per chunk.
+
+    Returns:
+    - chunks (Iterator[pd.DataFrame]): The test key's chunks, in file order.
+    """
+    _, test_key_paths = _dataset_file_paths(dataset_name)
+    return read_data_csv_chunks(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, test_key_paths, chunk_rows
     )
-    return data_schema, test_key
 
 
 def get_predictions(
@@ -90,35 +366,73 @@ def get_predictions(
     Returns:
     - predictions (pd.DataFrame): The predictions of the dataset.
     """
+    predictions = read_data_csv(
+        paths.PREDICTIONS_DIR,
+        paths.ZIPPED_PREDICTIONS_FILE,
+        _predictions_file_paths(scenario_name, dataset_name, model_name),
+    )
+    return predictions
+
+
+def get_predictions_chunks(
+    scenario_name: str, dataset_name: str, model_name: str, chunk_rows: int
+) -> Iterator[pd.DataFrame]:
+    """Read the predictions for a given dataset and model in chunks of rows.
 
-    if not os.path.exists(paths.PREDICTIONS_DIR):
-        if not os.path.exists(paths.ZIPPED_PREDICTIONS_FILE):
-            raise FileNotFoundError(
-                f"Directory {paths.PREDICTIONS_DIR} and file {paths.ZIPPED_PREDICTIONS_FILE} do not exist."
-            )
-        # unzip the predictions file
-        with zipfile.ZipFile(paths.ZIPPED_PREDICTIONS_FILE, "r") as zip_ref:
-            zip_ref.extractall(paths.DATA_DIR)
+    Args:
+    - scenario_name (str): The name of the scenario.
+    - dataset_name (str): The name of the dataset.
+    - model_name (str): The name of the model.
+    - chunk_rows (int): Maximum number of rows per chunk.
 
-    compressed_path = os.path.join(
+    Returns:
+    - chunks (Iterator[pd.DataFrame]): The predictions' chunks, in file order.
+    """
+    return read_data_csv_chunks(
         paths.PREDICTIONS_DIR,
-        scenario_name,
-        model_name,
-        dataset_name,
-        "predictions.csv.gz",
+        paths.ZIPPED_PREDICTIONS_FILE,
+        _predictions_file_paths(scenario_name, dataset_name, model_name),
+        chunk_rows,
     )
 
-    path = os.path.join(
-        paths.PREDICTIONS_DIR,
-        scenario_name,
-        model_name,
-        dataset_name,
-        "predictions.csv",
+
+def get_dataset_signature(dataset_name: str) -> str:
+    """Content signature of a dataset's schema and test key files.
+
+    Args:
+    - dataset_name (str): The name of the dataset.
+
+    Returns:
+    - signature (str): The combined signature of both files.
+    """
+    schema_paths, test_key_paths = _dataset_file_paths(dataset_name)
+    schema_signature = get_data_file_signature(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, schema_paths
     )
-    predictions = pd.read_csv(
-        compressed_path if os.path.exists(compressed_path) else path
+    test_key_signature = get_data_file_signature(
+        paths.DATASETS_DIR, paths.ZIPPED_DATASETS_FILE, test_key_paths
+    )
+    return f"schema={schema_signature};test_key={test_key_signature}"
+
+
+def get_predictions_signature(
+    scenario_name: str, dataset_name: str, model_name: str
+) -> str:
+    """Content signature of the predictions file for a given dataset and model.
+
+    Args:
+    - scenario_name (str): The name of the scenario.
+    - dataset_name (str): The name of the dataset.
+    - model_name (str): The name of the model.
+
+    Returns:
+    - signature (str): The predictions file's content signature.
+    """
+    return get_data_file_signature(
+        paths.PREDICTIONS_DIR,
+        paths.ZIPPED_PREDICTIONS_FILE,
+        _predictions_file_paths(scenario_name, dataset_name, model_name),
     )
-    return predictions
 
 
 def prepare_data_for_visualization(metrics: pd.DataFrame) -> pd.DataFrame:
@@ -137,6 +451,7 @@ def prepare_data_for_visualization(metrics: pd.DataFrame) -> pd.DataFrame:
         index=["Model", "Dataset_Fold", "Metric"],
         columns="Scenario",
         values="Value",
+        observed=True,
     ).reset_index()
 
     return metrics
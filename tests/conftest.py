@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are scripts run from src/, which import each other by name
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), "src"))
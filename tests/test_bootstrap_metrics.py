@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from bootstrap_metrics import compute_resampled_metrics, draw_resample_counts
+from metrics import compute_binary_metrics_batch
+from test_metrics import random_experiments
+
+# metrics outside [0, 1]: their range
+RANGES = {"MCC": (-1, 1), "Cohen's Kappa": (-1, 1), "Log-Loss": (0, np.inf)}
+
+
+def test_unit_resample_counts_give_the_metrics():
+    y_true, y_pred, y_pred_proba = random_experiments(0)
+    resampled = compute_resampled_metrics(
+        y_true, y_pred, y_pred_proba, np.ones((1, y_true.size))
+    )
+    expected = compute_binary_metrics_batch(y_true, y_pred, y_pred_proba)
+    for name, values in expected.items():
+        assert resampled[name][:, 0] == pytest.approx(values, abs=1e-12), name
+
+
+def test_resample_counts_draw_every_row_count_once():
+    counts = draw_resample_counts(50, 20, np.random.default_rng(0))
+    assert counts.shape == (20, 50)
+    assert (counts.sum(axis=1) == 50).all()
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_percentile_intervals_are_ordered_and_in_range(seed):
+    y_true, y_pred, y_pred_proba = random_experiments(seed, num_rows=60)
+    counts = draw_resample_counts(y_true.size, 200, np.random.default_rng(seed))
+    resampled = compute_resampled_metrics(y_true, y_pred, y_pred_proba, counts)
+    for name, values in resampled.items():
+        low, high = RANGES.get(name, (0, 1))
+        lower, upper = np.nanpercentile(values, [2.5, 97.5], axis=1)
+        assert (lower <= upper).all(), name
+        assert (lower >= low - 1e-12).all() and (upper <= high + 1e-12).all(), name
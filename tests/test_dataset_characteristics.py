@@ -0,0 +1,18 @@
+import pandas as pd
+
+from config.variables import imbalance_level_labels
+from dataset_characteristics import get_imbalance_levels
+
+
+def test_imbalance_levels_include_the_lowest_edge():
+    characteristics = pd.DataFrame(
+        {
+            "Dataset": ["balanced", "balanced", "edge", "high", "unknown"],
+            "Imbalance Ratio": [1.0, 1.0, 10.0, 25.0, float("nan")],
+        }
+    )
+    assert get_imbalance_levels(characteristics) == {
+        "balanced": imbalance_level_labels[0],
+        "edge": imbalance_level_labels[0],
+        "high": imbalance_level_labels[2],
+    }
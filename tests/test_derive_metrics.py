@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from derive_metrics import derive_ranking_metrics
+from metrics import RANKING, compute_binary_metrics_batch, get_metric_names
+from statistics_store import compute_experiment_statistics
+from test_metrics import random_experiments
+
+
+@pytest.mark.parametrize("bins", [10, 100, 1000])
+@pytest.mark.parametrize("seed", range(3))
+def test_derived_ranking_metrics_are_within_their_bounds(bins, seed):
+    y_true, y_pred, y_pred_proba = random_experiments(seed)
+    # unrounded scores, so that rows of different scores share a bin
+    y_pred_proba = np.clip(
+        y_pred_proba + np.random.default_rng(seed).normal(0, 0.01, y_pred_proba.shape),
+        0,
+        1,
+    )
+    statistics = compute_experiment_statistics(y_true, y_pred, y_pred_proba, bins)
+    names = get_metric_names(RANKING)
+    derived = derive_ranking_metrics(statistics["score_histograms"], names)
+    exact = compute_binary_metrics_batch(y_true, y_pred, y_pred_proba, names)
+    for name in names:
+        approximation, lower, upper = derived[name]
+        assert (lower <= approximation + 1e-12).all(), name
+        assert (approximation <= upper + 1e-12).all(), name
+        assert (lower <= exact[name] + 1e-12).all(), name
+        assert (exact[name] <= upper + 1e-12).all(), name
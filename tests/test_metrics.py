@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn import metrics as sk
+
+from metrics import (
+    CALIBRATION_BINS,
+    check_summary_metrics,
+    compute_binary_metrics,
+    compute_binary_metrics_batch,
+    get_observed_classes,
+    probability_bins,
+    predict_positive_class,
+)
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "src")
+
+
+def sklearn_metrics(y_true: np.ndarray, y_pred: np.ndarray, y_pred_proba: np.ndarray):
+    """The metrics computed one by one with sklearn, as the baseline engine did."""
+    tn, fp, fn, tp = sk.confusion_matrix(y_true, y_pred, labels=[0, 1]).ravel()
+    precision_curve, recall_curve, _ = sk.precision_recall_curve(y_true, y_pred_proba)
+    return {
+        "Accuracy": sk.accuracy_score(y_true, y_pred),
+        "Precision": sk.precision_score(y_true, y_pred, zero_division=0),
+        "Recall": sk.recall_score(y_true, y_pred, zero_division=0),
+        "F1-score": sk.f1_score(y_true, y_pred, zero_division=0),
+        "F2-score": sk.fbeta_score(y_true, y_pred, beta=2, zero_division=0),
+        "AUC": sk.roc_auc_score(y_true, y_pred_proba),
+        "PR-AUC": sk.auc(recall_curve, precision_curve),
+        "Log-Loss": sk.log_loss(y_true, y_pred_proba, labels=[0, 1]),
+        "Brier-Score": sk.brier_score_loss(y_true, y_pred_proba),
+        "MCC": sk.matthews_corrcoef(y_true, y_pred),
+        "Balanced Accuracy": sk.balanced_accuracy_score(y_true, y_pred),
+        "G-Mean": np.sqrt(tp / (tp + fn) * tn / (tn + fp)),
+        "Cohen's Kappa": sk.cohen_kappa_score(y_true, y_pred),
+        "Average Precision": sk.average_precision_score(y_true, y_pred_proba),
+    }
+
+
+def random_experiments(seed: int, num_experiments: int = 4, num_rows: int = 300):
+    """Labels and predictions of several experiments, with tied scores."""
+    rng = np.random.default_rng(seed)
+    y_true = (rng.random(num_rows) < 0.2).astype(np.int8)
+    # rounded scores, so that the curves have ties within and across the classes
+    y_pred_proba = np.round(
+        np.clip(rng.normal(0.3 + 0.3 * y_true, 0.2, (num_experiments, num_rows)), 0, 1),
+        2,
+    )
+    y_pred = (y_pred_proba >= 0.5).astype(np.int8)
+    return y_true, y_pred, y_pred_proba
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fused_kernel_matches_sklearn(seed):
+    y_true, y_pred, y_pred_proba = random_experiments(seed)
+    batch = compute_binary_metrics_batch(y_true, y_pred, y_pred_proba)
+    for i in range(len(y_pred)):
+        expected = sklearn_metrics(y_true, y_pred[i], y_pred_proba[i])
+        for name, value in expected.items():
+            assert batch[name][i] == pytest.approx(value, abs=1e-12), name
+
+
+def test_single_experiment_matches_batch():
+    y_true, y_pred, y_pred_proba = random_experiments(0)
+    batch = compute_binary_metrics_batch(y_true, y_pred, y_pred_proba)
+    single = compute_binary_metrics(y_true, y_pred[1], y_pred_proba[1])
+    assert single == {name: values[1] for name, values in batch.items()}
+
+
+def test_single_class_predictions_have_zero_division_defaults():
+    y_true = np.array([0, 1, 0, 1, 0])
+    y_pred_proba = np.array([0.1, 0.4, 0.2, 0.3, 0.0])
+    metric_values = compute_binary_metrics(y_true, np.zeros(5), y_pred_proba)
+    expected = sklearn_metrics(y_true, np.zeros(5), y_pred_proba)
+    for name in ["Precision", "Recall", "F1-score", "F2-score", "MCC"]:
+        assert metric_values[name] == pytest.approx(expected[name], abs=1e-12)
+
+
+@pytest.mark.parametrize("bins", [CALIBRATION_BINS, 100, 1000])
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_probability_bins_put_edges_in_their_own_bin(bins, dtype):
+    # i / bins is an edge; computed in floating point it can fall just below it
+    edges = (np.arange(bins + 1) / bins).astype(dtype)
+    expected = np.minimum(np.arange(bins + 1), bins - 1)
+    assert (probability_bins(edges, bins) == expected).all()
+
+
+def test_ties_go_to_the_positive_class():
+    predictions = pd.DataFrame({"no": [0.5, 0.7, 0.2], "yes": [0.5, 0.3, 0.8]})
+    predicted = predict_positive_class(predictions, ["no", "yes"], ["no", "yes"])
+    assert predicted.tolist() == [True, False, True]
+
+
+def test_observed_classes_follow_the_schema_order():
+    assert get_observed_classes([0, 1], ["1", "0", "1"]) == ["0", "1"]
+    assert get_observed_classes(["no", "yes"], ["yes"]) == ["yes"]
+
+
+@pytest.mark.parametrize(
+    "summary_metrics",
+    [
+        [{"name": "Specificity", "min_max": "max"}],
+        [{"name": "AUC", "min_max": "max"}, {"name": "AUC", "min_max": "max"}],
+        [{"name": "Log-Loss", "min_max": "max"}],
+    ],
+)
+def test_summary_metrics_must_match_the_registry(summary_metrics):
+    # the configured list itself is checked when metrics.py is imported
+    with pytest.raises(ValueError):
+        check_summary_metrics(summary_metrics)
+
+
+TIE_SCRIPT = """
+import pandas as pd
+from metrics import get_observed_classes, predict_positive_class
+
+classes = ["negative", "positive"]
+predictions = pd.DataFrame({"negative": [0.5] * 4, "positive": [0.5] * 4})
+observed = get_observed_classes(classes, {"positive", "negative"})
+print(observed, predict_positive_class(predictions, classes, observed).tolist())
+"""
+
+
+def test_tie_breaking_does_not_depend_on_the_hash_seed():
+    outputs = set()
+    for seed in range(4):
+        result = subprocess.run(
+            [sys.executable, "-c", TIE_SCRIPT],
+            cwd=SRC_DIR,
+            env={**os.environ, "PYTHONHASHSEED": str(seed)},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        outputs.add(result.stdout)
+    assert outputs == {"['negative', 'positive'] [True, True, True, True]\n"}
@@ -0,0 +1,21 @@
+import pytest
+
+from config.variables import dataset_folds, models_mapping, scenarios_mapping
+from predictions_store import (
+    STORE_PARITY_TOLERANCE,
+    compare_fold_metrics,
+    load_predictions_store,
+)
+
+
+@pytest.mark.skipif(
+    load_predictions_store() is None,
+    reason="no up-to-date predictions store; run 'python predictions_store.py'",
+)
+def test_store_metrics_match_the_prediction_files():
+    experiments = [
+        (scenario, model) for scenario in scenarios_mapping for model in models_mapping
+    ]
+    differences = compare_fold_metrics(dataset_folds[0], experiments)
+    assert len(differences) == len(experiments)
+    assert differences.iloc[:, 3:].max().max() <= STORE_PARITY_TOLERANCE
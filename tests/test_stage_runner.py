@@ -0,0 +1,68 @@
+import os
+
+import profiling
+from stage_runner import Stage, run_stages
+from utils import run_tasks
+
+
+def square(value: int) -> int:
+    return value * value
+
+
+def run_squares(artifacts):
+    run_tasks(square, [(1,), (2,), (3,)])
+
+
+def test_worker_stages_keep_their_task_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "_enabled", True)
+    monkeypatch.setattr(profiling, "_stage_records", [])
+    monkeypatch.setattr(profiling, "_task_records", [])
+    first_output = os.path.join(tmp_path, "first.csv")
+    # 'first' runs alone in this process, then 'second' and 'third' run in worker
+    # processes forked after it
+    stages = [
+        Stage(
+            name=name,
+            function=run_squares,
+            inputs=[] if name == "first" else [first_output],
+            outputs=[os.path.join(tmp_path, f"{name}.csv")],
+            modules=[],
+        )
+        for name in ["first", "second", "third"]
+    ]
+
+    outcomes = run_stages(stages, os.path.join(tmp_path, "state.json"), jobs=2)
+
+    assert outcomes == {"first": "ran", "second": "ran", "third": "ran"}
+    assert sorted(record["stage"] for record in profiling._stage_records) == [
+        "first",
+        "second",
+        "third",
+    ]
+    assert len(profiling._task_records) == 9
+    assert {record["task"] for record in profiling._task_records} == {"square"}
+
+
+def test_exclusive_stage_runs_alone_in_this_process(tmp_path):
+    pids = []
+
+    def record_pid(artifacts):
+        # a closure can't be sent to a worker process, so it must run here
+        pids.append(os.getpid())
+
+    stages = [
+        Stage(
+            name=name,
+            function=function,
+            inputs=[],
+            outputs=[os.path.join(tmp_path, f"{name}.csv")],
+            modules=[],
+            exclusive=name == "exclusive",
+        )
+        for name, function in [("other", run_squares), ("exclusive", record_pid)]
+    ]
+
+    outcomes = run_stages(stages, os.path.join(tmp_path, "state.json"), jobs=2)
+
+    assert outcomes == {"other": "ran", "exclusive": "ran"}
+    assert pids == [os.getpid()]
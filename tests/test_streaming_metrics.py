@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import metrics
+from logging_config import ContextFilter
+from metrics import score_stacked_predictions, stack_fold_predictions
+from streaming_metrics import StreamingTestKey, stream_experiment_predictions
+
+DATA_SCHEMA = {
+    "id": {"name": "id"},
+    "target": {"name": "target", "classes": ["no", "yes"]},
+}
+
+
+def fold_files(seed: int, num_rows: int = 500):
+    """A test key and one experiment's predictions, with shuffled ids and tied scores."""
+    rng = np.random.default_rng(seed)
+    ids = rng.permutation(num_rows) * 7
+    target = np.where(rng.random(num_rows) < 0.2, "yes", "no")
+    test_key = pd.DataFrame({"id": ids, "target": target})
+    positive = np.round(rng.random(num_rows), 2)
+    predictions = pd.DataFrame({"id": ids, "no": 1 - positive, "yes": positive})
+    return test_key, predictions.sample(frac=1, random_state=seed)
+
+
+def chunks(frame: pd.DataFrame, chunk_rows: int):
+    return (
+        frame.iloc[i : i + chunk_rows].copy() for i in range(0, len(frame), chunk_rows)
+    )
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_streaming_matches_the_in_memory_engine(seed):
+    test_key, predictions = fold_files(seed)
+    context_filter = ContextFilter(dataset="d", scenario="s", model="m")
+    # imported through the module, so that pytest doesn't take it for a test class
+    index = metrics.TestKeyIndex(DATA_SCHEMA, test_key)
+    y_pred, y_pred_proba = stack_fold_predictions(
+        DATA_SCHEMA, index, [predictions.copy()], [context_filter]
+    )
+    expected = score_stacked_predictions(index.labels, y_pred, y_pred_proba)
+
+    streaming_key = StreamingTestKey(DATA_SCHEMA, chunks(test_key, 64))
+    streamed_pred, streamed_proba = stream_experiment_predictions(
+        DATA_SCHEMA, streaming_key, chunks(predictions, 37), context_filter
+    )
+    streamed = score_stacked_predictions(
+        streaming_key.labels, streamed_pred[np.newaxis], streamed_proba[np.newaxis]
+    )
+
+    assert streamed == expected
+
+
+def test_streaming_rejects_duplicate_prediction_ids():
+    test_key, predictions = fold_files(0)
+    predictions = pd.concat([predictions.iloc[1:], predictions.iloc[:2]])
+    streaming_key = StreamingTestKey(DATA_SCHEMA, chunks(test_key, 64))
+    with pytest.raises(ValueError):
+        stream_experiment_predictions(
+            DATA_SCHEMA,
+            streaming_key,
+            chunks(predictions, 37),
+            ContextFilter(dataset="d", scenario="s", model="m"),
+        )